@@ -25,21 +25,29 @@ def conversion(output_type, *mime_types):
     return _conversion
 
 
-def convert(resource, output_type, mime_override=None):
-    """Tries to convert a Resource to the specified OutputType by using the
-    database of registered conversion functions.
+def get_converter(output_type, mime_type):
+    """Returns the registered conversion function that converts the specified
+    MIME type to the specified OutputType.
 
     Raises a KeyError if no conversion exists."""
-    mime_type = resource.compute_type() if not mime_override else mime_override
     try:
-        converter = __converters[(output_type, mime_type)]
+        return __converters[(output_type, mime_type)]
     except KeyError as e:
         try:
-            converter = __converters[(output_type, None)]
+            return __converters[(output_type, None)]
         except KeyError:
             # Raise the original, more specific, exception
             raise KeyError("No converters registered for "
                            "{0}".format(e)) from e
+
+
+def convert(resource, output_type, mime_override=None):
+    """Tries to convert a Resource to the specified OutputType by using the
+    database of registered conversion functions.
+
+    Raises a KeyError if no conversion exists."""
+    mime_type = resource.compute_type() if not mime_override else mime_override
+    converter = get_converter(output_type, mime_type)
     value = converter(resource)
     if value is not None and not hasattr(value, 'parent'):
         value = make_navigable(value)
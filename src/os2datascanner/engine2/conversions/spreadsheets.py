@@ -1,3 +1,5 @@
+from io import StringIO
+
 from .types import OutputType
 from .registry import conversion
 from ..model.core import Resource
@@ -7,12 +9,16 @@ SHEET_TYPE = "application/x.os2datascanner.spreadsheet"
 
 
 @conversion(OutputType.Text, SHEET_TYPE)
-def pandas_dataframe_processor(r: Resource, **kwargs):
+def spreadsheet_processor(r: Resource, **kwargs):
     """
-    Converts Sheets from Excel-like files to text using efficient pandas.Dataframes.
+    Converts Sheets from Excel-like files to text, one line for each row and
+    with the cells of each row separated by tabs. Sheets are read a row at a
+    time, so only the resulting text is ever held in memory.
     """
     sheet_name = r.handle.relative_path
-    df = r._sm.open(r.handle.source).parse(sheet_name=sheet_name)
-    text = df.columns.astype('string').str.cat(sep='\t') + '\n'
-    return text + "\n".join(
-        row.astype('string').str.cat(sep='\t') for _, row in df.iterrows())
+    workbook = r._sm.open(r.handle.source)
+    with StringIO() as out:
+        for cells in workbook.iter_rows(sheet_name):
+            out.write("\t".join(cells))
+            out.write("\n")
+        return out.getvalue()
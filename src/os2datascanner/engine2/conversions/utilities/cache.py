@@ -1,17 +1,26 @@
+import os
 import gzip
 import json
+import time
+import sqlite3
+import hashlib
+import threading
 from typing import Optional
 import logging
 from pathlib import Path
 from datetime import datetime
 from functools import cached_property
+from contextlib import ExitStack, contextmanager
+from collections import OrderedDict
+from prometheus_client import Counter
 
 import os2datascanner.engine2.settings as settings
-from ...model.core import Resource
+from ...model.core import Resource, FileResource
+from ...model.utilities import NamedTemporaryResource
 from ...utilities.datetime import make_datetime_aware
 from ...utilities.cryptography import make_secret_box
 from ..types import OutputType
-from ..registry import convert
+from ..registry import convert, get_converter
 
 
 logger = logging.getLogger(__name__)
@@ -22,6 +31,235 @@ def lastmod(p: Path) -> Optional[datetime]:
             datetime.fromtimestamp(p.stat().st_mtime), local=True)
 
 
+class CacheIndex:
+    """A CacheIndex is a small SQLite database, stored in the root of a cache
+    directory, that keeps track of the size, age and use of every cached
+    representation in that directory.
+
+    Lookups consult the index instead of the filesystem. When the total size
+    of the cached representations exceeds a configured budget, the least
+    recently used (or, optionally, least frequently used) ones are deleted;
+    this can be done periodically by a background thread.
+
+    When an index is first created in a directory that already contains
+    cached representations, they're added to it, with the modification times
+    of their files standing in for those of their Resources (just as they did
+    before there was an index), so that they can be used and pruned too."""
+    FILENAME = "index.sqlite3"
+    # The longest time to wait for another process to release the database
+    # (in seconds)
+    TIMEOUT = 5.0
+    # The number of uses to collect before writing them to the database
+    TOUCH_BATCH = 64
+    POLICIES = {
+        "lru": "accessed",
+        "lfu": "hits, accessed",
+    }
+
+    def __init__(self, root: Path, budget: int = 0, policy: str = "lru"):
+        if policy not in self.POLICIES:
+            raise ValueError(f"unknown eviction policy {policy!r}")
+        self._root = root
+        self._budget = budget
+        self._order = self.POLICIES[policy]
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        # The cache files that have been used since the index was last
+        # updated, and when
+        self._touched = {}
+
+        root.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(
+                root / self.FILENAME, timeout=self.TIMEOUT,
+                check_same_thread=False, isolation_level=None)
+        # Several processes can share a cache directory; write-ahead logging
+        # lets them read the index while one of them is writing to it
+        self._db.execute("PRAGMA journal_mode=WAL")
+        is_new = not self._db.execute(
+                "SELECT 1 FROM sqlite_master"
+                " WHERE type = 'table' AND name = 'entries'").fetchone()
+        self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " path TEXT PRIMARY KEY,"
+                " size INTEGER NOT NULL,"
+                " accessed REAL NOT NULL,"
+                " hits INTEGER NOT NULL DEFAULT 0,"
+                " resource_lm REAL NOT NULL)")
+        if is_new:
+            self._adopt_existing()
+
+    def _adopt_existing(self):
+        """Adds every cache file already in the cache directory to the index.
+        (If another process is doing the same thing at the same time, the
+        results will be the same.)"""
+        rows = []
+        for dirpath, _, filenames in os.walk(self._root):
+            for name in filenames:
+                path = Path(dirpath) / name
+                if path.parent == self._root:
+                    # The index itself (and any other stray files) live in the
+                    # root; cache files are always in a Resource's folder
+                    continue
+                try:
+                    st = path.stat()
+                except FileNotFoundError:
+                    continue
+                rows.append(
+                        (self._key(path), st.st_size, st.st_atime,
+                         st.st_mtime))
+        if rows:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.executemany(
+                        "INSERT OR IGNORE INTO entries"
+                        " (path, size, accessed, resource_lm)"
+                        " VALUES (?, ?, ?, ?)", rows)
+            logger.info(
+                    f"added {len(rows)} existing files to the cache index")
+
+    def _key(self, path: Path) -> str:
+        return str(path.relative_to(self._root))
+
+    def lookup(self, path: Path) -> Optional[float]:
+        """Returns the (POSIX) timestamp of the last modification of the
+        Resource that the given cache file was created from, or None if the
+        index doesn't know about that file (or can't be read right now)."""
+        try:
+            with self._lock:
+                row = self._db.execute(
+                        "SELECT resource_lm FROM entries WHERE path = ?",
+                        (self._key(path),)).fetchone()
+        except sqlite3.OperationalError:
+            logger.warning("couldn't read the cache index", exc_info=True)
+            return None
+        return row[0] if row else None
+
+    def touch(self, path: Path):
+        """Marks a cache file as having been used. (Uses are written to the
+        index in batches.)"""
+        with self._lock:
+            self._touched[self._key(path)] = time.time()
+            if len(self._touched) >= self.TOUCH_BATCH:
+                self._write_touched()
+
+    def _write_touched(self):
+        touched, self._touched = self._touched, {}
+        try:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.executemany(
+                        "UPDATE entries SET accessed = ?, hits = hits + 1"
+                        " WHERE path = ?",
+                        [(when, key) for key, when in touched.items()])
+        except sqlite3.OperationalError:
+            logger.warning(
+                    "couldn't update the cache index", exc_info=True)
+
+    def record(self, path: Path, size: int, resource_lm: float):
+        """Adds (or replaces) a cache file in the index."""
+        try:
+            with self._lock:
+                self._db.execute(
+                        "INSERT OR REPLACE INTO entries"
+                        " (path, size, accessed, resource_lm)"
+                        " VALUES (?, ?, ?, ?)",
+                        (self._key(path), size, time.time(), resource_lm))
+        except sqlite3.OperationalError:
+            # The cache file will just be unknown to the index (and so won't
+            # be used)
+            logger.warning("couldn't update the cache index", exc_info=True)
+
+    def forget(self, path: Path):
+        """Removes a cache file from the index."""
+        try:
+            with self._lock:
+                self._db.execute(
+                        "DELETE FROM entries WHERE path = ?",
+                        (self._key(path),))
+        except sqlite3.OperationalError:
+            logger.warning("couldn't update the cache index", exc_info=True)
+
+    @property
+    def total_size(self) -> int:
+        with self._lock:
+            return self._db.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def prune(self) -> int:
+        """Deletes cache files, in eviction order, until the total size of
+        the cache is within budget. Returns the number of bytes freed."""
+        if not self._budget:
+            return 0
+        freed = 0
+        with self._lock:
+            if self._touched:
+                self._write_touched()
+            excess = self._db.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM entries"
+                    ).fetchone()[0] - self._budget
+            victims = self._db.execute(
+                    f"SELECT path, size FROM entries ORDER BY {self._order}")
+            for key, size in victims.fetchall():
+                if freed >= excess:
+                    break
+                path = self._root / key
+                path.unlink(missing_ok=True)
+                try:
+                    # Also clean up the Resource's folder if this was the
+                    # last cached representation in it
+                    path.parent.rmdir()
+                except OSError:
+                    pass
+                self._db.execute("DELETE FROM entries WHERE path = ?", (key,))
+                freed += size
+        if freed:
+            logger.info(f"pruned {freed} bytes from the conversion cache")
+        return freed
+
+    def start_pruning(self, interval: float):
+        """Starts a daemon thread that calls prune every interval seconds."""
+        if self._thread or not self._budget:
+            return
+
+        def _prune_loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.prune()
+                except Exception:
+                    logger.exception("couldn't prune the conversion cache")
+        self._thread = threading.Thread(
+                target=_prune_loop, name="CacheIndex.prune", daemon=True)
+        self._thread.start()
+
+    def stop_pruning(self):
+        """Stops the pruning thread, if it's running."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self._stop.clear()
+        with self._lock:
+            if self._touched:
+                self._write_touched()
+
+
+_indices: dict[str, CacheIndex] = {}
+
+
+def get_cache_index(directory: str) -> CacheIndex:
+    """Returns the shared CacheIndex for the given cache directory, creating
+    it (and starting its pruning thread) if necessary."""
+    if directory not in _indices:
+        cache_settings = settings.conversions["cache"]
+        index = _indices[directory] = CacheIndex(
+                Path(directory),
+                cache_settings["budget"], cache_settings["eviction"])
+        index.start_pruning(cache_settings["prune_interval"])
+    return _indices[directory]
+
+
 class CacheManager:
     """A CacheManager maintains a disk cache of representations for a given
     Resource.
@@ -70,6 +308,11 @@ class CacheManager:
         else:
             return None
 
+    @cached_property
+    def index(self) -> Optional[CacheIndex]:
+        cd_s = settings.conversions["cache"]["directory"]
+        return get_cache_index(cd_s) if cd_s else None
+
     @cached_property
     def _box(self):
         return make_secret_box(self.crunched)
@@ -89,8 +332,13 @@ class CacheManager:
         @property
         def cache_exists(self) -> bool:
             cf = self.path
+            if not cf:
+                return False
+            recorded_lm = self._parent.index.lookup(cf)
+            if recorded_lm is None:
+                return False
             lm = make_datetime_aware(self._parent._get_resource_lm())
-            return cf and cf.exists() and (not lm or lastmod(cf) >= lm)
+            return not lm or recorded_lm >= lm.timestamp()
 
         def create(self, mime_override: str = None):
             """Returns a representation corresponding to the output type of
@@ -102,6 +350,11 @@ class CacheManager:
             output_type = self._output_type
             cf = self.path
 
+            # The representation is only as fresh as the Resource was when we
+            # started converting it
+            lm = make_datetime_aware(self._parent._get_resource_lm())
+            created = lm.timestamp() if lm else time.time()
+
             representation = convert(
                     self._parent._resource, output_type, mime_override)
             if cf:
@@ -111,8 +364,10 @@ class CacheManager:
                 raw_json = json.dumps(
                         output_type.encode_json_object(representation))
                 compressed = gzip.compress(raw_json.encode())
+                encrypted = self._parent._box.encrypt(compressed)
                 with cf.open("wb") as fp:
-                    fp.write(self._parent._box.encrypt(compressed))
+                    fp.write(encrypted)
+                self._parent.index.record(cf, len(encrypted), created)
             return representation
 
         def get(self, *, create=False, mime_override: str = None):
@@ -133,16 +388,199 @@ class CacheManager:
                 logger.debug(
                         f"returning cache for {self._parent.handle}, type"
                         f" {output_type.value!r}")
-                with cf.open("rb") as fp:
-                    unencrypted = self._parent._box.decrypt(fp.read())
-                    decompressed = gzip.decompress(unencrypted)
-                    raw_json = json.loads(decompressed.decode())
-                    return output_type.decode_json_object(raw_json)
+                try:
+                    with cf.open("rb") as fp:
+                        encrypted = fp.read()
+                except FileNotFoundError:
+                    # Someone else has deleted this file behind the index's
+                    # back
+                    self._parent.index.forget(cf)
+                    return self.create(mime_override) if create else None
+                self._parent.index.touch(cf)
+                unencrypted = self._parent._box.decrypt(encrypted)
+                decompressed = gzip.decompress(unencrypted)
+                raw_json = json.loads(decompressed.decode())
+                return output_type.decode_json_object(raw_json)
 
     def representation(self, output_type: OutputType):
         return self.Representation(self, output_type)
 
 
+content_cache_hits = Counter(
+        "os2datascanner_content_cache_hits",
+        "Representations retrieved from the content cache")
+content_cache_misses = Counter(
+        "os2datascanner_content_cache_misses",
+        "Representations not found in the content cache")
+
+
+_DIGEST_CHUNK_SIZE = 1024 * 1024
+
+
+class _HashingReader:
+    """A _HashingReader wraps a readable stream, computing a digest of
+    everything that's read through it."""
+    def __init__(self, fp):
+        self._fp = fp
+        self._digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        buf = self._fp.read(size)
+        self._digest.update(buf)
+        return buf
+
+    def hexdigest(self) -> str:
+        return self._digest.hexdigest()
+
+
+class _LocalCopy:
+    """A _LocalCopy stands in for a FileResource whose content has already
+    been retrieved to a local file, so that converting it doesn't retrieve it
+    again. (Everything else is delegated to the original FileResource.)"""
+    def __init__(self, resource: FileResource, path: str, mime_type: str):
+        self._resource = resource
+        self._path = path
+        self._mime_type = mime_type
+
+    def __getattr__(self, name):
+        return getattr(self._resource, name)
+
+    def compute_type(self):
+        return self._mime_type
+
+    @contextmanager
+    def make_path(self):
+        yield self._path
+
+    @contextmanager
+    def make_stream(self):
+        with open(self._path, "rb") as fp:
+            yield fp
+
+
+@contextmanager
+def _local_copy(resource: FileResource, mime_type: str):
+    """Returns a context manager that, when entered, retrieves the content of
+    a FileResource to a local file (if it isn't already one) and returns a
+    (digest, _LocalCopy) pair. The digest is computed as the content is
+    read."""
+    if type(resource).make_path is FileResource.make_path:
+        # This FileResource can only produce a stream; copy it to disk,
+        # hashing it on the way
+        with NamedTemporaryResource(resource.handle.name) as ntr:
+            with ntr.open("wb") as out, resource.make_stream() as fp:
+                reader = _HashingReader(fp)
+                while (buf := reader.read(_DIGEST_CHUNK_SIZE)):
+                    out.write(buf)
+            yield reader.hexdigest(), _LocalCopy(
+                    resource, ntr.get_path(), mime_type)
+    else:
+        with resource.make_path() as path:
+            with open(path, "rb") as fp:
+                reader = _HashingReader(fp)
+                while reader.read(_DIGEST_CHUNK_SIZE):
+                    pass
+            yield reader.hexdigest(), _LocalCopy(resource, path, mime_type)
+
+
+class ContentCache:
+    """A ContentCache is an in-memory cache of text representations keyed by a
+    digest of the content they were computed from, letting identical objects
+    found through different Handles share a single conversion.
+
+    The total length of the cached representations is bounded; when a new
+    representation would exceed that bound, the least recently used ones are
+    evicted to make room for it. Objects bigger than max_object_size bytes (if
+    that's nonzero) are converted without consulting the cache, as copying and
+    hashing them just to compute a key would cost more than it could save.
+
+    ContentCaches are thread safe."""
+    OUTPUT_TYPES = (OutputType.Text, OutputType.MRZ,)
+
+    def __init__(self, max_size: int, max_object_size: int = 0):
+        self._max_size = max_size
+        self._max_object_size = max_object_size
+        self._lock = threading.Lock()
+        self._size = 0
+        self._entries = OrderedDict()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def get(self, key):
+        """Returns the cached representation with the given key, or None if
+        there isn't one."""
+        with self._lock:
+            if (value := self._entries.get(key)) is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value: str):
+        """Stores a representation in this cache, evicting other
+        representations if necessary. (Representations too large to fit in
+        the cache at all are not stored.)"""
+        if value is None or (size := len(value)) > self._max_size:
+            return
+        with self._lock:
+            if (old := self._entries.pop(key, None)) is not None:
+                self._size -= len(old)
+            while self._entries and self._size + size > self._max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+            self._entries[key] = value
+            self._size += size
+
+    def _is_too_big(self, resource: FileResource) -> bool:
+        if not self._max_object_size:
+            return False
+        try:
+            return int(resource.get_size()) > self._max_object_size
+        except (TypeError, ValueError):
+            # We don't know how big this object is, so give it a chance
+            return False
+
+    def convert(self, resource: Resource, output_type: OutputType):
+        """As conversions.convert, but, for the output types supported by
+        this cache, retrieves (or stores) the representation by the content of
+        the Resource."""
+        if (not self._max_size or output_type not in self.OUTPUT_TYPES
+                or not isinstance(resource, FileResource)):
+            return convert(resource, output_type)
+
+        # The type of an object can depend on its name as well as its content,
+        # and the type decides which conversion will be used. (If there isn't
+        # one, then there's no point in reading the content at all)
+        mime_type = resource.compute_type()
+        get_converter(output_type, mime_type)
+        if self._is_too_big(resource):
+            return convert(resource, output_type, mime_type)
+
+        with ExitStack() as stack:
+            try:
+                digest, local = stack.enter_context(
+                        _local_copy(resource, mime_type))
+            except NotImplementedError:
+                return convert(resource, output_type, mime_type)
+
+            key = (digest, mime_type, output_type)
+            if (representation := self.get(key)) is not None:
+                content_cache_hits.inc()
+                logger.debug(
+                        f"returning content cache for {resource.handle},"
+                        f" type {output_type.value!r}")
+                return representation
+
+            content_cache_misses.inc()
+            representation = convert(local, output_type, mime_type)
+            if isinstance(representation, str):
+                # Don't keep the other values produced by the conversion alive
+                self.put(key, str(representation))
+            return representation
+
+
 __all__ = (
+        "CacheIndex",
         "CacheManager",
+        "ContentCache",
 )
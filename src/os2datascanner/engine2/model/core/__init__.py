@@ -2,4 +2,4 @@ from .errors import UnknownSchemeError, DeserialisationError  # noqa
 from .source import Source  # noqa
 from .handle import Handle  # noqa
 from .resource import Resource, FileResource  # noqa
-from .utilities import SourceManager  # noqa
+from .utilities import ScanContext, SourceManager  # noqa
@@ -1,8 +1,35 @@
+from typing import NamedTuple, Optional
+from datetime import datetime
 import structlog
 
 logger = structlog.get_logger(__name__)
 
 
+class ScanContext(NamedTuple):
+    """A ScanContext describes the scan that a SourceManager is being used
+    for, so that Sources that keep state between explorations can tell which
+    scan that state belongs to."""
+
+    # A string that uniquely identifies this run of the scan
+    tag: str
+    # The time at which this run of the scan was started
+    time: datetime
+    # A string that identifies the scanner that started this scan, if there
+    # is one
+    scanner: Optional[str] = None
+    # If the scan is only interested in objects modified after a certain time
+    # (because everything older has already been scanned), that time
+    modified_after: Optional[datetime] = None
+
+    @property
+    def is_incremental(self) -> bool:
+        """Indicates whether or not this scan belongs to a scanner and is only
+        interested in objects modified since an earlier scan by it. (Sources
+        should only skip objects that haven't changed since their last
+        exploration if this is True.)"""
+        return bool(self.scanner and self.modified_after)
+
+
 class _SourceDescriptor:
     def __init__(self, *, source, parent=None):
         self.source = source
@@ -34,7 +61,9 @@ class SourceManager:
     SourceManagers track arbitrary state objects and so are not usefully
     serialisable or shareable."""
 
-    def __init__(self, *, width=3, configuration: dict = None):
+    def __init__(
+            self, *, width=3, configuration: dict = None,
+            scan_context: Optional[ScanContext] = None):
         """Initialises this SourceManager."""
         self._width = width
 
@@ -47,6 +76,16 @@ class SourceManager:
 
         # Configuration obtained from a ScanSpec
         self.configuration = configuration
+        # Details of the scan that's using this SourceManager, if there is one
+        self.scan_context = scan_context
+        # The number of objects that Sources explored with this SourceManager
+        # didn't produce because an earlier, interrupted exploration of them
+        # already had (see SMBCSource.handles)
+        self.skipped_objects = 0
+
+    @property
+    def width(self):
+        return self._width
 
     def _make_descriptor(self, source):
         return self._opened.setdefault(
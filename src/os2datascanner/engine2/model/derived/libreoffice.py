@@ -10,7 +10,7 @@ from ... import settings as engine2_settings
 from ..core import Handle, Source
 from ..file import FilesystemResource
 from .derived import DerivedSource
-from .utilities import office_metadata
+from .utilities import office_metadata, libreoffice_pool
 from .utilities.extraction import TinyImageFilter
 
 logger = logging.getLogger(__name__)
@@ -48,6 +48,33 @@ def libreoffice(*args):
                 kill_group=True, isolate_tmp=True,)
 
 
+def convert(input_filter, input_file, output_filter, output_directory):
+    """Converts a file with LibreOffice, as though by running "libreoffice
+    --infilter=INPUT_FILTER --convert-to OUTPUT_FILTER --outdir
+    OUTPUT_DIRECTORY INPUT_FILE". A long-running LibreOffice daemon is used for
+    this if possible; if not, a new LibreOffice process is started."""
+    if (pool := libreoffice_pool.get_pool()):
+        try:
+            pool.convert(
+                    input_file, input_filter, output_filter, output_directory,
+                    timeout=engine2_settings.subprocess["timeout"])
+            return
+        except libreoffice_pool.DaemonUnavailable:
+            logger.warning(
+                    "LibreOffice daemon unavailable, starting LibreOffice"
+                    " directly", exc_info=True)
+
+    # --headless Starts in "headless mode"
+    # which allows using the application without GUI.
+    # This special mode can be used when the application is controlled
+    # by external clients via the API.
+    libreoffice(
+            "--infilter={0}".format(input_filter),
+            "--convert-to", output_filter,
+            "--outdir", output_directory, input_file,
+            "--headless")
+
+
 # The fallback CSV filter, used when HTML representations of spreadsheets are
 # too big.
 # CSV handling requres a really complicated filter name which includes some
@@ -98,15 +125,9 @@ def _replace_large_html(
                     logger.info(f"{entry.name} is larger than {size_threshold}. "
                                 "Replacing it with a simpler representation "
                                 f"[{output_filter}]")
-                    # --headless Starts in "headless mode"
-                    # which allows using the application without GUI.
-                    # This special mode can be used when the application is controlled
-                    # by external clients via the API.
-                    libreoffice(
-                            "--infilter={0}".format(input_filter),
-                            "--convert-to", output_filter,
-                            "--outdir", output_directory, input_file,
-                            "--headless")
+                    convert(
+                            input_filter, input_file,
+                            output_filter, output_directory)
                     unlink(entry.path)
                 break
 
@@ -153,10 +174,7 @@ class LibreOfficeSource(DerivedSource):
                         str(self.handle), best_mime_guess)
 
             with TemporaryDirectory() as outputdir:
-                libreoffice(
-                        "--infilter={0}".format(filter_name),
-                        "--convert-to", "html",
-                        "--outdir", outputdir, p)
+                convert(filter_name, p, "html", outputdir)
                 if backup_filter:
                     _replace_large_html(
                             filter_name, p, backup_filter, outputdir)
@@ -1,7 +1,14 @@
-from os import listdir
-import pypdf
+import os
+import re
+import shutil
 import string
+import logging
+import subprocess
+from os import listdir
+from contextlib import ExitStack, contextmanager
+from functools import cached_property
 from tempfile import TemporaryDirectory
+import pypdf
 
 from ....utils.system_utilities import run_custom
 from ... import settings as engine2_settings
@@ -13,10 +20,18 @@ from .utilities.extraction import (should_skip_images,
                                    TinyImageFilter)
 from .utilities.ghostscript import gs_convert
 
+logger = logging.getLogger(__name__)
+
+
+PAGES_PER_PASS: int = engine2_settings.model["pdf"]["pages_per_pass"]
 
 PAGE_TYPE = "application/x.os2datascanner.pdf-page"
 WHITESPACE_PLUS = string.whitespace + "\0"
 
+# The names given to images by "pdfimages -p": the page number and the
+# (document-wide) image number
+_PAGE_IMAGE = re.compile(r"^image-(?P<page>\d+)-(?P<number>\d+)\.(?P<ext>\w+)$")
+
 
 def _open_pdf_wrapped(obj):
     reader = pypdf.PdfReader(obj)
@@ -27,41 +42,166 @@ def _open_pdf_wrapped(obj):
     return reader
 
 
+class PDFDocument:
+    """A PDFDocument is the state shared by all of the pages of a PDF file
+    opened in a SourceManager: a local copy of the file, the details read
+    from it by pypdf, and (if PAGES_PER_PASS is greater than one) temporary
+    directories containing the extracted text and images of each range of
+    pages that has been extracted so far."""
+
+    def __init__(self, path: str):
+        self.path = path
+        # A map from the first page of each range to the temporary directory
+        # containing its extracted pages (or None, if extraction failed)
+        self._ranges = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, backtrace):
+        self._cleanup()
+
+    def _cleanup(self):
+        for outputdir in self._ranges.values():
+            if outputdir:
+                outputdir.cleanup()
+        self._ranges.clear()
+
+    @cached_property
+    def _details(self):
+        reader = _open_pdf_wrapped(self.path)
+        # Some PDF authoring tools helpfully stick null bytes into the author
+        # field. Make sure we remove these
+        author = (reader.metadata or {}).get(
+                "/Author", "").strip(WHITESPACE_PLUS)
+        return len(reader.pages), str(author)
+
+    @property
+    def page_count(self) -> int:
+        return self._details[0]
+
+    @property
+    def author(self) -> str:
+        return self._details[1]
+
+    def _extract_range(
+            self, first: int, last: int,
+            skip_images: bool) -> TemporaryDirectory:
+        outputdir = TemporaryDirectory()
+        try:
+            self._extract_range_into(outputdir.name, first, last, skip_images)
+        except BaseException:
+            outputdir.cleanup()
+            raise
+        return outputdir
+
+    def _extract_range_into(
+            self, outputdir: str, first: int, last: int, skip_images: bool):
+        timeout = engine2_settings.subprocess["timeout"]
+        pages = range(first, last + 1)
+        for page in pages:
+            os.mkdir(os.path.join(outputdir, str(page)))
+
+        with TemporaryDirectory() as workdir:
+            run_custom(
+                    [
+                            "pdftotext", "-q", "-eol", "unix",
+                            "-f", str(first), "-l", str(last), self.path,
+                            f"{workdir}/document.txt"
+                    ],
+                    timeout=timeout, check=True, isolate_tmp=True)
+            with open(f"{workdir}/document.txt", "rt") as fp:
+                # pdftotext ends every page with a form feed
+                texts = fp.read().split("\f")
+            for page in pages:
+                idx = page - first
+                text = texts[idx] if idx < len(texts) else ""
+                with open(f"{outputdir}/{page}/page.txt", "wt") as fp:
+                    fp.write(text)
+
+            if not skip_images:
+                run_custom(
+                        [
+                                "pdfimages", "-q", "-png", "-j", "-p",
+                                "-f", str(first), "-l", str(last),
+                                self.path, f"{workdir}/image"
+                        ],
+                        timeout=timeout, check=True, isolate_tmp=True)
+                images = {}
+                for name in listdir(workdir):
+                    if (m := _PAGE_IMAGE.match(name)):
+                        images.setdefault(int(m["page"]), []).append(
+                                (int(m["number"]), name, m["ext"]))
+                for page, page_images in images.items():
+                    if page not in pages:
+                        continue
+                    # Number each page's images from zero, just as running
+                    # pdfimages on that page alone would have done
+                    for idx, (_, name, ext) in enumerate(sorted(page_images)):
+                        shutil.move(
+                                f"{workdir}/{name}",
+                                f"{outputdir}/{page}/image-{idx:03d}.{ext}")
+
+        for page in pages:
+            TinyImageFilter.apply(
+                    MD5DeduplicationFilter.apply(f"{outputdir}/{page}"))
+
+    def extract(self, page: str, skip_images: bool):
+        """Returns the path to a directory containing the text and images of
+        the given page, extracting the content of the PAGES_PER_PASS pages
+        around it at the same time. Returns None if that extraction failed (in
+        which case the caller should extract the page by itself).
+
+        (Each range of pages is extracted with the same subprocess timeout
+        that a single page would have been, and the whole extraction has to
+        fit within the pipeline's operation timeout, so ranges should be
+        kept small.)"""
+        size = max(PAGES_PER_PASS, 1)
+        first = (int(page) - 1) // size * size + 1
+        if first not in self._ranges:
+            last = min(first + size - 1, self.page_count)
+            try:
+                self._ranges[first] = self._extract_range(
+                        first, last, skip_images)
+            except (OSError, subprocess.SubprocessError,
+                    pypdf.errors.PyPdfError):
+                logger.warning(
+                        "PDF extraction of pages {0}-{1} failed, falling back"
+                        " to page-by-page extraction".format(first, last),
+                        exc_info=True)
+                self._ranges[first] = None
+        if (outputdir := self._ranges[first]):
+            return os.path.join(outputdir.name, page)
+        return None
+
+
 @Source.mime_handler("application/pdf")
 class PDFSource(DerivedSource):
     type_label = "pdf"
 
     def _generate_state(self, sm):
-        with self.handle.follow(sm).make_path() as path:
+        with ExitStack() as stack:
             # Explicitly download the file here for the sake of PDFPageSource,
-            # which needs a local filesystem path to pass to pdftohtml
+            # which needs a local filesystem path to pass to pdftotext
+            path = stack.enter_context(self.handle.follow(sm).make_path())
             if engine2_settings.ghostscript["enabled"]:
-                yield from gs_convert(path)
-            else:
-                yield path
+                path = stack.enter_context(contextmanager(gs_convert)(path))
+            yield stack.enter_context(PDFDocument(path))
 
     def handles(self, sm):
-        reader = _open_pdf_wrapped(sm.open(self))
-        for i in range(1, len(reader.pages) + 1 if reader else 0):
+        for i in range(1, sm.open(self).page_count + 1):
             yield PDFPageHandle(self, str(i))
 
 
 class PDFPageResource(Resource):
     def _generate_metadata(self):
-        with self.handle.source.handle.follow(self._sm).make_stream() as fp:
-            reader = _open_pdf_wrapped(fp)
-            # Some PDF authoring tools helpfully stick null bytes into the
-            # author field. Make sure we remove these
-            author = reader.metadata.get("/Author", "").strip(WHITESPACE_PLUS)
-
-        if author:
-            yield "pdf-author", str(author)
+        if (author := self._sm.open(self.handle.source).author):
+            yield "pdf-author", author
 
     def check(self) -> bool:
         page = int(self.handle.relative_path)
-        with self.handle.source._make_stream(self._sm) as fp:
-            reader = _open_pdf_wrapped(fp)
-            return page in range(1, len(reader.pages) + 1 if reader else 0)
+        return page in range(
+                1, self._sm.open(self.handle.source).page_count + 1)
 
     def compute_type(self):
         return PAGE_TYPE
@@ -108,7 +248,14 @@ class PDFPageSource(DerivedSource):
         # same format as FilesystemSource: a filesystem directory in which to
         # interpret relative paths
         page = self.handle.relative_path
-        path = sm.open(self.handle.source)
+        document = sm.open(self.handle.source)
+        skip_images = should_skip_images(sm.configuration)
+        if (PAGES_PER_PASS > 1
+                and (outputdir := document.extract(page, skip_images))):
+            yield outputdir
+            return
+
+        path = document.path
         with TemporaryDirectory() as outputdir:
             # Run pdftotext and pdfimages separately instead of running
             # pdftohtml. Not having to parse HTML is a big performance win by
@@ -123,7 +270,7 @@ class PDFPageSource(DerivedSource):
                     timeout=engine2_settings.subprocess["timeout"],
                     check=True, isolate_tmp=True)
 
-            if not should_skip_images(sm.configuration):
+            if not skip_images:
                 run_custom(
                     [
                             "pdfimages", "-q", "-png", "-j", "-f", page, "-l", page,
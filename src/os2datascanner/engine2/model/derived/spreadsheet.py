@@ -1,6 +1,12 @@
 import logging
+from abc import ABC, abstractmethod
+from typing import Iterator
+from zipfile import ZipFile, BadZipFile
+from functools import cached_property
 import magic
-import pandas as pd
+import xlrd
+import openpyxl
+from lxml import etree
 
 from ..core import Handle, Source, Resource
 from .derived import DerivedSource
@@ -23,13 +29,209 @@ _actually_supported_types = [
 ]
 
 
+def _format_cell(value) -> str:
+    """Converts a spreadsheet cell value to text, returning the empty string
+    for empty cells."""
+    if value is None:
+        return ""
+    elif isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    else:
+        return str(value).strip()
+
+
+class Workbook(ABC):
+    """A Workbook gives read-only access to the sheets of a spreadsheet file,
+    reading the content of each sheet a row at a time so that big sheets
+    never have to be held in memory in their entirety."""
+
+    def __init__(self, path: str):
+        self._path = path
+
+    @staticmethod
+    def open(path: str) -> "Workbook":
+        """Returns a Workbook suitable for reading the given file, based on
+        its content."""
+        try:
+            with ZipFile(path) as zf:
+                names = set(zf.namelist())
+        except BadZipFile:
+            return _XLSWorkbook(path)
+        if "xl/workbook.xml" in names:
+            return _OOXMLWorkbook(path)
+        elif "content.xml" in names:
+            return _ODSWorkbook(path)
+        else:
+            raise ValueError(f"{path}: not a recognised spreadsheet")
+
+    @cached_property
+    def sheet_names(self) -> list[str]:
+        """The names of the sheets in this Workbook, in order. (This list is
+        only computed once.)"""
+        return self._read_sheet_names()
+
+    @abstractmethod
+    def _read_sheet_names(self) -> list[str]:
+        ...
+
+    @abstractmethod
+    def _iter_values(self, sheet_name: str) -> Iterator[Iterator]:
+        """Yields an iterator over the cell values of each row of the named
+        sheet."""
+
+    def iter_rows(self, sheet_name: str) -> Iterator[list[str]]:
+        """Yields the text of the non-empty cells of each non-empty row of the
+        named sheet."""
+        for values in self._iter_values(sheet_name):
+            if (cells := [c for c in map(_format_cell, values) if c]):
+                yield cells
+
+    def close(self):
+        pass
+
+
+class _OOXMLWorkbook(Workbook):
+    @cached_property
+    def _workbook(self):
+        return openpyxl.load_workbook(
+                self._path, read_only=True, data_only=True, keep_links=False)
+
+    def _read_sheet_names(self):
+        return list(self._workbook.sheetnames)
+
+    def _iter_values(self, sheet_name):
+        sheet = self._workbook[sheet_name]
+        # Some programs write incorrect dimensions into their sheets, so don't
+        # trust them
+        sheet.reset_dimensions()
+        yield from sheet.iter_rows(values_only=True)
+
+    def close(self):
+        if "_workbook" in self.__dict__:
+            self._workbook.close()
+
+
+_TABLE_NS = "urn:oasis:names:tc:opendocument:xmlns:table:1.0"
+_OFFICE_NS = "urn:oasis:names:tc:opendocument:xmlns:office:1.0"
+_TEXT_NS = "urn:oasis:names:tc:opendocument:xmlns:text:1.0"
+
+_TABLE = f"{{{_TABLE_NS}}}table"
+_ROW = f"{{{_TABLE_NS}}}table-row"
+_CELL = f"{{{_TABLE_NS}}}table-cell"
+_NAME = f"{{{_TABLE_NS}}}name"
+_ROWS_REPEATED = f"{{{_TABLE_NS}}}number-rows-repeated"
+_COLUMNS_REPEATED = f"{{{_TABLE_NS}}}number-columns-repeated"
+_VALUE_TYPE = f"{{{_OFFICE_NS}}}value-type"
+_TEXT_P = f"{{{_TEXT_NS}}}p"
+
+_ODS_VALUE_ATTRIBUTES = {
+    "float": f"{{{_OFFICE_NS}}}value",
+    "percentage": f"{{{_OFFICE_NS}}}value",
+    "currency": f"{{{_OFFICE_NS}}}value",
+    "date": f"{{{_OFFICE_NS}}}date-value",
+    "time": f"{{{_OFFICE_NS}}}time-value",
+    "boolean": f"{{{_OFFICE_NS}}}boolean-value",
+}
+
+
+def _ods_cell_value(cell):
+    value_type = cell.get(_VALUE_TYPE)
+    if (attr := _ODS_VALUE_ATTRIBUTES.get(value_type)):
+        value = cell.get(attr)
+        match value_type:
+            case "boolean":
+                return value == "true"
+            case "date" | "time":
+                return value
+            case _:
+                return float(value)
+    return "\n".join("".join(p.itertext()) for p in cell.iter(_TEXT_P))
+
+
+class _ODSWorkbook(Workbook):
+    def _events(self):
+        # OpenDocument content can be very big, so we parse it as a stream
+        # and throw away each row as soon as we're finished with it
+        with ZipFile(self._path) as zf, zf.open("content.xml") as fp:
+            for event, elem in etree.iterparse(
+                    fp, events=("start", "end",), tag=(_TABLE, _ROW,),
+                    resolve_entities=False, no_network=True, huge_tree=True):
+                yield event, elem
+                if event == "end":
+                    elem.clear()
+                    while elem.getprevious() is not None:
+                        del elem.getparent()[0]
+
+    def _read_sheet_names(self):
+        return [
+                elem.get(_NAME)
+                for event, elem in self._events()
+                if event == "start" and elem.tag == _TABLE]
+
+    def _iter_values(self, sheet_name):
+        in_sheet = False
+        for event, elem in self._events():
+            if elem.tag == _TABLE:
+                if event == "start":
+                    in_sheet = elem.get(_NAME) == sheet_name
+                elif in_sheet:
+                    break
+            elif event == "end" and in_sheet:
+                values = []
+                for cell in elem.iterchildren(_CELL):
+                    value = _ods_cell_value(cell)
+                    if value != "":
+                        values.extend(
+                                [value] * int(cell.get(_COLUMNS_REPEATED, 1)))
+                if values:
+                    for _ in range(int(elem.get(_ROWS_REPEATED, 1))):
+                        yield values
+
+
+class _XLSWorkbook(Workbook):
+    @cached_property
+    def _book(self):
+        return xlrd.open_workbook(self._path, on_demand=True)
+
+    def _read_sheet_names(self):
+        return self._book.sheet_names()
+
+    def _convert(self, cell):
+        if cell.ctype == xlrd.XL_CELL_DATE:
+            try:
+                return xlrd.xldate_as_datetime(cell.value, self._book.datemode)
+            except xlrd.xldate.XLDateError:
+                pass
+        elif cell.ctype == xlrd.XL_CELL_BOOLEAN:
+            return bool(cell.value)
+        elif cell.ctype == xlrd.XL_CELL_ERROR:
+            return None
+        return cell.value
+
+    def _iter_values(self, sheet_name):
+        sheet = self._book.sheet_by_name(sheet_name)
+        try:
+            for row in sheet.get_rows():
+                yield map(self._convert, row)
+        finally:
+            self._book.unload_sheet(sheet_name)
+
+    def close(self):
+        if "_book" in self.__dict__:
+            self._book.release_resources()
+
+
 @Source.mime_handler(*_actually_supported_types)
 class SpreadsheetSource(DerivedSource):
     type_label = "spreadsheet"
 
     def _generate_state(self, sm):
         with self.handle.follow(sm).make_path() as path:
-            yield pd.ExcelFile(path)
+            workbook = Workbook.open(path)
+            try:
+                yield workbook
+            finally:
+                workbook.close()
 
     def handles(self, sm):
         for sheet_name in sm.open(self).sheet_names:
@@ -57,9 +259,7 @@ class SpreadsheetSheetResource(Resource):
 
     def check(self) -> bool:
         sheet_name = str(self.handle.relative_path)
-        with self._sm.open(self.handle.source) as path:
-            sheet_names = pd.ExcelFile(path).sheet_names
-            return sheet_name in sheet_names
+        return sheet_name in self._sm.open(self.handle.source).sheet_names
 
     def compute_type(self):
         return SHEET_TYPE
@@ -0,0 +1,186 @@
+"""A long-running LibreOffice conversion server.
+
+This script is started by LibreOfficePool (in libreoffice_pool.py), using a
+Python interpreter that can import LibreOffice's "uno" module -- which usually
+isn't the one running the engine. It starts a headless LibreOffice process,
+connects to it over UNO, and then serves conversion requests over XML-RPC on a
+local TCP port, which it announces on standard output when it's ready.
+
+This script is run by itself, so it mustn't import anything from
+OS2datascanner (or anything else that the system Python might not have)."""
+
+import os
+import sys
+import time
+import uuid
+import shutil
+import signal
+import tempfile
+import threading
+import subprocess
+from xmlrpc.server import SimpleXMLRPCServer
+
+import uno
+from com.sun.star.beans import PropertyValue
+from com.sun.star.connection import NoConnectException
+
+
+# The export filters that "libreoffice --convert-to EXTENSION" would pick for
+# each type of document
+_EXPORT_FILTERS = {
+    ("com.sun.star.text.TextDocument", "html"): "HTML (StarWriter)",
+    ("com.sun.star.text.TextDocument", "txt"): "Text",
+    ("com.sun.star.sheet.SpreadsheetDocument", "html"): "HTML (StarCalc)",
+}
+
+
+def _props(**kwargs):
+    return tuple(PropertyValue(Name=k, Value=v) for k, v in kwargs.items())
+
+
+def _rss(root: int) -> int:
+    """Returns the total resident memory usage (in kibibytes) of a process and
+    all of its descendants."""
+    parents = {}
+    for pid in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            with open(f"/proc/{pid}/stat", "rt") as fp:
+                # The command name can contain spaces, so skip past it
+                parents[int(pid)] = int(fp.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            pass
+
+    total = 0
+    for pid in parents:
+        p = pid
+        while p and p != root:
+            p = parents.get(p)
+        if p == root:
+            try:
+                with open(f"/proc/{pid}/status", "rt") as fp:
+                    for line in fp:
+                        if line.startswith("VmRSS:"):
+                            total += int(line.split()[1])
+            except (OSError, ValueError):
+                pass
+    return total
+
+
+class Daemon:
+    def __init__(self, soffice: str, startup_timeout: float):
+        self._profile = tempfile.mkdtemp(prefix="os2ds-lo-")
+        pipe = f"os2ds-{uuid.uuid4().hex}"
+        self._process = subprocess.Popen(
+                [
+                        soffice, "--headless", "--invisible", "--nologo",
+                        "--norestore", "--nodefault", "--nolockcheck",
+                        f"-env:UserInstallation=file://{self._profile}",
+                        f"--accept=pipe,name={pipe};urp;StarOffice.ComponentContext"
+                ],
+                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL)
+
+        local = uno.getComponentContext()
+        resolver = local.ServiceManager.createInstanceWithContext(
+                "com.sun.star.bridge.UnoUrlResolver", local)
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            try:
+                context = resolver.resolve(
+                        f"uno:pipe,name={pipe};urp;"
+                        "StarOffice.ComponentContext")
+                break
+            except NoConnectException:
+                if (time.monotonic() > deadline
+                        or self._process.poll() is not None):
+                    self.shutdown()
+                    raise
+                time.sleep(0.25)
+        self._desktop = context.ServiceManager.createInstanceWithContext(
+                "com.sun.star.frame.Desktop", context)
+
+    def ping(self):
+        # Make a trivial UNO call to check that LibreOffice is still there
+        self._desktop.getComponents()
+        return {"pid": self._process.pid, "rss": _rss(self._process.pid)}
+
+    def convert(
+            self, input_path: str, input_filter: str, output_spec: str,
+            output_dir: str):
+        """Converts a file in the same way as "libreoffice
+        --infilter=INPUT_FILTER --convert-to OUTPUT_SPEC --outdir OUTPUT_DIR
+        INPUT_PATH"."""
+        extension, _, rest = output_spec.partition(":")
+        output_filter, _, options = rest.partition(":")
+
+        doc = self._desktop.loadComponentFromURL(
+                uno.systemPathToFileUrl(os.path.abspath(input_path)),
+                "_blank", 0,
+                _props(Hidden=True, ReadOnly=True, FilterName=input_filter))
+        if doc is None:
+            raise ValueError(f"{input_path}: document could not be loaded")
+        try:
+            if not output_filter:
+                for (service, ext), name in _EXPORT_FILTERS.items():
+                    if ext == extension and doc.supportsService(service):
+                        output_filter = name
+                        break
+                else:
+                    raise ValueError(
+                            f"{input_path}: no export filter for {extension}")
+
+            stem = os.path.splitext(os.path.basename(input_path))[0]
+            output_path = os.path.join(
+                    os.path.abspath(output_dir), f"{stem}.{extension}")
+            store_props = {"FilterName": output_filter, "Overwrite": True}
+            if options:
+                store_props["FilterOptions"] = options
+            doc.storeToURL(
+                    uno.systemPathToFileUrl(output_path),
+                    _props(**store_props))
+        finally:
+            doc.close(True)
+        return True
+
+    def shutdown(self):
+        try:
+            self._desktop.terminate()
+        except Exception:
+            pass
+        try:
+            self._process.wait(5)
+        except subprocess.TimeoutExpired:
+            pass
+        self._process.kill()
+        self._process.wait()
+        shutil.rmtree(self._profile, ignore_errors=True)
+
+
+def main():
+    soffice, startup_timeout = sys.argv[1], float(sys.argv[2])
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    daemon = Daemon(soffice, startup_timeout)
+    try:
+        server = SimpleXMLRPCServer(
+                ("127.0.0.1", 0), logRequests=False, allow_none=True)
+        server.register_function(daemon.ping, "ping")
+        server.register_function(daemon.convert, "convert")
+
+        # Don't outlive the process that started us
+        parent = os.getppid()
+
+        def _watch_parent():
+            while os.getppid() == parent:
+                time.sleep(1)
+            server.shutdown()
+        threading.Thread(target=_watch_parent, daemon=True).start()
+
+        print(f"READY {server.server_address[1]}", flush=True)
+        server.serve_forever()
+    finally:
+        daemon.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""Management of long-running LibreOffice conversion daemons.
+
+Starting LibreOffice takes much longer than converting a typical small
+document does. A LibreOfficePool keeps a few LibreOffice processes (each
+driven by the libreoffice_daemon.py script) running between conversions,
+checks that they're still responsive before handing work to them, and
+restarts them after a number of conversions or when they use too much
+memory."""
+
+import os
+import sys
+import queue
+import atexit
+import select
+import signal
+import logging
+import threading
+import subprocess
+import xmlrpc.client
+from time import monotonic
+from contextlib import contextmanager
+
+from .... import settings as engine2_settings
+
+logger = logging.getLogger(__name__)
+
+
+DAEMON_SCRIPT = os.path.join(
+        os.path.dirname(__file__), "libreoffice_daemon.py")
+
+
+class DaemonUnavailable(Exception):
+    """Raised when a LibreOffice daemon couldn't be started or stopped
+    responding. (Callers can fall back to running LibreOffice directly.)"""
+
+
+class ConversionError(RuntimeError):
+    """Raised when a LibreOffice daemon couldn't convert a document."""
+
+
+class _TimeoutTransport(xmlrpc.client.Transport):
+    def __init__(self):
+        super().__init__()
+        self.timeout = None
+
+    def make_connection(self, host):
+        connection = super().make_connection(host)
+        connection.timeout = self.timeout
+        if connection.sock:
+            connection.sock.settimeout(self.timeout)
+        return connection
+
+
+class LibreOfficeDaemon:
+    """A LibreOfficeDaemon is a handle to a single running instance of the
+    libreoffice_daemon.py script (and so to a single LibreOffice process)."""
+
+    def __init__(self, command: list[str], startup_timeout: float):
+        self.command = command
+        self._startup_timeout = startup_timeout
+        self._process = None
+        self._transport = None
+        self._proxy = None
+        self.conversions = 0
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def start(self):
+        """Starts this daemon and waits for it to announce that it's ready.
+        Raises a DaemonUnavailable if that doesn't happen in time."""
+        self.stop()
+        try:
+            self._process = subprocess.Popen(
+                    self.command,
+                    stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL, start_new_session=True)
+        except OSError as ex:
+            raise DaemonUnavailable(self.command) from ex
+
+        ready, _, _ = select.select(
+                [self._process.stdout], [], [], self._startup_timeout)
+        line = self._process.stdout.readline() if ready else b""
+        if not line.startswith(b"READY "):
+            self.stop()
+            raise DaemonUnavailable(self.command)
+
+        port = int(line.split()[1])
+        self._transport = _TimeoutTransport()
+        self._proxy = xmlrpc.client.ServerProxy(
+                f"http://127.0.0.1:{port}/",
+                transport=self._transport, allow_none=True)
+        self.conversions = 0
+
+    def call(self, method: str, *args, timeout: float = None):
+        self._transport.timeout = timeout
+        return getattr(self._proxy, method)(*args)
+
+    def stop(self):
+        """Stops this daemon (and its LibreOffice process), if it's
+        running."""
+        if self._process:
+            try:
+                # The daemon runs in its own process group, and LibreOffice
+                # is in that group as well
+                os.killpg(self._process.pid, signal.SIGTERM)
+                try:
+                    self._process.wait(5)
+                except subprocess.TimeoutExpired:
+                    os.killpg(self._process.pid, signal.SIGKILL)
+                    self._process.wait()
+            except ProcessLookupError:
+                pass
+            self._process.stdout.close()
+            self._process = None
+        if self._proxy:
+            self._proxy("close")()
+            self._proxy = None
+
+
+class LibreOfficePool:
+    """A LibreOfficePool hands out up to a fixed number of LibreOffice
+    daemons to the threads that need to convert documents, starting them on
+    demand and restarting them when they become unhealthy.
+
+    If a daemon can't be started, the pool won't try again for retry_interval
+    seconds, and will raise DaemonUnavailable instead."""
+
+    def __init__(
+            self, command: list[str], *, instances: int = 1,
+            max_conversions: int = 200, max_memory: int = 1024,
+            startup_timeout: float = 60.0, retry_interval: float = 300.0):
+        self._command = command
+        self._max_conversions = max_conversions
+        self._max_memory = max_memory
+        self._startup_timeout = startup_timeout
+        self._retry_interval = retry_interval
+
+        self._daemons = [
+                LibreOfficeDaemon(command, startup_timeout)
+                for _ in range(instances)]
+        self._idle = queue.SimpleQueue()
+        for daemon in self._daemons:
+            self._idle.put(daemon)
+        self._unavailable_until = 0.0
+        self._pid = os.getpid()
+
+    def _make_ready(self, daemon: LibreOfficeDaemon):
+        if daemon.running:
+            try:
+                status = daemon.call("ping", timeout=10.0)
+                if status["rss"] <= self._max_memory * 1024:
+                    return
+                logger.info(
+                        "restarting LibreOffice daemon after memory growth",
+                        extra={"rss": status["rss"]})
+            except (OSError, xmlrpc.client.Error):
+                logger.warning(
+                        "LibreOffice daemon failed health check, restarting",
+                        exc_info=True)
+
+        if monotonic() < self._unavailable_until:
+            raise DaemonUnavailable(self._command)
+        try:
+            daemon.start()
+        except DaemonUnavailable:
+            self._unavailable_until = monotonic() + self._retry_interval
+            raise
+
+    @contextmanager
+    def _checkout(self):
+        daemon = self._idle.get()
+        try:
+            self._make_ready(daemon)
+            yield daemon
+            daemon.conversions += 1
+            if daemon.conversions >= self._max_conversions:
+                daemon.stop()
+        finally:
+            self._idle.put(daemon)
+
+    def convert(
+            self, input_path: str, input_filter: str, output_spec: str,
+            output_dir: str, *, timeout: float = None):
+        """Converts a document in the same way as "libreoffice
+        --infilter=INPUT_FILTER --convert-to OUTPUT_SPEC --outdir OUTPUT_DIR
+        INPUT_PATH" would.
+
+        Raises a subprocess.TimeoutExpired if the conversion takes too long, a
+        ConversionError if LibreOffice fails to convert the document, and a
+        DaemonUnavailable if no daemon is available to do the work."""
+        with self._checkout() as daemon:
+            try:
+                daemon.call(
+                        "convert",
+                        os.path.abspath(input_path), input_filter,
+                        output_spec, os.path.abspath(output_dir),
+                        timeout=timeout)
+            except TimeoutError:
+                daemon.stop()
+                raise subprocess.TimeoutExpired(daemon.command, timeout)
+            except xmlrpc.client.Fault as ex:
+                raise ConversionError(input_path, ex.faultString) from None
+            except (OSError, xmlrpc.client.ProtocolError) as ex:
+                daemon.stop()
+                raise DaemonUnavailable(daemon.command) from ex
+
+    def close(self):
+        """Stops all of the daemons in this pool. (This does nothing in forked
+        child processes, which don't own their parent's daemons.)"""
+        if os.getpid() == self._pid:
+            for daemon in self._daemons:
+                daemon.stop()
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Returns the LibreOfficePool for this process, or None if the
+    model.libreoffice.daemon setting is disabled. (Processes forked from one
+    that already has a pool get a new pool of their own.)"""
+    global _pool, _pool_pid
+    settings = engine2_settings.model["libreoffice"]
+    if not settings["daemon"]:
+        return None
+
+    with _pool_lock:
+        if _pool_pid != os.getpid():
+            _pool = LibreOfficePool(
+                    [
+                            settings["daemon_python"] or sys.executable,
+                            DAEMON_SCRIPT, "libreoffice",
+                            str(settings["startup_timeout"])
+                    ],
+                    instances=settings["instances"],
+                    max_conversions=settings["max_conversions"],
+                    max_memory=settings["max_memory"],
+                    startup_timeout=settings["startup_timeout"])
+            _pool_pid = os.getpid()
+            atexit.register(_pool.close)
+        return _pool
@@ -1,11 +1,9 @@
-from contextlib import contextmanager
-from io import BytesIO
-
 import dropbox
 from dropbox.files import GetMetadataError
 from dropbox.dropbox import create_session
 from dropbox.exceptions import ApiError
-from .core import Source, Handle, FileResource
+from .core import Source, Handle
+from .utilities.download import DownloadResource
 
 
 class DropboxSource(Source):
@@ -61,7 +59,7 @@ class DropboxSource(Source):
         return DropboxSource(obj["token"])
 
 
-class DropboxResource(FileResource):
+class DropboxResource(DownloadResource):
     def __init__(self, handle, sm):
         super().__init__(handle, sm)
         self._metadata = None
@@ -84,6 +82,11 @@ class DropboxResource(FileResource):
             self.handle.relative_path)
         return res
 
+    def open_download(self, headers):
+        # The Dropbox SDK doesn't let us add headers to its requests, so an
+        # interrupted download is started over instead of being resumed
+        return self.open_file()
+
     @property
     def metadata(self):
         if self._metadata is None:
@@ -91,11 +94,6 @@ class DropboxResource(FileResource):
                 self.handle.relative_path)
         return self._metadata
 
-    @contextmanager
-    def make_stream(self):
-        with self.open_file() as res:
-            yield BytesIO(res.content)
-
     def get_last_modified(self):
         return self.metadata.server_modified
 
@@ -1,19 +1,34 @@
 from io import BytesIO
+from itertools import islice
+from collections import OrderedDict
 from urllib.parse import urlsplit, quote
 from contextlib import contextmanager
 from exchangelib import (
-    Folder, Account, Message, Credentials, IMPERSONATION,
+    Account, Message, Credentials, IMPERSONATION,
     Configuration, ExtendedProperty)
 from exchangelib.errors import (
         ErrorServerBusy, ErrorItemNotFound, ErrorNonExistentMailbox)
 from exchangelib.protocol import BaseProtocol
 
+from .. import settings as engine2_settings
 from ..utilities.backoff import DefaultRetrier
 from .core import Source, Handle, FileResource
 
 
 BaseProtocol.SESSION_POOLSIZE = 1
 
+FETCH_SIZE: int = engine2_settings.model["ews"]["fetch_size"]
+FETCH_TRIES: int = engine2_settings.model["ews"]["fetch_tries"]
+WINDOW: int = engine2_settings.model["ews"]["window"]
+
+# The fields of a message needed to check it and to compute its metadata.
+# These are small, so it's cheap to retrieve them for several messages at once
+_SUMMARY_FIELDS = (
+        "size", "datetime_created", "datetime_received", "datetime_sent",)
+# The errors that mean that a message (or its mailbox) is gone, rather than
+# that it couldn't be retrieved right now
+_MISSING = (ErrorItemNotFound, ErrorNonExistentMailbox,)
+
 
 # An "entry ID" is the special identifier used to open something in the Outlook
 # rich client (after converting it to a hexadecimal string). This property can
@@ -65,6 +80,99 @@ class InsensitiveDict(dict):
         return super().__setitem__(key.lower(), value)
 
 
+class _ItemErrors(Exception):
+    """Raised (and retried) when the server returns errors other than the ones
+    in _MISSING for some of the messages in a request."""
+
+
+class EWSMailbox:
+    """An EWSMailbox is the state of an open EWSAccountSource: it wraps the
+    exchangelib Account for the mailbox, and retrieves the summaries of the
+    messages in it several at a time.
+
+    When a message's summary is needed, it's retrieved together with those of
+    up to FETCH_SIZE-1 of the messages that exploration has announced are
+    coming up next. The most recently retrieved summaries are kept, and every
+    Resource for a message shares the same copy of its summary, so checking
+    and examining a message normally takes at most one request to the server.
+    (The content of a message is only retrieved when it's read.)"""
+
+    def __init__(self, account: Account):
+        self.account = account
+        self._upcoming = OrderedDict()
+        self._messages = OrderedDict()
+
+    def expect(self, mail_ids):
+        """Announces that the messages with the given IDs will probably be
+        needed soon."""
+        for mail_id in mail_ids:
+            self._upcoming[mail_id] = None
+        while len(self._upcoming) > WINDOW:
+            self._upcoming.popitem(last=False)
+
+    def _fetch(self, ids: list[str], fields) -> tuple[dict, dict]:
+        """Retrieves the given fields of the messages with the given IDs.
+        Returns a dictionary mapping IDs to messages (or to the exceptions
+        that show that they're missing) and another mapping IDs to the other
+        errors that the server returned for them, even after retrying."""
+        results, errors = {}, {}
+
+        def _retrieve_messages():
+            pending = [i for i in ids if i not in results]
+            # exchangelib returns the messages in the order they were asked
+            # for (and *returns* exceptions for the ones it couldn't retrieve)
+            for i, m in zip(pending, self.account.fetch(
+                    ids=[(i, None) for i in pending], only_fields=fields,
+                    chunk_size=max(FETCH_SIZE, 1))):
+                if isinstance(m, Exception) and not isinstance(m, _MISSING):
+                    errors[i] = m
+                else:
+                    results[i] = m
+                    errors.pop(i, None)
+            if errors:
+                raise _ItemErrors()
+        try:
+            DefaultRetrier(
+                    ErrorServerBusy, _ItemErrors,
+                    max_tries=FETCH_TRIES, fuzz=0.25).run(_retrieve_messages)
+        except _ItemErrors:
+            pass
+        return results, errors
+
+    def get_message(self, mail_id: str) -> Message:
+        """Returns the summary of the message with the given ID, or raises
+        the exception that the server returned instead of it."""
+        if mail_id in self._messages:
+            self._messages.move_to_end(mail_id)
+        else:
+            self._upcoming.pop(mail_id, None)
+            batch = [mail_id]
+            while self._upcoming and len(batch) < FETCH_SIZE:
+                batch.append(self._upcoming.popitem(last=False)[0])
+
+            results, errors = self._fetch(batch, _SUMMARY_FIELDS)
+            if mail_id in errors:
+                raise errors[mail_id]
+            self._messages.update(results)
+            while len(self._messages) > max(FETCH_SIZE, 1) * 2:
+                self._messages.popitem(last=False)
+
+        message = self._messages[mail_id]
+        if isinstance(message, Exception):
+            raise message
+        return message
+
+    def get_content(self, mail_id: str) -> bytes:
+        """Returns the MIME content of the message with the given ID, or
+        raises the exception that the server returned instead of it."""
+        results, errors = self._fetch([mail_id], ("mime_content",))
+        if mail_id in errors:
+            raise errors[mail_id]
+        elif isinstance(message := results[mail_id], Exception):
+            raise message
+        return message.mime_content
+
+
 class EWSAccountSource(Source):
     type_label = "ews"
 
@@ -104,7 +212,7 @@ class EWSAccountSource(Source):
                 access_type=IMPERSONATION)
 
         try:
-            yield account
+            yield EWSMailbox(account)
         finally:
             # XXX: we should, in principle, close account.protocol here, but
             # exchangelib seems to keep a reference to it internally and so
@@ -116,7 +224,8 @@ class EWSAccountSource(Source):
                 self._domain, self._server, None, None, self._user)
 
     def handles(self, sm):  # noqa: CCR001, E501 too high cognitive complexity
-        account = sm.open(self)
+        mailbox = sm.open(self)
+        account = mailbox.account
 
         def relevant_folders():
             for container in account.msg_folder_root.walk():
@@ -139,7 +248,13 @@ class EWSAccountSource(Source):
                             folder.name,
                             mail.entry_id.hex())
 
-        yield from relevant_mails(relevant_folders())
+        # Read ahead a window of mails at a time, so that the mailbox can
+        # retrieve them in bulk if they're processed by this SourceManager
+        mails = relevant_mails(relevant_folders())
+        while (window := list(islice(mails, max(WINDOW, 1)))):
+            mailbox.expect(
+                    h.relative_path.split(".", maxsplit=1)[1] for h in window)
+            yield from window
 
     def to_json_object(self):
         return dict(
@@ -183,42 +298,22 @@ class EWSMailResource(FileResource):
         yield from super()._generate_metadata()
 
     def check(self) -> bool:
-        folder_id, mail_id = self._ids
-
         try:
-            account = self._get_cookie()
-
-            def _retrieve_message():
-                # exchangelib>=4.0.0 requires that you pass a Folder object to
-                # the function that... returns a Folder object?... okay, fine,
-                # let's do that...
-                folder_object = Folder(id=folder_id)
-                return account.root.get_folder(
-                        folder_object).all().only("message_id").get(id=mail_id)
-
-            m = DefaultRetrier(ErrorServerBusy).run(_retrieve_message)
-            # exchangelib is slightly inconsistent about whether it *returns*
-            # or *raises* exceptions, so we err on the side of caution here
-            return not isinstance(
-                    m, (ErrorItemNotFound, ErrorNonExistentMailbox,))
+            self.get_message_object()
+            return True
         except (ErrorItemNotFound, ErrorNonExistentMailbox,):
             return False
 
     def get_message_object(self):
         if not self._message:
-            folder_id, mail_id = self._ids
-            account = self._get_cookie()
-
-            def _retrieve_message():
-                folder_object = Folder(id=folder_id)
-                return account.root.get_folder(folder_object).get(id=mail_id)
-            self._message = DefaultRetrier(
-                    ErrorServerBusy, fuzz=0.25).run(_retrieve_message)
+            _, mail_id = self._ids
+            self._message = self._get_cookie().get_message(mail_id)
         return self._message
 
     @contextmanager
     def make_stream(self):
-        with BytesIO(self.get_message_object().mime_content) as fp:
+        _, mail_id = self._ids
+        with BytesIO(self._get_cookie().get_content(mail_id)) as fp:
             yield fp
 
     # XXX: actually make these values navigable
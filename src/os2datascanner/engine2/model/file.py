@@ -1,15 +1,131 @@
-from .core import Source, Handle, FileResource
+from .core import Source, Handle, FileResource, ScanContext
+import os
 import os.path
+import json
+import hashlib
+import logging
+import sqlite3
 from pathlib import Path
 from datetime import datetime
 from dateutil.tz import gettz
 from functools import cached_property
 from contextlib import contextmanager
 
+from .. import settings as engine2_settings
 from ..conversions.types import OutputType
 from ..conversions.utilities.navigable import make_values_navigable
 
 
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR: str = engine2_settings.model["file"]["snapshot_dir"]
+
+
+def _scan_tree(root: str, prefix: str = ""):
+    """Yields the relative path and stat result of every file under a
+    directory, visiting the files in each directory before its subdirectories.
+    (The stat result is None if the file couldn't be stat'ed.)
+
+    Symbolic links to files are followed, but symbolic links to directories
+    aren't."""
+    try:
+        with os.scandir(root) as it:
+            entries = list(it)
+    except PermissionError:
+        return
+
+    subdirectories = []
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry)
+                continue
+            elif not entry.is_file():
+                continue
+        except OSError:
+            continue
+        try:
+            stat = entry.stat()
+        except OSError:
+            stat = None
+        yield prefix + entry.name, stat
+
+    for entry in subdirectories:
+        yield from _scan_tree(entry.path, prefix + entry.name + "/")
+
+
+class _Snapshot:
+    """A _Snapshot records the size and modification time of every file found
+    by the last complete exploration of a FilesystemSource for a scanner in a
+    SQLite database, along with the start time of the scan that took it, so
+    that the next exploration can tell which files have changed since then."""
+
+    def __init__(self, path: str):
+        self._path = path
+
+    @classmethod
+    def for_scanner(
+            cls, source: "FilesystemSource", context: ScanContext,
+            directory: str):
+        key = hashlib.sha256(json.dumps(
+                [context.scanner, source.path]).encode()).hexdigest()
+        return cls(os.path.join(directory, f"file-{key}.sqlite3"))
+
+    @contextmanager
+    def compare(self, time: datetime, modified_after: datetime):
+        """Yields a function that records a file's relative path and stat
+        result in a new snapshot, taken by a scan started at the given time,
+        and returns True if the file is new or has changed since this
+        snapshot was taken.
+
+        This snapshot is only used if it was taken by a scan that started no
+        later than modified_after: otherwise, the scan that took it might not
+        have finished, and all files are treated as new. The new snapshot
+        only replaces this one if the body of the with statement finishes
+        normally."""
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        new_path = self._path + ".new"
+        if os.path.exists(new_path):
+            os.unlink(new_path)
+
+        db = sqlite3.connect(new_path)
+        db.execute(
+                "CREATE TABLE files"
+                " (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER)")
+        db.execute("CREATE TABLE taken (time TEXT)")
+        db.execute("INSERT INTO taken VALUES (?)", (time.isoformat(),))
+        have_old = False
+        if os.path.exists(self._path):
+            db.execute("ATTACH DATABASE ? AS old", (self._path,))
+            try:
+                taken = db.execute("SELECT time FROM old.taken").fetchone()
+                have_old = bool(taken) and (
+                        datetime.fromisoformat(taken[0]) <= modified_after)
+            except (sqlite3.DatabaseError, ValueError, TypeError):
+                pass
+
+        def _changed(path: str, stat: os.stat_result) -> bool:
+            db.execute(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?, ?)",
+                    (path, stat.st_size, stat.st_mtime_ns))
+            if not have_old:
+                return True
+            old = db.execute(
+                    "SELECT size, mtime FROM old.files WHERE path = ?",
+                    (path,)).fetchone()
+            return old != (stat.st_size, stat.st_mtime_ns)
+
+        try:
+            yield _changed
+            db.commit()
+        except BaseException:
+            db.close()
+            os.unlink(new_path)
+            raise
+        db.close()
+        os.replace(new_path, self._path)
+
+
 class FilesystemSource(Source):
     type_label = "file"
 
@@ -23,15 +139,33 @@ class FilesystemSource(Source):
         return self._path
 
     def handles(self, sm):
-        pathlib_path = Path(self.path)
-        for d in pathlib_path.glob("**"):
-            try:
-                for f in d.iterdir():
-                    if f.is_file():
-                        yield FilesystemHandle(
-                            self, str(f.relative_to(pathlib_path)))
-            except PermissionError:
-                continue
+        context = sm.scan_context
+        if SNAPSHOT_DIR and context and context.is_incremental:
+            snapshot = _Snapshot.for_scanner(self, context, SNAPSHOT_DIR)
+            with snapshot.compare(
+                    context.time, context.modified_after) as changed:
+                skipped = 0
+                for path, stat in _scan_tree(self.path):
+                    if stat and not changed(path, stat):
+                        skipped += 1
+                        continue
+                    yield self._make_handle(path, stat)
+            logger.info(f"skipped {skipped} unchanged files in {self.path}")
+        else:
+            for path, stat in _scan_tree(self.path):
+                yield self._make_handle(path, stat)
+
+    def _make_handle(self, path, stat):
+        hints = None
+        if stat:
+            # We've already paid for this information, so pass it on to the
+            # FilesystemResource
+            hints = {
+                "size": stat.st_size,
+                "last_modified": OutputType.LastModified.encode_json_object(
+                        datetime.fromtimestamp(stat.st_mtime, gettz())),
+            }
+        return FilesystemHandle(self, path, hints=hints)
 
     def _generate_state(self, sm):
         """Yields a path to the directory against which relative paths should
@@ -86,9 +220,13 @@ class FilesystemResource(FileResource):
         return self._mr
 
     def get_size(self):
+        if (size := self.handle.hint("size")) is not None:
+            return size
         return self.unpack_stat()["st_size"]
 
     def get_last_modified(self):
+        if (lm_hint := self.handle.hint("last_modified")):
+            return OutputType.LastModified.decode_json_object(lm_hint)
         return self.unpack_stat().setdefault(
                 OutputType.LastModified, super().get_last_modified())
 
@@ -1,11 +1,12 @@
 import json
 from contextlib import contextmanager
-from io import BytesIO
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload
 from googleapiclient.errors import HttpError
 from .core import Source, Handle, FileResource
+from .utilities import NamedTemporaryResource
+from .utilities.download import CHUNK_SIZE, RESUME_TRIES, spooled_file
 
 
 class GoogleDriveSource(Source):
@@ -79,8 +80,7 @@ class GoogleDriveResource(FileResource):
                 return False
             raise
 
-    @contextmanager
-    def open_file(self):
+    def _download_into(self, fp):
         service = self._get_cookie()
         metadata = service.files().get(fileId=self.handle.relative_path).execute()
         # Export and download Google-type files to pdf
@@ -95,21 +95,34 @@ class GoogleDriveResource(FileResource):
                 fileId=self.handle.relative_path,
                 fields='files(id, name)')
 
-        fh = BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
+        # MediaIoBaseDownload retrieves the file a chunk at a time with range
+        # requests, retrying chunks whose download fails
+        downloader = MediaIoBaseDownload(fp, request, chunksize=CHUNK_SIZE)
         done = False
         while done is False:
-            status, done = downloader.next_chunk()
+            status, done = downloader.next_chunk(num_retries=RESUME_TRIES)
 
-        # Seek(0) points back to the beginning of the file as it appears to not do this by it self.
-        fh.seek(0)
-        yield fh
+    @contextmanager
+    def open_file(self):
+        with spooled_file() as fh:
+            self._download_into(fh)
+            # Seek(0) points back to the beginning of the file as it appears to
+            # not do this by it self.
+            fh.seek(0)
+            yield fh
 
     @contextmanager
     def make_stream(self):
         with self.open_file() as res:
             yield res
 
+    @contextmanager
+    def make_path(self):
+        with NamedTemporaryResource(self.handle.name) as ntr:
+            with ntr.open("wb") as fp:
+                self._download_into(fp)
+            yield ntr.get_path()
+
     @property
     def metadata(self):
         if not self._metadata:
@@ -21,6 +21,12 @@ from .utilities import crawler
 logger = structlog.getLogger(__name__)
 TIMEOUT: int = engine2_settings.model["http"]["timeout"]
 TTL: int = engine2_settings.model["http"]["ttl"]
+FRONTIER: str = engine2_settings.model["http"]["frontier"]
+BLOOM_CAPACITY: int = engine2_settings.model["http"]["bloom_capacity"]
+CONCURRENCY: int = engine2_settings.model["http"]["concurrency"]
+HOST_CONNECTIONS: int = engine2_settings.model["http"]["host_connections"]
+HOST_DELAY: float = engine2_settings.model["http"]["host_delay"]
+ROBOTS_CRAWL_DELAY: bool = engine2_settings.model["http"]["robots_crawl_delay"]
 _equiv_domains = set({"www", "www2", "m", "ww1", "ww2", "en", "da", "secure"})
 # match whole words (\bWORD1\b | \bWORD2\b) and escape to handle metachars.
 # It is important to match whole words; www.magenta.dk should be .magenta.dk, not
@@ -129,6 +135,13 @@ class WebSource(Source):
                                f" ({session.headers['User-Agent']})"
                                " (+https://os2datascanner.dk/agent)"}
             )
+            if CONCURRENCY > 1:
+                # Keep enough connections to each host open for all of the
+                # crawler's threads
+                adapter = requests.adapters.HTTPAdapter(
+                        pool_maxsize=max(CONCURRENCY, HOST_CONNECTIONS))
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
             yield session
 
     def censor(self) -> "WebSource":
@@ -140,7 +153,15 @@ class WebSource(Source):
         session = sm.open(self)
         wc = crawler.WebCrawler(
                 self._url, session=session, timeout=TIMEOUT, ttl=TTL,
-                allow_element_hints=self._extended_hints)
+                priority=crawler.FRONTIER_ORDERS[FRONTIER],
+                seen=(crawler.BloomFilter(BLOOM_CAPACITY)
+                      if BLOOM_CAPACITY else None),
+                allow_element_hints=self._extended_hints,
+                concurrency=CONCURRENCY,
+                throttle=(crawler.HostThrottle(
+                        session, connections=HOST_CONNECTIONS,
+                        delay=HOST_DELAY, robots=ROBOTS_CRAWL_DELAY,
+                        timeout=TIMEOUT) if CONCURRENCY > 1 else None))
         if self._exclude:
             wc.exclude(*self._exclude)
 
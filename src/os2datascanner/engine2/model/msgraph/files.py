@@ -1,11 +1,24 @@
-from io import BytesIO
-from contextlib import contextmanager
+import logging
+from time import monotonic
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from dateutil.parser import isoparse
 from requests import HTTPError
 
-from ..core import Handle, Source, Resource, FileResource
+from ... import settings as engine2_settings
+from ..core import Handle, Source, Resource
 from ..derived.derived import DerivedSource
-from .utilities import MSGraphSource, warn_on_httperror
+from ..utilities.download import DownloadResource
+from .graphiti.builder import MSGraphURLBuilder
+from .graphiti.query_parameters import ODataQueryBuilder
+from .utilities import (
+        BATCH_SIZE, MSGraphSource, DeltaState, warn_on_httperror)
+
+
+logger = logging.getLogger(__name__)
+
+DELTA_DIR: str = engine2_settings.model["msgraph"]["delta_dir"]
+WALKERS: int = engine2_settings.model["msgraph"]["walkers"]
 
 
 class MSGraphFilesSource(MSGraphSource):
@@ -37,17 +50,19 @@ class MSGraphFilesSource(MSGraphSource):
                     yield self._make_drive_handle(drive)
         if self._user_drives:
             if self._userlist is None:
-                for user in self._list_users(sm):
-                    pn = user["userPrincipalName"]
-                    with warn_on_httperror(f"drive check for {pn}"):
-                        drive = sm.open(self).get("users/{0}/drive".format(pn)).json()
-                        yield self._make_drive_handle(drive)
-
+                pns = (user["userPrincipalName"]
+                       for user in self._list_users(sm))
             else:
-                for pn in self._userlist:
+                pns = iter(self._userlist)
+
+            # Look up several users' drives at once
+            while (chunk := list(islice(pns, BATCH_SIZE))):
+                responses = sm.open(self).batch_get(
+                        [f"users/{pn}/drive" for pn in chunk])
+                for pn, response in zip(chunk, responses):
                     with warn_on_httperror(f"drive check for {pn}"):
-                        drive = sm.open(self).get(f"users/{pn}/drive").json()
-                        yield self._make_drive_handle(drive)
+                        response.raise_for_status()
+                        yield self._make_drive_handle(response.json())
 
     def to_json_object(self):
         return dict(
@@ -130,6 +145,103 @@ class MSGraphDriveHandle(Handle):
                 obj["folder_name"], obj["owner_name"])
 
 
+class _DriveDelta:
+    """A _DriveDelta applies the items returned by a delta query for a drive
+    to the folder structure recorded in a DeltaState, producing handles for
+    the files whose paths are affected."""
+
+    def __init__(self, source: "MSGraphDriveSource", state: DeltaState):
+        self._source = source
+        self._state = state
+        # A cache of the paths of the folders we've seen, which is cleared
+        # whenever a folder is moved or deleted
+        self._folder_paths = {}
+
+    def path_of(self, iid):
+        """Returns the path of a recorded drive item, or None if it can't be
+        computed (because the item or one of its parents isn't known)."""
+        if iid in self._folder_paths:
+            return self._folder_paths[iid]
+        if not (item := self._state.get_item(iid)):
+            return None
+        parent, name, folder = item
+        if parent is None:
+            path = ""
+        elif (parent_path := self.path_of(parent)) is None:
+            return None
+        else:
+            path = f"{parent_path}/{name}" if parent_path else name
+        if folder:
+            self._folder_paths[iid] = path
+        return path
+
+    def files_under(self, iid):
+        for child, folder in self._state.children(iid):
+            if folder:
+                yield from self.files_under(child)
+            else:
+                yield child
+
+    def forget(self, iid):
+        for child, _ in self._state.children(iid):
+            self.forget(child)
+        self._state.remove_item(iid)
+
+    def handles_for(self, iids, weblink=None):
+        """Yields a handle for each of the given drive items whose path is
+        known."""
+        for iid in iids:
+            if (path := self.path_of(iid)) is not None:
+                yield MSGraphFileHandle(self._source, path, weblink=weblink)
+
+    def _has_moved(self, obj, old) -> bool:
+        parent = obj.get("parentReference", {}).get("id")
+        return bool(old) and old[:2] != (parent, obj["name"])
+
+    def _record(self, obj, folder: bool):
+        self._state.put_item(
+                obj["id"], obj.get("parentReference", {}).get("id"),
+                obj["name"], folder)
+
+    def deleted(self, obj):
+        iid = obj["id"]
+        if (old := self._state.get_item(iid)):
+            if old[2]:
+                yield from self.handles_for(self.files_under(iid))
+                self._folder_paths.clear()
+            else:
+                yield from self.handles_for([iid])
+        self.forget(iid)
+
+    def folder(self, obj):
+        iid = obj["id"]
+        moved = []
+        if self._has_moved(obj, self._state.get_item(iid)):
+            # This folder has been renamed or moved, so all of the files in it
+            # have new paths
+            moved = list(self.files_under(iid))
+            yield from self.handles_for(moved)
+        self._record(obj, True)
+        if moved:
+            self._folder_paths.clear()
+            yield from self.handles_for(moved)
+
+    def file(self, obj, deferred: list):
+        """Yields handles for a changed file (and for its old path, if it's
+        been moved), or adds it to the deferred list if its folder hasn't been
+        seen yet."""
+        iid = obj["id"]
+        if self._has_moved(obj, self._state.get_item(iid)):
+            # This file has been renamed or moved, so it's gone from its old
+            # path
+            yield from self.handles_for([iid])
+        self._record(obj, False)
+        if self.path_of(iid) is not None:
+            yield from self.handles_for([iid], obj.get("webUrl"))
+        else:
+            deferred.append((iid, obj.get("webUrl")))
+
+
 @Source.mime_handler(DUMMY_MIME)
 class MSGraphDriveSource(DerivedSource):
     type_label = "msgraph-drive"
@@ -138,28 +250,118 @@ class MSGraphDriveSource(DerivedSource):
         yield sm.open(self.handle.source)
 
     def handles(self, sm):
-
-        def _explore_folder(components, folder):
-            for obj in folder:
-                name = obj["name"]
-                if "file" in obj:
-                    web_url = obj.get("webUrl", None)
-                    yield MSGraphFileHandle(
-                            self, "/".join([] + components + [name]), weblink=web_url)
+        context = sm.scan_context
+        if DELTA_DIR and context and context.is_incremental:
+            with DeltaState.open(
+                    DELTA_DIR, context, self.handle.source._tenant_id,
+                    "drive", self.handle.relative_path) as state:
+                yield from self._handles_from_delta(sm, state)
+        else:
+            yield from self._handles_from_children(sm)
+
+    def _delta_pages(self, sm, state: DeltaState):
+        """Yields every page of the delta query for this drive, starting from
+        the recorded delta link if there is one, and records the new delta
+        link when the last page has been retrieved."""
+        if not (link := state.get_link()):
+            state.clear()
+            link = ODataQueryBuilder().select(
+                    "id,name,file,folder,root,deleted,parentReference,webUrl"
+            ).build(MSGraphURLBuilder().v1().drives(
+                    self.handle.relative_path).root().delta())
+        try:
+            result = sm.open(self).follow_next_link(link).json()
+        except HTTPError as ex:
+            if ex.response.status_code != 410 or not state.get_link():
+                raise
+            # The delta link has expired, so we have to start over
+            state.set_link(None)
+            yield from self._delta_pages(sm, state)
+            return
+
+        yield result["value"]
+        while "@odata.nextLink" in result:
+            result = sm.open(self).follow_next_link(
+                    result["@odata.nextLink"]).json()
+            yield result["value"]
+        state.set_link(result.get("@odata.deltaLink"))
+
+    def _handles_from_delta(self, sm, state: DeltaState):
+        """Yields a MSGraphFileHandle for every file in this drive that has
+        been created or changed since the last delta query, and for every
+        file that has been deleted (or that was moved away) since then."""
+        delta = _DriveDelta(self, state)
+        deferred = []
+        for page in self._delta_pages(sm, state):
+            for obj in page:
+                if "root" in obj:
+                    state.put_item(obj["id"], None, "", True)
+                elif "deleted" in obj:
+                    yield from delta.deleted(obj)
                 elif "folder" in obj:
-                    subfolder = sm.open(self).get(
-                            "/drives/{0}/items/{1}/children".format(
-                                    self.handle.relative_path,
-                                    obj["id"])).json()
-                    yield from _explore_folder(
-                            components + [name], subfolder["value"])
-        root = sm.open(self).get(
-                "drives/{0}/root/children".format(
-                        self.handle.relative_path)).json()["value"]
-        yield from _explore_folder([], root)
-
-
-class MSGraphFileResource(FileResource):
+                    yield from delta.folder(obj)
+                elif "file" in obj:
+                    yield from delta.file(obj, deferred)
+
+        for iid, weblink in deferred:
+            yield from delta.handles_for([iid], weblink)
+
+    def _handles_from_children(self, sm):  # noqa: CCR001
+        """Yields a handle for every file in this drive by listing the
+        children of each of its folders, following every page of each
+        listing. Up to WALKERS pages are retrieved at once, so files are not
+        necessarily produced in a predictable order."""
+        caller = sm.open(self)
+        drive = self.handle.relative_path
+
+        def _list_page(components, tail, is_link):
+            if is_link:
+                response = caller.follow_next_link(tail)
+            else:
+                response = caller.get(tail)
+            return components, response.json()
+
+        # The folder listings that haven't been started yet. (Treating this as
+        # a stack keeps it short: folders are explored before their siblings)
+        waiting = [((), f"drives/{drive}/root/children", False)]
+        running = set()
+        pages = items = 0
+        start = monotonic()
+        pool = ThreadPoolExecutor(
+                max(WALKERS, 1), thread_name_prefix="msgraph-walker")
+        try:
+            while waiting or running:
+                while waiting and len(running) < max(WALKERS, 1):
+                    running.add(pool.submit(_list_page, *waiting.pop()))
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    components, page = future.result()
+                    pages += 1
+                    if "@odata.nextLink" in page:
+                        waiting.append(
+                                (components, page["@odata.nextLink"], True))
+                    for obj in page["value"]:
+                        name = obj["name"]
+                        if "file" in obj:
+                            items += 1
+                            yield MSGraphFileHandle(
+                                    self, "/".join(components + (name,)),
+                                    weblink=obj.get("webUrl", None))
+                        elif "folder" in obj:
+                            waiting.append((
+                                    components + (name,),
+                                    f"drives/{drive}/items/{obj['id']}/children",
+                                    False))
+        finally:
+            pool.shutdown(cancel_futures=True)
+            elapsed = monotonic() - start
+            logger.info(
+                    f"listed {items} files ({pages} pages) of drive {drive}"
+                    f" in {elapsed:.1f} seconds"
+                    f" ({items / max(elapsed, 0.001):.1f} files per second)")
+
+
+class MSGraphFileResource(DownloadResource):
     def __init__(self, sm, handle):
         super().__init__(sm, handle)
         self._metadata = None
@@ -199,12 +401,9 @@ class MSGraphFileResource(FileResource):
     def get_size(self):
         return self.get_file_metadata()["size"]
 
-    @contextmanager
-    def make_stream(self):
-        response = self._get_cookie().get(
-                self.make_object_path() + ":/content")
-        with BytesIO(response.content) as fp:
-            yield fp
+    def open_download(self, headers):
+        return self._get_cookie().get_stream(
+                self.make_object_path() + ":/content", headers)
 
 
 class MSGraphFileHandle(Handle):
@@ -1,4 +1,5 @@
 from .baseclasses import AbstractGraphNode, EndpointNode
+from .delta import GraphDeltaNode
 
 
 class GraphDriveNode(EndpointNode):
@@ -84,6 +85,12 @@ class GraphRootNode(EndpointNode):
     def parent(self) -> AbstractGraphNode:
         return self._parent
 
+    def delta(self):
+        """
+        Adds the '/delta' endpoint to the URL.
+        """
+        return GraphDeltaNode(self)
+
 
 class GraphBundlesNode(EndpointNode):
     """
@@ -2,6 +2,7 @@
 '''
 
 from .baseclasses import AbstractGraphNode, EndpointNode
+from .delta import GraphDeltaNode
 from .extensions import GraphExtensionsNode
 
 
@@ -60,6 +61,12 @@ class GraphMessagesNode(EndpointNode):
         """
         return GraphAttachmentsNode(self, aid)
 
+    def delta(self):
+        """
+        Adds the '/delta' endpoint to the URL.
+        """
+        return GraphDeltaNode(self)
+
 
 class GraphAttachmentsNode(EndpointNode):
     """
@@ -1,18 +1,24 @@
 import logging
 
-from io import BytesIO
+from itertools import islice
 from urllib.parse import urlsplit
-from contextlib import contextmanager
 from dateutil.parser import isoparse
 from requests import HTTPError
 
 from ... import settings as engine2_settings
-from ..core import Handle, Source, Resource, FileResource
+from ..core import Handle, Source, Resource
 from ..derived.derived import DerivedSource
-from .utilities import MSGraphSource, warn_on_httperror, MailFSBuilder
+from ..utilities.download import DownloadResource
+from .graphiti.builder import MSGraphURLBuilder
+from .graphiti.query_parameters import ODataQueryBuilder
+from .utilities import (
+        BATCH_SIZE, MSGraphSource, DeltaState, warn_on_httperror,
+        MailFSBuilder)
 
 logger = logging.getLogger(__name__)
 
+DELTA_DIR: str = engine2_settings.model["msgraph"]["delta_dir"]
+
 
 class MSGraphMailSource(MSGraphSource):
     type_label = "msgraph-mail"
@@ -34,25 +40,23 @@ class MSGraphMailSource(MSGraphSource):
 
     def handles(self, sm):  # noqa
         if self._userlist is None:
-            for user in self._list_users(sm):
-                pn = user["userPrincipalName"]  # e.g. dan@contoso.onmicrosoft.com
+            # e.g. dan@contoso.onmicrosoft.com
+            pns = (user["userPrincipalName"] for user in self._list_users(sm))
+        else:
+            pns = iter(self._userlist)
+
+        # Check several accounts at once
+        while (chunk := list(islice(pns, BATCH_SIZE))):
+            responses = sm.open(self).batch_get(
+                    [f"users/{pn}/messages?$select=id&$top=1" for pn in chunk])
+            for pn, response in zip(chunk, responses):
                 # Getting a HTTP 404 response from the /messages endpoint means
                 # that this user doesn't have a mail account at all
                 with warn_on_httperror(f"mail check for {pn}"):
-                    any_mails = sm.open(self).get(
-                        "users/{0}/messages?$select=id&$top=1".format(pn)).json()
-                    if not any_mails["value"]:
-                        # This user has a mail account that contains no mails
-                        continue
-                    else:
-                        yield MSGraphMailAccountHandle(self, pn)
-
-        else:
-            for pn in self._userlist:
-                with warn_on_httperror(f"mail check for {pn}"):
-                    any_mails = sm.open(self).get(
-                        "users/{0}/messages?$select=id&$top=1".format(pn)).json()
-                    if any_mails["value"]:
+                    response.raise_for_status()
+                    # (... and an empty response means that this user has a
+                    # mail account that contains no mails)
+                    if response.json()["value"]:
                         yield MSGraphMailAccountHandle(self, pn)
 
     def to_json_object(self):
@@ -148,8 +152,38 @@ class MSGraphMailAccountSource(DerivedSource):
         pn = self.handle.relative_path
         ps = engine2_settings.model["msgraph"]["page_size"]
         builder = MailFSBuilder(self, sm, pn)
+        excluded = self._excluded_folders(sm)
+
+        context = sm.scan_context
+        if DELTA_DIR and context and context.is_incremental:
+            with DeltaState.open(
+                    DELTA_DIR, context, self.handle.source._tenant_id,
+                    "mailbox", pn) as state:
+                yield from self._handles_from_delta(
+                        sm, state, builder, excluded)
+            return
+
         query = f"users/{pn}/messages?$select=id,subject,webLink,parentFolderId&$top={ps}"
-        filters = []
+        filters = [f"parentFolderId ne '{fid}'" for fid in excluded]
+        if filters:
+            query += f"&$filter={' and '.join(filters)}"
+
+        # If there is no syncissues folder, and we do want the deleted mail folder,
+        # we can potentially hit filters without having declared the result variable.
+        result = sm.open(self).get(query).json()
+
+        yield from (self._wrap(msg, builder) for msg in result["value"])
+        # We want to get all emails for given account
+        # This key takes us to the next page and is only present
+        # as long as there is one.
+        while '@odata.nextLink' in result:
+            result = sm.open(self).follow_next_link(result["@odata.nextLink"]).json()
+            yield from (self._wrap(msg, builder) for msg in result["value"])
+
+    def _excluded_folders(self, sm) -> list[str]:
+        """Returns the IDs of the mail folders that shouldn't be scanned."""
+        pn = self.handle.relative_path
+        excluded = []
 
         # The base query gets everything, including the deleted and syncissues folders,
         # but don't always want this.
@@ -164,8 +198,7 @@ class MSGraphMailAccountSource(DerivedSource):
             del_post_folder_id = sm.open(self).get(
                 f"users/{pn}/mailFolders/deleteditems?$select=id").json().get("id")
 
-            # Exclude deleted post by issuing a 'not equal to' (ne) filter query
-            filters.append(f"parentFolderId ne '{del_post_folder_id}'")
+            excluded.append(del_post_folder_id)
 
         if not self.handle.source.scan_syncissues_folder:
             # Find folder id of syncissues for given mail account
@@ -174,24 +207,55 @@ class MSGraphMailAccountSource(DerivedSource):
                 sync_issue_folder_id = sm.open(self).get(
                     f"users/{pn}/mailFolders/syncissues?$select=id").json().get("id")
 
-                filters.append(f"parentFolderId ne '{sync_issue_folder_id}'")
+                excluded.append(sync_issue_folder_id)
             except Exception:
                 logger.warning("Syncissues folder does not exist", exc_info=True)
 
-        if filters:
-            query += f"&$filter={' and '.join(filters)}"
+        return excluded
 
-        # If there is no syncissues folder, and we do want the deleted mail folder,
-        # we can potentially hit filters without having declared the result variable.
-        result = sm.open(self).get(query).json()
+    def _handles_from_delta(  # noqa: CCR001
+            self, sm, state: DeltaState, builder: MailFSBuilder,
+            excluded: list[str]):
+        """Yields a MSGraphMailMessageHandle for every message that has been
+        created, changed or removed since the last delta query of each mail
+        folder in this account."""
+        pn = self.handle.relative_path
 
-        yield from (self._wrap(msg, builder) for msg in result["value"])
-        # We want to get all emails for given account
-        # This key takes us to the next page and is only present
-        # as long as there is one.
-        while '@odata.nextLink' in result:
-            result = sm.open(self).follow_next_link(result["@odata.nextLink"]).json()
-            yield from (self._wrap(msg, builder) for msg in result["value"])
+        def _initial_link(fid):
+            return ODataQueryBuilder().select(
+                    "id,subject,webLink,parentFolderId"
+            ).build(MSGraphURLBuilder().v1().users(pn).mail_folders(
+                    fid).messages().delta())
+
+        for fid in builder.folder_ids:
+            if fid in excluded:
+                continue
+            link = state.get_link(fid)
+            with warn_on_httperror(f"mail folder delta query for {pn}"):
+                try:
+                    result = sm.open(self).follow_next_link(
+                            link or _initial_link(fid)).json()
+                except HTTPError as ex:
+                    if ex.response.status_code != 410 or not link:
+                        raise
+                    # The delta link has expired, so we have to start over
+                    result = sm.open(self).follow_next_link(
+                            _initial_link(fid)).json()
+
+                while True:
+                    for msg in result["value"]:
+                        if "@removed" in msg:
+                            # Let the processor report this message as
+                            # missing
+                            yield MSGraphMailMessageHandle(
+                                    self, msg["id"], None, None)
+                        else:
+                            yield self._wrap(msg, builder)
+                    if "@odata.nextLink" not in result:
+                        break
+                    result = sm.open(self).follow_next_link(
+                            result["@odata.nextLink"]).json()
+                state.set_link(result.get("@odata.deltaLink"), fid)
 
     def _wrap(self, message, builder: MailFSBuilder):
         fid = message["parentFolderId"]
@@ -213,7 +277,7 @@ class MSGraphMailAccountSource(DerivedSource):
                         user))
 
 
-class MSGraphMailMessageResource(FileResource):
+class MSGraphMailMessageResource(DownloadResource):
     def __init__(self, handle, sm):
         super().__init__(handle, sm)
         self._message = None
@@ -245,12 +309,9 @@ class MSGraphMailMessageResource(FileResource):
                                               "sentDateTime,isDraft,categories").json()
         return self._message
 
-    @contextmanager
-    def make_stream(self):
-        response = self._get_cookie().get(
-                self.make_object_path() + "/$value")
-        with BytesIO(response.content) as fp:
-            yield fp
+    def open_download(self, headers):
+        return self._get_cookie().get_stream(
+                self.make_object_path() + "/$value", headers)
 
     def get_size(self):
         # XXX: there's no obvious way to implement this, but is this a problem?
@@ -1,16 +1,28 @@
+from datetime import datetime
 from dataclasses import dataclass
 from contextlib import contextmanager
+from typing import Optional
+from time import sleep, monotonic
+import os
+import json
+import sqlite3
+import hashlib
 import logging
 import requests
+import threading
 
 from os2datascanner.utils.oauth2 import mint_cc_token
 from os2datascanner.engine2 import settings as engine2_settings
 from os2datascanner.engine2.utilities.backoff import WebRetrier
 
-from ..core import Source
+from ..core import Source, ScanContext
 
 logger = logging.getLogger(__name__)
 
+# The Graph API accepts at most 20 requests in a single $batch call
+BATCH_SIZE: int = min(engine2_settings.model["msgraph"]["batch_size"], 20)
+BATCH_TRIES: int = 5
+
 
 def make_token(client_id, tenant_id, client_secret):
     return mint_cc_token(
@@ -69,20 +81,95 @@ class MSGraphSource(Source):
             self._token = token_creator()
 
             self._session = session or requests
+            self._throttle = _Throttle()
 
         def _make_headers(self):
             return {
                 "authorization": "Bearer {0}".format(self._token),
             }
 
+        def _throttled_get(self, *args, **kwargs):
+            self._throttle.wait()
+            return self._throttle.observe(self._session.get(*args, **kwargs))
+
+        def _throttled_post(self, *args, **kwargs):
+            self._throttle.wait()
+            return self._throttle.observe(self._session.post(*args, **kwargs))
+
         @raw_request_decorator
         def get(self, tail, timeout=engine2_settings.model["msgraph"]["timeout"]):
             return WebRetrier().run(
-                self._session.get,
+                self._throttled_get,
                 "https://graph.microsoft.com/v1.0/{0}".format(tail),
                 headers=self._make_headers(),
                 timeout=timeout)
 
+        @raw_request_decorator
+        def get_stream(self, tail, headers=None):
+            """Performs a GET request on a MSGraph endpoint without reading
+            the content of the response, which can then be read a chunk at a
+            time with iter_content (see model.utilities.download)."""
+            return WebRetrier().run(
+                self._throttled_get,
+                "https://graph.microsoft.com/v1.0/{0}".format(tail),
+                headers=self._make_headers() | (headers or {}),
+                timeout=engine2_settings.model["msgraph"]["timeout"],
+                stream=True)
+
+        @raw_request_decorator
+        def _post_batch(self, body):
+            return WebRetrier().run(
+                self._throttled_post,
+                "https://graph.microsoft.com/v1.0/$batch",
+                headers=self._make_headers(), json=body,
+                timeout=engine2_settings.model["msgraph"]["timeout"])
+
+        def batch_get(self, tails: list[str]) -> list[requests.Response]:
+            """Performs GET requests on several MSGraph endpoints, combining
+            them into as few $batch calls as possible, and returns their
+            responses in order. (Unlike get, this method doesn't raise an
+            exception for responses with error status codes.)
+
+            Requests in a batch that are throttled by the server are retried
+            on their own, after waiting for as long as the server asks."""
+            if len(tails) == 1 or BATCH_SIZE <= 1:
+                responses = []
+                for tail in tails:
+                    try:
+                        responses.append(self.get(tail))
+                    except requests.exceptions.HTTPError as ex:
+                        responses.append(ex.response)
+                return responses
+
+            results = [None] * len(tails)
+            for start in range(0, len(tails), BATCH_SIZE):
+                pending = list(range(start, min(start + BATCH_SIZE, len(tails))))
+                for attempt in range(BATCH_TRIES):
+                    reply = self._post_batch({"requests": [
+                            {
+                                "id": str(i), "method": "GET",
+                                "url": requests.utils.requote_uri(
+                                        "/" + tails[i])
+                            } for i in pending]}).json()
+
+                    throttled, delay = [], 0.0
+                    for item in reply["responses"]:
+                        i = int(item["id"])
+                        results[i] = _make_batch_response(item, tails[i])
+                        if results[i].status_code in WebRetrier.RETRY_CODES:
+                            self._throttle.observe(results[i])
+                            throttled.append(i)
+                            try:
+                                delay = max(delay, float(
+                                        results[i].headers["retry-after"]))
+                            except (KeyError, ValueError):
+                                delay = max(delay, 2.0 ** attempt)
+                    pending = throttled
+                    if not pending or attempt == BATCH_TRIES - 1:
+                        break
+                    sleep(delay)
+            return results
+
         def paginated_get(self, endpoint: str):
             """ Performs a GET request on specified MSGraph endpoint and
             uses generators to go through pages if response is paginated.
@@ -151,7 +238,7 @@ class MSGraphSource(Source):
         @raw_request_decorator
         def follow_next_link(self, next_page):
             return WebRetrier().run(
-                self._session.get,
+                self._throttled_get,
                 next_page,
                 headers=self._make_headers())
 
@@ -164,6 +251,45 @@ class MSGraphSource(Source):
         )
 
 
+def _make_batch_response(item: dict, tail: str) -> requests.Response:
+    """Converts an individual response from a $batch call into a
+    requests.Response."""
+    response = requests.Response()
+    response.status_code = item["status"]
+    response.headers = requests.structures.CaseInsensitiveDict(
+            item.get("headers", {}))
+    body = item.get("body")
+    response._content = json.dumps(body).encode() if body is not None else b""
+    response.encoding = "utf-8"
+    response.url = f"https://graph.microsoft.com/v1.0/{tail}"
+    return response
+
+
+class _Throttle:
+    """A _Throttle makes every thread using a GraphCaller back off when the
+    server asks any one of them to, instead of letting the others carry on
+    sending requests that will also be throttled."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._until = 0.0
+
+    def wait(self):
+        delay = self._until - monotonic()
+        if delay > 0:
+            sleep(delay)
+
+    def observe(self, response: requests.Response) -> requests.Response:
+        if response.status_code in WebRetrier.RETRY_CODES:
+            try:
+                delay = float(response.headers["retry-after"])
+            except (KeyError, ValueError):
+                return response
+            with self._lock:
+                self._until = max(self._until, monotonic() + delay)
+        return response
+
+
 @contextmanager
 def warn_on_httperror(label):
     """Logs a warning and continues execution if a HTTPError is raised during
@@ -235,6 +361,11 @@ class MailFSBuilder:
         if len(recursion_stack) > 0:
             self._recurse_child_folders(recursion_stack)
 
+    @property
+    def folder_ids(self) -> list[str]:
+        """The IDs of all of the mail folders in this account."""
+        return list(self._folder_map)
+
     def build_path(self, fid):
         """Builds a folder path given an fid"""
         root = self._folder_map.get(fid, None)
@@ -252,6 +383,103 @@ class MailFSBuilder:
         return _reverse_traverse(root)
 
 
+class DeltaState:
+    """A DeltaState stores the delta links returned by the Microsoft Graph
+    API's delta queries for a drive or a mailbox -- and, for drives, enough of
+    the folder structure to compute the paths of changed and deleted items --
+    so that the next exploration by the same scanner only needs to ask for
+    what's changed.
+
+    DeltaStates are SQLite databases. Changes made to them only take effect
+    if the body of the DeltaState.open context finishes normally."""
+
+    def __init__(self, db: sqlite3.Connection):
+        self._db = db
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS links (
+                key TEXT PRIMARY KEY, link TEXT);
+            CREATE TABLE IF NOT EXISTS items (
+                id TEXT PRIMARY KEY, parent TEXT, name TEXT, folder INTEGER);
+            CREATE INDEX IF NOT EXISTS items_parent ON items (parent);
+            CREATE TABLE IF NOT EXISTS taken (time TEXT);
+        """)
+
+    @staticmethod
+    @contextmanager
+    def open(directory: str, context: ScanContext, *key: str):
+        """Opens (or creates) the DeltaState identified by the given key
+        components and the scanner of an incremental scan in a directory.
+
+        If the DeltaState was last updated by a scan that started after the
+        given scan's modified_after time -- that is, by a scan that might not
+        have finished -- then it's cleared, and all delta queries start over.
+        The DeltaState then records that it was updated by the given scan."""
+        os.makedirs(directory, exist_ok=True)
+        name = hashlib.sha256(
+                "/".join((context.scanner,) + key).encode()).hexdigest()
+        db = sqlite3.connect(os.path.join(directory, f"delta-{name}.sqlite3"))
+        try:
+            state = DeltaState(db)
+            if not state._taken_before(context.modified_after):
+                state.clear()
+            db.execute("DELETE FROM taken")
+            db.execute(
+                    "INSERT INTO taken VALUES (?)", (context.time.isoformat(),))
+            yield state
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _taken_before(self, time: datetime) -> bool:
+        row = self._db.execute("SELECT time FROM taken").fetchone()
+        try:
+            return bool(row) and datetime.fromisoformat(row[0]) <= time
+        except (ValueError, TypeError):
+            return False
+
+    def get_link(self, key: str = "") -> Optional[str]:
+        row = self._db.execute(
+                "SELECT link FROM links WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_link(self, link: Optional[str], key: str = ""):
+        if link:
+            self._db.execute(
+                    "INSERT OR REPLACE INTO links VALUES (?, ?)", (key, link))
+        else:
+            self._db.execute("DELETE FROM links WHERE key = ?", (key,))
+
+    def get_item(self, iid: str) -> Optional[tuple[str, str, bool]]:
+        """Returns the parent ID, name, and folder flag of a recorded drive
+        item, or None if the item isn't known."""
+        row = self._db.execute(
+                "SELECT parent, name, folder FROM items WHERE id = ?",
+                (iid,)).fetchone()
+        return (row[0], row[1], bool(row[2])) if row else None
+
+    def put_item(self, iid: str, parent: Optional[str], name: str,
+                 folder: bool):
+        self._db.execute(
+                "INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?)",
+                (iid, parent, name, folder))
+
+    def remove_item(self, iid: str):
+        self._db.execute("DELETE FROM items WHERE id = ?", (iid,))
+
+    def children(self, iid: str) -> list[tuple[str, bool]]:
+        """Returns the IDs and folder flags of the recorded children of a
+        drive item."""
+        return [(row[0], bool(row[1])) for row in self._db.execute(
+                "SELECT id, folder FROM items WHERE parent = ?", (iid,))]
+
+    def clear(self):
+        self._db.execute("DELETE FROM links")
+        self._db.execute("DELETE FROM items")
+
+
 @dataclass
 class MailFolder:
     """Object to represent a mail folder in MS Graph."""
@@ -1,9 +1,15 @@
 import io
+import os
 from os import stat_result, O_RDONLY
 import enum
+import json
+import time
+import hashlib
 import logging
 import smbc
+import threading
 from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote
 from pathlib import PureWindowsPath
 from datetime import datetime
@@ -12,13 +18,14 @@ import warnings
 from functools import reduce
 from contextlib import contextmanager
 
+from .. import settings as engine2_settings
 from ..utilities.backoff import DefaultRetrier
 from ..conversions.types import OutputType
 from ..conversions.utilities.navigable import make_values_navigable
 from .smb import (
     make_smb_url, compute_domain,
     make_full_windows_path, make_presentation_url)
-from .core import Source, Handle, FileResource
+from .core import Source, Handle, FileResource, ScanContext
 from .core.errors import UncontactableError
 from .file import stat_attributes
 
@@ -26,6 +33,12 @@ import errno
 
 logger = logging.getLogger(__name__)
 
+WALKERS: int = engine2_settings.model["smbc"]["walkers"]
+QUEUE_SIZE: int = engine2_settings.model["smbc"]["queue_size"]
+CHECKPOINT_DIR: str = engine2_settings.model["smbc"]["checkpoint_dir"]
+CHECKPOINT_INTERVAL: int = engine2_settings.model["smbc"]["checkpoint_interval"]
+CHECKPOINT_MAX_AGE: int = engine2_settings.model["smbc"]["checkpoint_max_age"]
+
 XATTR_DOS_ATTRIBUTES = "system.dos_attr.mode"
 """The attribute name for a file's mode flags. (This is not documented in
 pysmbc, but it is in the underlying libsmbclient library.)"""
@@ -169,8 +182,35 @@ class SMBCSource(Source):
             # owner
             return None
 
-    def handles(self, sm):  # noqa: C901,E501,CCR001
+    def _open_root(self, url, context):
+        try:
+            return context.opendir(url)
+        except ValueError as ex:
+            code = ex.args[0]
+            if code == errno.EINVAL:
+                raise UncontactableError(self._unc) from ex
+            else:
+                raise ex
+
+    def handles(self, sm):
         url, context = sm.open(self)
+        if WALKERS > 1 or CHECKPOINT_DIR:
+            walker = _SMBCWalker(
+                    self, url, context,
+                    lambda: smbc.Context(auth_fn=self.__auth_handler),
+                    workers=WALKERS, queue_size=QUEUE_SIZE,
+                    checkpoint=(
+                            _SMBCCheckpoint.for_scan(
+                                    self, sm.scan_context, CHECKPOINT_DIR)
+                            if CHECKPOINT_DIR and sm.scan_context else None))
+            try:
+                yield from walker.walk()
+            finally:
+                sm.skipped_objects += walker.skipped
+        else:
+            yield from self._walk_sequentially(url, context)
+
+    def _walk_sequentially(self, url, context):  # noqa: C901,E501,CCR001
 
         def handle_dirent(parents, entity, owner_sid: str = None):
             name = entity.name
@@ -207,14 +247,7 @@ class SMBCSource(Source):
             elif entity.smbc_type == smbc.FILE:
                 yield handle_here
 
-        try:
-            obj = context.opendir(url)
-        except ValueError as ex:
-            code = ex.args[0]
-            if code == errno.EINVAL:
-                raise UncontactableError(self._unc) from ex
-            else:
-                raise ex
+        obj = self._open_root(url, context)
 
         # Iterate over every folder lying directly under the provided UNC
         for dent in obj.getdents():
@@ -257,6 +290,244 @@ class SMBCSource(Source):
                 unc_is_home_root=obj.get("unc_is_home_root", False))
 
 
+class _SMBCCheckpoint:
+    """A _SMBCCheckpoint records how far the exploration of a SMBCSource has
+    got in a file, so that an explorer that's restarted in the middle of a
+    big share can carry on from where it was instead of starting over.
+
+    Checkpoints are identified by the scan and the Source they belong to, so
+    only a redelivered exploration of the same scan resumes from one, and are
+    removed when the exploration is complete. (Checkpoints older than
+    CHECKPOINT_MAX_AGE seconds are assumed to belong to an abandoned scan, and
+    are ignored.)
+
+    A checkpoint is saved as soon as the explorer asks for the object after
+    the one it records, which is before the messages about the objects up to
+    that point are certain to have reached the broker. If the explorer dies in
+    between, those objects won't be scanned again when it resumes; this is
+    the price of not having to track publisher confirms back to the walk."""
+
+    def __init__(self, path: str):
+        self._path = path
+
+    @classmethod
+    def for_scan(
+            cls, source: "SMBCSource", context: ScanContext, directory: str):
+        key = hashlib.sha256(json.dumps(
+                [context.tag, source.to_json_object()],
+                sort_keys=True).encode()).hexdigest()
+        return cls(os.path.join(directory, f"smbc-{key}.json"))
+
+    def load(self) -> Optional[tuple[tuple[str, ...], int]]:
+        """Returns the path components of the last object recorded by this
+        checkpoint and the number of objects produced up to and including it,
+        or None if there isn't a usable checkpoint."""
+        try:
+            if time.time() - os.stat(self._path).st_mtime > CHECKPOINT_MAX_AGE:
+                return None
+            with open(self._path, "rt") as fp:
+                state = json.load(fp)
+            return tuple(state["path"]), int(state.get("count", 0))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def save(self, path: tuple[str, ...], count: int):
+        try:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            with open(self._path + ".tmp", "wt") as fp:
+                json.dump({"path": path, "count": count}, fp)
+            os.replace(self._path + ".tmp", self._path)
+        except OSError:
+            logger.warning(
+                    f"couldn't save exploration checkpoint {self._path}",
+                    exc_info=True)
+
+    def clear(self):
+        try:
+            os.unlink(self._path)
+        except FileNotFoundError:
+            pass
+
+
+class _Directory:
+    """A directory whose entries are being walked by a _SMBCWalker."""
+    __slots__ = ("path", "owner_sid", "entries", "position", "prefetched",)
+
+    def __init__(self, path, owner_sid, entries):
+        self.path = path
+        self.owner_sid = owner_sid
+        self.entries = entries
+        # The index of the next entry to yield or descend into...
+        self.position = 0
+        # ... and of the next entry to consider for prefetching
+        self.prefetched = 0
+
+
+class _SMBCWalker:
+    """A _SMBCWalker explores a SMBCSource, listing several directories at
+    once on separate libsmbclient contexts (and so separate connections).
+
+    Although directories are listed in the background, entries are still
+    produced in a stable depth-first order, with the entries of each directory
+    sorted by name; only a bounded number of directory listings are fetched
+    ahead of the point the walk has reached. This order also makes it possible
+    to resume a walk from a checkpoint: after a restart, everything up to and
+    including the last recorded object is skipped. (Objects produced after the
+    last checkpoint was saved will be produced again.) The number of objects
+    skipped in this way is available as the skipped attribute once the walk
+    has started, so that the caller can still report a total for the whole
+    Source."""
+
+    def __init__(
+            self, source: "SMBCSource", url: str, context,
+            make_context, *, workers: int, queue_size: int,
+            checkpoint: Optional[_SMBCCheckpoint] = None):
+        self._source = source
+        self._url = url
+        self._context = context
+        self._make_context = make_context
+        self._workers = max(workers, 1)
+        self._queue_size = max(queue_size, 1)
+        self._checkpoint = checkpoint
+        self.skipped = 0
+
+        self._local = threading.local()
+        self._listings = {}
+
+    def _read_directory(self, context, path: tuple[str, ...]):
+        """Lists a directory, returning its subdirectories and files as a
+        sorted list of (name, is_directory) pairs, along with the exception
+        that prevented it from being listed, if that should be reported."""
+        url_here = "/".join((self._url,) + path)
+        if not path:
+            dents = self._source._open_root(url_here, context).getdents()
+        else:
+            try:
+                dents = context.opendir(url_here).getdents()
+            except MemoryError as e:
+                # A memory error here means that the path is using deprecated
+                # encoding. Skip the path and keep going!
+                logger.warning(
+                        f"Skipping handle with memory error at {url_here}")
+                return [], e
+            except (ValueError, *IGNORABLE_SMBC_EXCEPTIONS):
+                return [], None
+
+        entries = []
+        for dent in dents:
+            name = dent.name
+            if (name in (".", "..",)
+                    or dent.smbc_type not in (smbc.DIR, smbc.FILE,)):
+                continue
+            elif (self._source._skip_super_hidden
+                    and SMBCSource.is_skippable(
+                            context, url_here + "/" + name,
+                            "/".join(path + (name,)), name)):
+                continue
+            entries.append((name, dent.smbc_type == smbc.DIR))
+        entries.sort()
+        return entries, None
+
+    def _list_in_background(self, path: tuple[str, ...]):
+        if not hasattr(self._local, "context"):
+            self._local.context = self._make_context()
+        return self._read_directory(self._local.context, path)
+
+    @staticmethod
+    def _enter(path, owner_sid, entries, resume_from):
+        if resume_from:
+            def _wanted(entry):
+                name, is_dir = entry
+                here = path + (name,)
+                # Skip everything that comes before the checkpoint, apart from
+                # the directories that contain it
+                return (here > resume_from
+                        or (is_dir and resume_from[:len(here)] == here
+                            and here != resume_from))
+            entries = list(filter(_wanted, entries))
+        return _Directory(path, owner_sid, entries)
+
+    def _prefetch(self, pool, stack: list[_Directory]):
+        """Starts listing the directories that the walk will reach soonest,
+        until the queue of pending listings is full."""
+        for directory in reversed(stack):
+            directory.prefetched = max(
+                    directory.prefetched, directory.position)
+            while (len(self._listings) < self._queue_size
+                    and directory.prefetched < len(directory.entries)):
+                name, is_dir = directory.entries[directory.prefetched]
+                directory.prefetched += 1
+                if is_dir:
+                    path = directory.path + (name,)
+                    self._listings[path] = pool.submit(
+                            self._list_in_background, path)
+            if len(self._listings) >= self._queue_size:
+                break
+
+    def walk(self):  # noqa: CCR001
+        resume_from = None
+        if self._checkpoint and (state := self._checkpoint.load()):
+            resume_from, self.skipped = state
+            logger.info(
+                    f"resuming exploration of {self._url}"
+                    f" after {'/'.join(resume_from)}")
+
+        entries, _ = self._read_directory(self._context, ())
+        stack = [self._enter((), None, entries, resume_from)]
+        # (This counts the skipped objects, too, so that the checkpoints
+        # record the number of objects produced by the whole walk)
+        yielded = self.skipped
+
+        pool = ThreadPoolExecutor(
+                self._workers, thread_name_prefix="smbc-walker")
+        try:
+            self._prefetch(pool, stack)
+            while stack:
+                directory = stack[-1]
+                if directory.position == len(directory.entries):
+                    stack.pop()
+                    continue
+                name, is_dir = directory.entries[directory.position]
+                directory.position += 1
+
+                here = directory.path + (name,)
+                owner_sid = directory.owner_sid
+                if not directory.path and self._source._unc_is_home_root:
+                    # If we know that the provided UNC is a folder containing
+                    # user home folders, then compute the owner of each folder
+                    # here so SMBCResource doesn't have to retrieve ownership
+                    # metadata for individual files
+                    owner_sid = self._source._get_owner_for(
+                            self._url, self._context, name)
+                hints = {"owner_sid": owner_sid} if owner_sid else {}
+                handle = SMBCHandle(self._source, "/".join(here), hints=hints)
+
+                if is_dir:
+                    future = (self._listings.pop(here, None)
+                              or pool.submit(self._list_in_background, here))
+                    entries, error = future.result()
+                    if error:
+                        yield (handle, error)
+                    else:
+                        stack.append(self._enter(
+                                here, owner_sid, entries, resume_from))
+                    self._prefetch(pool, stack)
+                else:
+                    yield handle
+                    yielded += 1
+                    if self._checkpoint and yielded % CHECKPOINT_INTERVAL == 0:
+                        self._checkpoint.save(here, yielded)
+        finally:
+            self._listings.clear()
+            pool.shutdown(cancel_futures=True)
+            # Make sure that no references to the worker threads' contexts
+            # survive (see SMBCSource._generate_state)
+            self._local = threading.local()
+
+        if self._checkpoint:
+            self._checkpoint.clear()
+
+
 class _SMBCFile(io.RawIOBase):
     def __init__(self, obj):
         self._file = obj
@@ -1,26 +1,187 @@
 import re
+import math
+import heapq
+import weakref
+import hashlib
+import itertools
+import threading
 from abc import ABC, abstractmethod
+from time import monotonic, sleep
+from contextlib import contextmanager
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from lxml.html import HtmlElement, document_fromstring
 from lxml.etree import ParserError
 from urllib.parse import urlsplit, urlunsplit, SplitResult
+from urllib.robotparser import RobotFileParser
 import logging
 import requests
+from prometheus_client import REGISTRY
+from prometheus_client.core import GaugeMetricFamily
 
 from os2datascanner.engine2.conversions.types import Link
 from ...utilities.backoff import WebRetrier
+from ...utilities.datetime import parse_datetime
 
 logger = logging.getLogger(__name__)
 
 
+def _digest(obj, size: int) -> bytes:
+    if not isinstance(obj, str):
+        obj = repr(obj)
+    return hashlib.blake2b(
+            obj.encode("utf-8", "surrogatepass"), digest_size=size).digest()
+
+
+class FingerprintSet:
+    """A FingerprintSet remembers objects by a 64-bit hash of their (string)
+    form rather than by the objects themselves. The chance of two distinct
+    URLs colliding is negligible even for millions of entries, and each entry
+    is much smaller than the URL it stands for."""
+
+    def __init__(self):
+        self._fingerprints = set()
+
+    def add(self, obj):
+        self._fingerprints.add(int.from_bytes(_digest(obj, 8), "little"))
+
+    def __contains__(self, obj):
+        return int.from_bytes(
+                _digest(obj, 8), "little") in self._fingerprints
+
+    def __len__(self):
+        return len(self._fingerprints)
+
+
+class BloomFilter:
+    """A BloomFilter remembers objects in a fixed-size bit array. It never
+    forgets an object that has been added to it, but it may (with a
+    probability of about error_rate, once capacity objects have been added)
+    claim to remember one that hasn't been."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self._bits_n = max(8, math.ceil(
+                -capacity * math.log(error_rate) / math.log(2) ** 2))
+        self._hashes_n = max(1, round(self._bits_n / capacity * math.log(2)))
+        self._bits = bytearray((self._bits_n + 7) // 8)
+        self._count = 0
+
+    def _positions(self, obj):
+        digest = _digest(obj, 16)
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self._hashes_n):
+            yield (h1 + i * h2) % self._bits_n
+
+    def add(self, obj):
+        for p in self._positions(obj):
+            self._bits[p >> 3] |= 1 << (p & 7)
+        self._count += 1
+
+    def __contains__(self, obj):
+        return all(
+                self._bits[p >> 3] & (1 << (p & 7))
+                for p in self._positions(obj))
+
+    def __len__(self):
+        return self._count
+
+
+def by_depth(obj, ttl: int, hints) -> int:
+    """A Frontier priority function that visits objects closer to the start
+    of the crawl (i.e., with more of their TTL left) first."""
+    return -ttl
+
+
+def by_freshness(obj, ttl: int, hints) -> tuple[int, float]:
+    """A Frontier priority function that visits objects marked as fresh by a
+    sitemap first, most recently modified first."""
+    timestamp = 0.0
+    if (lm := hints.get("last_modified")):
+        try:
+            timestamp = parse_datetime(lm).timestamp()
+        except (ValueError, OverflowError):
+            pass
+    return (0 if hints.get("fresh") else 1, -timestamp)
+
+
+FRONTIER_ORDERS = {
+    "fifo": None,
+    "depth": by_depth,
+    "freshness": by_freshness,
+}
+
+
+class Frontier:
+    """A Frontier is the queue of objects that a Crawler has yet to visit.
+
+    Without a priority function, objects are visited in the order in which
+    they were added. With one, objects with lower priority values are visited
+    first (and objects with the same priority in the order in which they were
+    added)."""
+
+    def __init__(self, priority=None):
+        self._priority = priority
+        self._queue = [] if priority else deque()
+        self._counter = itertools.count()
+
+    def push(self, obj, ttl: int, hints):
+        if self._priority:
+            heapq.heappush(
+                    self._queue,
+                    (self._priority(obj, ttl, hints), next(self._counter),
+                     (obj, ttl, hints)))
+        else:
+            self._queue.append((obj, ttl, hints))
+
+    def pop(self):
+        if self._priority:
+            return heapq.heappop(self._queue)[-1]
+        else:
+            return self._queue.popleft()
+
+    def __len__(self):
+        return len(self._queue)
+
+
+_live_crawlers = weakref.WeakSet()
+
+
+class _CrawlerCollector:
+    def collect(self):
+        crawlers = list(_live_crawlers)
+        frontier = GaugeMetricFamily(
+                "os2datascanner_crawler_frontier_size",
+                "Objects waiting to be visited by web crawlers")
+        frontier.add_metric([], sum(len(c.frontier) for c in crawlers))
+        yield frontier
+
+        seen = GaugeMetricFamily(
+                "os2datascanner_crawler_seen_size",
+                "Objects remembered as seen by web crawlers")
+        seen.add_metric([], sum(len(c.seen) for c in crawlers))
+        yield seen
+
+
+REGISTRY.register(_CrawlerCollector())
+
+
 class Crawler(ABC):
-    """A Crawler recursively explores objects."""
+    """A Crawler recursively explores objects.
 
-    def __init__(self, ttl=10):
+    Objects waiting to be visited are kept in a Frontier, ordered by the given
+    priority function (see FRONTIER_ORDERS). Objects that have already been
+    added are remembered in the seen collection, which is a FingerprintSet by
+    default; pass a BloomFilter instead to bound the memory used by very large
+    crawls, at the cost of occasionally skipping an object."""
+
+    def __init__(self, ttl=10, priority=None, seen=None):
         self.ttl = ttl
-        self.visited = set()
-        self.to_visit = list()
+        self.seen = seen if seen is not None else FingerprintSet()
+        self.frontier = Frontier(priority)
         self._visiting = None
         self._frozen = False
+        _live_crawlers.add(self)
 
     def _adapt(self, obj):
         """Converts a candidate object into a form suitable for insertion into
@@ -36,12 +197,18 @@ class Crawler(ABC):
         eventually be yielded by Crawler.visit. To avoid that, subclasses can
         override this method to add additional checks.
 
+        Adding an object that has already been added, or that has no TTL left,
+        does nothing.
+
         Any keyword arguments passed to this function will be passed on (in a
         dict) to the Crawler.visit_one function."""
         if not self._frozen:
-            hints["referrer"] = self._visiting
-            self.to_visit.append(
-                    (obj, ttl if ttl is not None else self.ttl, hints))
+            ttl = ttl if ttl is not None else self.ttl
+            adapted = self._adapt(obj)
+            if ttl > 0 and adapted not in self.seen:
+                self.seen.add(adapted)
+                hints["referrer"] = self._visiting
+                self.frontier.push(obj, ttl, hints)
 
     def freeze(self):
         """Prevents the addition of more objects to this Crawler."""
@@ -57,14 +224,11 @@ class Crawler(ABC):
 
     def visit(self):
         """Recursively visits all of the objects added to this Crawler."""
-        while self.to_visit:
-            (head, ttl, hints), *self.to_visit = self.to_visit
+        while self.frontier:
+            head, ttl, hints = self.frontier.pop()
             self._visiting = head
             try:
-                adapted = self._adapt(head)
-                if ttl > 0 and adapted not in self.visited:
-                    yield from self.visit_one(head, ttl, hints)
-                    self.visited.add(adapted)
+                yield from self.visit_one(head, ttl, hints)
             finally:
                 self._visiting = None
 
@@ -106,24 +270,111 @@ def simplify_mime_type(mime):
     return mime.split(';', maxsplit=1)[0]
 
 
+class HostThrottle:
+    """A HostThrottle limits the number of simultaneous requests made to each
+    host, and spaces out the starts of those requests by a minimum delay (or
+    by the Crawl-delay given in the host's robots.txt file, if that's
+    longer). It can safely be shared between threads."""
+
+    class _Host:
+        def __init__(self, connections: int):
+            self.semaphore = threading.BoundedSemaphore(connections)
+            self.lock = threading.Lock()
+            self.delay = None
+            self.next_start = 0.0
+
+    def __init__(
+            self, session: requests.Session, connections: int = 4,
+            delay: float = 0.0, robots: bool = True, timeout: float = None):
+        self._session = session
+        self._connections = connections
+        self._delay = delay
+        self._robots = robots
+        self._timeout = timeout
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _get_host(self, url_s: SplitResult) -> "HostThrottle._Host":
+        with self._lock:
+            if url_s.netloc not in self._hosts:
+                self._hosts[url_s.netloc] = self._Host(self._connections)
+            return self._hosts[url_s.netloc]
+
+    def _crawl_delay(self, url_s: SplitResult) -> float:
+        robots_url = urlunsplit((url_s.scheme, url_s.netloc, "/robots.txt", "", ""))
+        try:
+            response = self._session.get(robots_url, timeout=self._timeout)
+        except requests.exceptions.RequestException:
+            logger.warning(f"{robots_url}: couldn't be retrieved", exc_info=True)
+            return 0.0
+        if response.status_code != 200:
+            return 0.0
+
+        rp = RobotFileParser(robots_url)
+        rp.parse(response.text.splitlines())
+        delay = rp.crawl_delay(self._session.headers.get("User-Agent", "*"))
+        try:
+            return float(delay or 0.0)
+        except ValueError:
+            return 0.0
+
+    @contextmanager
+    def request(self, url: str):
+        """Waits until a request to the host of the given URL can be made, and
+        holds one of that host's connection slots while the context is
+        active."""
+        url_s = urlsplit(url)
+        host = self._get_host(url_s)
+        with host.semaphore:
+            with host.lock:
+                if host.delay is None:
+                    host.delay = max(
+                            self._delay,
+                            self._crawl_delay(url_s) if self._robots else 0.0)
+                now = monotonic()
+                start = max(now, host.next_start)
+                host.next_start = start + host.delay
+            if start > now:
+                sleep(start - now)
+            yield
+
+
 class WebCrawler(Crawler):
+    """A WebCrawler explores a website by following the links in its HTML
+    pages.
+
+    By default, pages are retrieved one at a time. If a concurrency greater
+    than one is specified, then up to that many pages will be retrieved at once
+    by a pool of threads, subject to the limits imposed by the given
+    HostThrottle; the order in which pages are yielded is then no longer
+    deterministic."""
+
     def __init__(
             self, url: str, session: requests.Session, timeout: float = None,
-            *args, allow_element_hints=False, **kwargs):
+            *args, allow_element_hints=False, concurrency: int = 1,
+            throttle: HostThrottle = None, **kwargs):
         super().__init__(*args, **kwargs)
         self._url = url
         self._split_url = urlsplit(url)
         self._session = session
         self._timeout = timeout
-        self._retrier = WebRetrier()
         self._allow_element_hints = allow_element_hints
+        self._concurrency = concurrency
+        self._throttle = throttle
         self.exclusions = set()
 
-    def get(self, *args, **kwargs):
-        return self._retrier.run(self._session.get, *args, **kwargs)
+    def _request(self, method, url: str, **kwargs):
+        if self._throttle:
+            with self._throttle.request(url):
+                return WebRetrier().run(method, url, **kwargs)
+        else:
+            return WebRetrier().run(method, url, **kwargs)
 
-    def head(self, *args, **kwargs):
-        return self._retrier.run(self._session.head, *args, **kwargs)
+    def get(self, url: str, **kwargs):
+        return self._request(self._session.get, url, **kwargs)
+
+    def head(self, url: str, **kwargs):
+        return self._request(self._session.head, url, **kwargs)
 
     def exclude(self, *exclusions):
         self.exclusions.update(exclusions)
@@ -179,9 +430,17 @@ class WebCrawler(Crawler):
                     extra_hints["title"] = title
                 if (true_url := element.get("data-true-url")):
                     extra_hints["true_url"] = true_url
-            self.add(link.url, new_ttl, **extra_hints)
+            return (link.url, new_ttl, extra_hints)
+
+    def _fetch(self, url: str, ttl: int, hints):  # noqa CCR001
+        """Retrieves a URL and finds the links in it. Returns a list of the
+        (url, ttl, hints) tuples that should be added to this WebCrawler, and
+        a flag indicating whether or not the URL itself should be yielded.
 
-    def visit_one(self, url: str, ttl: int, hints):  # noqa CCR001
+        This method doesn't modify the state of this WebCrawler (other than
+        the hints dictionary passed to it), so it can be run in another
+        thread."""
+        found = []
         if ttl > 0 and self.is_crawlable(url) and not self._frozen:
             response = self.head(url, timeout=self._timeout)
 
@@ -208,10 +467,46 @@ class WebCrawler(Crawler):
                                 hints["title"] = title
 
                     for element, link in make_outlinks(doc):
-                        self._handle_outlink(ttl - 1, element, link)
+                        if (outlink := self._handle_outlink(
+                                ttl - 1, element, link)):
+                            found.append(outlink)
             elif response.is_redirect and response.next:
                 # Redirects cost a TTL point *and* don't produce anything
-                self.add(response.next.url, ttl - 1)
-                return
+                return [(response.next.url, ttl - 1, {})], False
+
+        return found, True
 
-        yield (hints, url)
+    def _finish(self, url: str, hints, found, produce):
+        for new_url, new_ttl, new_hints in found:
+            self.add(new_url, new_ttl, **new_hints)
+        if produce:
+            yield (hints, url)
+
+    def visit_one(self, url: str, ttl: int, hints):
+        yield from self._finish(url, hints, *self._fetch(url, ttl, hints))
+
+    def visit(self):
+        if self._concurrency <= 1:
+            yield from super().visit()
+            return
+
+        pool = ThreadPoolExecutor(
+                self._concurrency, thread_name_prefix="WebCrawler")
+        pending = {}
+        try:
+            while self.frontier or pending:
+                while self.frontier and len(pending) < self._concurrency:
+                    url, ttl, hints = self.frontier.pop()
+                    pending[pool.submit(self._fetch, url, ttl, hints)] = (
+                            url, hints)
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url, hints = pending.pop(future)
+                    self._visiting = url
+                    try:
+                        yield from self._finish(url, hints, *future.result())
+                    finally:
+                        self._visiting = None
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
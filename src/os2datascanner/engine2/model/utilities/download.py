@@ -0,0 +1,112 @@
+from abc import abstractmethod
+from typing import BinaryIO, Callable
+from tempfile import SpooledTemporaryFile
+from contextlib import contextmanager
+import logging
+import requests
+
+from os2datascanner.engine2 import settings as engine2_settings
+
+from ..core import FileResource
+from .temp_resource import NamedTemporaryResource
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE: int = engine2_settings.model["download"]["chunk_size"]
+MEMORY_THRESHOLD: int = engine2_settings.model["download"]["memory_threshold"]
+RESUME_TRIES: int = engine2_settings.model["download"]["resume_tries"]
+
+
+def _resumes_at(response: requests.Response, offset: int) -> bool:
+    return (response.status_code == 206
+            and response.headers.get(
+                    "Content-Range", "").startswith(f"bytes {offset}-"))
+
+
+def download_into(
+        open_response: Callable[[dict], requests.Response],
+        fp: BinaryIO) -> int:
+    """Writes the content of a HTTP download to the writable file fp a chunk
+    at a time, returning the number of bytes written.
+
+    open_response should start the download, passing the given headers on to
+    the server, and return a response whose content hasn't yet been read (for
+    example, by calling requests.get with stream=True). If the connection
+    breaks during the download, then the download is resumed from where it
+    stopped with a range request; servers that don't support these will send
+    the content from the start again."""
+    start = fp.tell()
+    offset = 0
+    for attempt in range(RESUME_TRIES + 1):
+        # Ask for the content to be sent as-is: the offset of a range request
+        # refers to the encoded content, not the decoded one
+        headers = {"Accept-Encoding": "identity"}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+        response = open_response(headers)
+        try:
+            if offset and not _resumes_at(response, offset):
+                if response.status_code != 200:
+                    raise OSError(
+                            f"unexpected response {response.status_code}"
+                            f" when resuming a download at {offset}")
+                fp.seek(start)
+                fp.truncate()
+                offset = 0
+            for chunk in response.iter_content(CHUNK_SIZE):
+                fp.write(chunk)
+                offset += len(chunk)
+            return offset
+        except (requests.exceptions.ChunkedEncodingError,
+                requests.exceptions.ConnectionError):
+            if attempt == RESUME_TRIES:
+                raise
+            logger.warning(
+                    f"download interrupted after {offset} bytes, resuming",
+                    exc_info=True)
+        finally:
+            response.close()
+
+
+@contextmanager
+def spooled_file():
+    """Returns a context manager that, when entered, returns an empty
+    temporary file that's kept in memory until it grows larger than
+    MEMORY_THRESHOLD bytes, at which point it's moved to disk."""
+    with SpooledTemporaryFile(max_size=MEMORY_THRESHOLD) as fp:
+        yield fp
+
+
+@contextmanager
+def spooled_download(open_response: Callable[[dict], requests.Response]):
+    """Returns a context manager that, when entered, downloads some content
+    with download_into and returns a spooled_file containing it."""
+    with spooled_file() as fp:
+        download_into(open_response, fp)
+        fp.seek(0)
+        yield fp
+
+
+class DownloadResource(FileResource):
+    """A DownloadResource is a FileResource whose content is retrieved with a
+    HTTP download. The download is streamed to its destination instead of
+    being read into memory all at once: make_path writes it straight to disk,
+    and make_stream only keeps it in memory if it's small."""
+
+    @abstractmethod
+    def open_download(self, headers: dict) -> requests.Response:
+        """Starts downloading the content of this DownloadResource, returning
+        a response whose content hasn't yet been read. The given headers
+        should be included in the request, if at all possible."""
+
+    @contextmanager
+    def make_path(self):
+        with NamedTemporaryResource(self.handle.name) as ntr:
+            with ntr.open("wb") as fp:
+                download_into(self.open_download, fp)
+            yield ntr.get_path()
+
+    @contextmanager
+    def make_stream(self):
+        with spooled_download(self.open_download) as fp:
+            yield fp
@@ -1,9 +1,13 @@
+import json
+
 from .. import settings
-from ..model.core import Source, UnknownSchemeError, DeserialisationError
+from ..model.core import (
+        Source, ScanContext, UnknownSchemeError, DeserialisationError)
 from ..model.core.errors import (ModelException,
                                  UncontactableError,
                                  UnauthorisedError,
                                  UnavailableError)
+from ..rules.last_modified import get_modified_after
 from ..utilities.backoff import DummyRetrier, TimeoutRetrier
 from . import messages
 from .utilities.filtering import is_handle_relevant
@@ -76,6 +80,12 @@ def message_received_raw(body, channel, source_manager):  # noqa
     # Yes, this is dreaded mutable state... Just don't go change it
     # somewhere else.
     source_manager.configuration = scan_spec.configuration
+    source_manager.scan_context = ScanContext(
+            tag=json.dumps(scan_tag.to_json_object(), sort_keys=True),
+            time=scan_tag.time,
+            scanner=str(scan_tag.scanner.pk) if scan_tag.scanner else None,
+            modified_after=get_modified_after(scan_spec.rule))
+    source_manager.skipped_objects = 0
 
     it = scan_spec.source.handles(source_manager)
 
@@ -149,9 +159,12 @@ def message_received_raw(body, channel, source_manager):  # noqa
     finally:
         if hasattr(it, "close"):
             it.close()
+        # Objects produced by an interrupted exploration of this Source still
+        # count towards its total
         yield ("os2ds_status", messages.StatusMessage(
                 scan_tag=scan_tag,
-                total_objects=handle_count, new_sources=source_count,
+                total_objects=handle_count + source_manager.skipped_objects,
+                new_sources=source_count,
                 message=exception_message,
                 status_is_error=exception_message != "").to_json_object())
 
@@ -5,12 +5,44 @@ from typing import Optional, Sequence, NamedTuple
 from datetime import datetime
 from dateutil import tz
 import warnings
+from contextlib import contextmanager
 
 from ..utilities.datetime import parse_datetime
 from ..model.core import Handle, Source
 from ..rules.rule import Rule, SimpleRule, Sensitivity
 
 
+_shared_objects = None
+
+
+@contextmanager
+def shared_decoding():
+    """Returns a context manager within which JSON objects that are passed to
+    more than one of this module's from_json_object methods -- that is, the
+    very same object, not just an equal one -- are only decoded once.
+
+    (Callers handling several messages at once can arrange for equal
+    fragments of those messages to be replaced with a single shared object to
+    take advantage of this.)"""
+    global _shared_objects
+    previous, _shared_objects = _shared_objects, {}
+    try:
+        yield
+    finally:
+        _shared_objects = previous
+
+
+def _decode_shared(decoder, obj):
+    if _shared_objects is None:
+        return decoder(obj)
+    key = (decoder, id(obj))
+    if key not in _shared_objects:
+        # Keep a reference to the object itself so that its ID can't be
+        # reused while this cache is alive
+        _shared_objects[key] = (obj, decoder(obj))
+    return _shared_objects[key][1]
+
+
 def _deep_replace(self, **kwargs):
     """As NamedTuple._replace, but supports deeply nested field replacement
     using Django-like syntax ("tuple1__subtuple__field")."""
@@ -62,7 +94,7 @@ class ProgressFragment(NamedTuple):
     @classmethod
     def from_json_object(cls, obj):
         return ProgressFragment(
-                rule=Rule.from_json_object(obj["rule"]),
+                rule=_decode_shared(Rule.from_json_object, obj["rule"]),
                 matches=[MatchFragment.from_json_object(mf)
                          for mf in obj["matches"]])
 
@@ -244,7 +276,8 @@ class ConversionMessage(NamedTuple):
     @classmethod
     def from_json_object(cls, obj):
         return ConversionMessage(
-                scan_spec=ScanSpecMessage.from_json_object(obj["scan_spec"]),
+                scan_spec=_decode_shared(
+                        ScanSpecMessage.from_json_object, obj["scan_spec"]),
                 handle=Handle.from_json_object(obj["handle"]),
                 progress=ProgressFragment.from_json_object(obj["progress"]))
 
@@ -268,7 +301,8 @@ class RepresentationMessage(NamedTuple):
     @classmethod
     def from_json_object(cls, obj):
         return RepresentationMessage(
-                scan_spec=ScanSpecMessage.from_json_object(obj["scan_spec"]),
+                scan_spec=_decode_shared(
+                        ScanSpecMessage.from_json_object, obj["scan_spec"]),
                 handle=Handle.from_json_object(obj["handle"]),
                 progress=ProgressFragment.from_json_object(obj["progress"]),
                 representations=obj["representations"])
@@ -399,7 +433,8 @@ class MatchesMessage(NamedTuple):
         # WARNING! Migration 0052 in the report app is dependent on this method.
         # Alter with care!
         return MatchesMessage(
-                scan_spec=ScanSpecMessage.from_json_object(obj["scan_spec"]),
+                scan_spec=_decode_shared(
+                        ScanSpecMessage.from_json_object, obj["scan_spec"]),
                 handle=Handle.from_json_object(obj["handle"]),
                 matched=obj["matched"],
                 matches=[MatchFragment.from_json_object(mf)
@@ -3,8 +3,8 @@ from urllib.error import HTTPError
 from .. import settings
 from ..model.core import Source
 from ..utilities.backoff import TimeoutRetrier
-from ..conversions import convert
 from ..conversions.types import OutputType, encode_dict
+from ..conversions.utilities.cache import ContentCache
 from . import messages
 
 logger = logging.getLogger(__name__)
@@ -18,6 +18,13 @@ WRITES_QUEUES = (
 PROMETHEUS_DESCRIPTION = "Representations generated"
 PREFETCH_COUNT = 8
 
+# Identical objects often turn up under many different Handles (forwarded
+# attachments, copied folders, and so on); keep their text around so that they
+# only need to be converted once
+content_cache = ContentCache(
+        settings.conversions["cache"]["content_cache_size"],
+        settings.conversions["cache"]["content_cache_max_object_size"])
+
 
 def check(source_manager, handle):
     """
@@ -105,11 +112,13 @@ def message_received_raw(body, channel, source_manager, *, _check=True):  # noqa
                     break
             else:
                 # We have no reason to skip the conversion, so try to do it
-                representation = tr.run(convert, resource, required)
+                representation = tr.run(
+                        content_cache.convert, resource, required)
         else:
             # This isn't an OCR task (or there are no OCR exceptions defined);
             # just try to do the conversion
-            representation = tr.run(convert, resource, required)
+            representation = tr.run(
+                    content_cache.convert, resource, required)
 
         if representation and getattr(representation, "parent", None):
             # If the conversion also produced other values at the same
@@ -1,9 +1,11 @@
 import os
 import sys
+import json
 import click
 import pstats
 import random
 import logging
+import multiprocessing.util
 from collections import deque
 
 from prometheus_client import Info, Summary, start_http_server, CollectorRegistry
@@ -12,6 +14,8 @@ from os2datascanner.utils import debug, profiling
 from os2datascanner.utils.log_levels import log_levels
 from ... import __version__
 from ..model.core import SourceManager
+from ..rules.datasets.loader import common as common_loader
+from ..rules.utilities.name_index import get_name_index
 from . import explorer, exporter, matcher, messages, processor, tagger, worker
 from .utilities.pika import (ANON_QUEUE,
                              RejectMessage,
@@ -52,13 +56,21 @@ class GenericRunner(PikaPipelineThread):
     def __init__(self,
                  source_manager: SourceManager, *args,
                  stage: str, module, queue_suffix, limit,
-                 read, write, **kwargs):
+                 read, write, batch_size=1, processes=1, max_unconfirmed=0,
+                 **kwargs):
         super().__init__(
                 *args, **kwargs,
                 read=read,
                 write=write,
                 queue_suffix=queue_suffix,
-                prefetch_count=module.PREFETCH_COUNT)
+                batch_size=batch_size,
+                processes=processes,
+                max_unconfirmed=max_unconfirmed,
+                # A batch can only be as big as the number of messages we're
+                # allowed to hold on to at once, and every worker process
+                # should have a batch to work on
+                prefetch_count=max(
+                        module.PREFETCH_COUNT, batch_size) * max(1, processes))
         self._module = module
         self._registry = CollectorRegistry()
         self._summary = Summary(
@@ -151,6 +163,79 @@ class GenericRunner(PikaPipelineThread):
                 for rk, msg in self._handle_content(routing_key, body):
                     yield rk, msg, get_exchange(stage, qs, msg, rk), get_headers(stage, qs, msg, rk)
 
+    def prepare_batch(self, batch):
+        # Group messages that share a scan specification and a rule together,
+        # and make sure that each of those shared fragments is represented by
+        # a single object so that it'll only be decoded once
+        shared = {}
+        identities = {}
+        groups = {}
+
+        def _share(container, key, identify):
+            if not isinstance(container, dict) or key not in container:
+                return None
+            obj = container[key]
+            # Fragments that are already shared (as those sent as definitions
+            # in the binary wire format are) only need to be identified once
+            if id(obj) not in identities:
+                identities[id(obj)] = (obj, identify(obj))
+            _, identity = identities[id(obj)]
+            container[key] = shared.setdefault(identity, obj)
+            return identity
+
+        def _identify_scan_spec(scan_spec):
+            # A scan's tag and a Source between them determine the rest of a
+            # scan specification, and are much smaller than its rule
+            if "scan_tag" in scan_spec and "source" in scan_spec:
+                return ("scan_spec", json.dumps(
+                        [scan_spec["scan_tag"], scan_spec["source"]],
+                        sort_keys=True))
+            return ("scan_spec", json.dumps(scan_spec, sort_keys=True))
+
+        def _identify_rule(rule):
+            return ("rule", json.dumps(rule, sort_keys=True))
+
+        for tag, routing_key, body in batch:
+            group_key = None
+            if routing_key != "":
+                group_key = (
+                        _share(body, "scan_spec", _identify_scan_spec),
+                        _share(body.get("progress"), "rule", _identify_rule))
+            groups.setdefault(group_key, []).append(
+                    (tag, routing_key, body))
+        return [delivery for group in groups.values() for delivery in group]
+
+    def batch_context(self):
+        return messages.shared_decoding()
+
+    def is_broadcast(self, routing_key):
+        # Command messages arrive through the fanout exchange, and must reach
+        # every worker process
+        return routing_key == ""
+
+    def broadcast_state(self):
+        return (list(self._cancelled),
+                logging.getLogger("os2datascanner").level,
+                profiling.get_profile() is not None)
+
+    def restore_broadcast_state(self, state):
+        cancelled, log_level, profiling_enabled = state
+        self._cancelled = deque(cancelled)
+        logging.getLogger("os2datascanner").setLevel(log_level)
+        if profiling_enabled and not profiling.get_profile():
+            profiling.enable_profiling()
+        elif not profiling_enabled and profiling.get_profile():
+            profiling.print_stats(pstats.SortKey.CUMULATIVE, silent=True)
+            profiling.disable_profiling()
+
+    def initialise_process(self):
+        # The SourceManager inherited from the parent process belongs to it;
+        # each worker process must track its own Sources
+        self._source_manager = SourceManager(width=self._source_manager.width)
+        multiprocessing.util.Finalize(
+                self._source_manager, self._source_manager.clear,
+                exitpriority=10)
+
     def after_message(self, routing_key, body):
         # Check to see if we've met our quota and should restart
         self._count += 1
@@ -195,6 +280,25 @@ restarting = False
 @click.option('--queue-suffix', default=None,
               envvar='QUEUE_SUFFIX', type=str,
               help='suffix for queue(s) for the engine stage to read from/write to')
+@click.option('--batch-size', default=1,
+              envvar='BATCH_SIZE', type=int,
+              help='handle up to SIZE messages at a time, grouping messages'
+                   ' with the same scan specification together (default: 1)')
+@click.option('--batch-linger-ms', default=0,
+              envvar='BATCH_LINGER_MS', type=int,
+              help='wait at most MS milliseconds for a batch to fill up'
+                   ' (default: 0)')
+@click.option('--processes', default=1,
+              envvar='PROCESSES', type=int,
+              help='handle messages in a pool of COUNT worker processes, each'
+                   ' with its own SourceManager, sharing one connection to'
+                   ' the message broker (default: 1)')
+@click.option('--max-unconfirmed', default=0,
+              envvar='MAX_UNCONFIRMED', type=int,
+              help='acknowledge each message only once the broker has'
+                   ' confirmed receipt of its output, allowing at most COUNT'
+                   ' unconfirmed output messages at once (default: 0, which'
+                   ' disables publisher confirms)')
 @click.argument('stage',
                 type=click.Choice(["explorer",
                                    "processor",
@@ -203,7 +307,8 @@ restarting = False
                                    "exporter",
                                    "worker"]))
 def main(log_level, enable_profiling, enable_rusage, enable_metrics,
-         prometheus_port, width, single_cpu, restart_after, queue_suffix, stage):
+         prometheus_port, width, single_cpu, restart_after, queue_suffix,
+         batch_size, batch_linger_ms, processes, max_unconfirmed, stage):
     debug.register_debug_signal()
     module = _module_mapping[stage]
 
@@ -244,6 +349,22 @@ def main(log_level, enable_profiling, enable_rusage, enable_metrics,
     if queue_suffix:
         root_logger.info(f"Using dedicated queues with suffix: '{queue_suffix}'")
 
+    if batch_size > 1:
+        root_logger.info(
+                f"handling messages in batches of up to {batch_size}")
+
+    if stage in ("matcher", "worker",):
+        # Build the name index before the first message arrives rather than
+        # while handling it
+        get_name_index()
+
+    if processes > 1:
+        root_logger.info(f"handling messages in {processes} processes")
+        # Load the rule datasets now so that all of the worker processes can
+        # share a single copy of them
+        for category in ("addresses", "wordlists",):
+            common_loader.load_category(category)
+
     try:
         with SourceManager(width=width) as source_manager:
             GenericRunner(
@@ -254,6 +375,10 @@ def main(log_level, enable_profiling, enable_rusage, enable_metrics,
                 queue_suffix=queue_suffix,
                 read=get_queues(module.READS_QUEUES, queue_suffix),
                 write=get_queues(module.WRITES_QUEUES, queue_suffix),
+                batch_size=batch_size,
+                batch_linger=batch_linger_ms / 1000,
+                processes=processes,
+                max_unconfirmed=max_unconfirmed,
                 ).run_consumer()
 
         if restarting:
@@ -0,0 +1,89 @@
+"""Support for the compact binary form of pipeline messages.
+
+Messages in this form are MessagePack documents compressed with Zstandard.
+Large scan specifications and rules in them are replaced by references to
+separately-stored definitions, so that the same scan specification doesn't
+have to be repeated in every message produced by a scan. A reference records
+the digest of its definition and the time at which the definition was stored,
+so that consumers know where to start looking for it."""
+
+import struct
+import hashlib
+from typing import Any, Callable
+
+import msgpack
+import zstandard
+
+
+CONTENT_TYPE = "application/x-msgpack"
+CONTENT_ENCODING = "zstd"
+
+compress = zstandard.compress
+decompress = zstandard.decompress
+
+
+# The MessagePack extension type code used for references to definitions
+_REFERENCE = 1
+
+# The layout of the payload of a reference: the time (in seconds since the
+# epoch) at which the definition was stored, followed by its SHA-256 digest
+_reference_layout = struct.Struct(">Q32s")
+
+# The smallest (packed) scan specification or rule that will be replaced by a
+# reference
+_MIN_DEFINITION_SIZE = 512
+
+
+class UnknownDefinitionError(KeyError):
+    """Raised when a message refers to a definition that can't be found."""
+
+
+# The stream in which all definitions are stored
+DEFINITION_STREAM = "os2ds_definitions"
+
+
+def parse_reference(payload: bytes) -> tuple[int, bytes]:
+    """Returns the storage time and digest recorded in the payload of a
+    reference."""
+    return _reference_layout.unpack(payload)
+
+
+def pack(body: Any, define: Callable[[bytes, bytes], int]) -> bytes:
+    """Packs a message body, replacing its scan specification and rule with
+    references if they're big enough. The define function is called with the
+    digest and packed form of each referenced definition; it should make sure
+    that the definition is stored and return the time at which it was.
+
+    (The body itself is not modified.)"""
+
+    def _replace(container: dict, key: str):
+        if not isinstance(container.get(key), dict):
+            return
+        packed = msgpack.packb(container[key])
+        if len(packed) >= _MIN_DEFINITION_SIZE:
+            digest = hashlib.sha256(packed).digest()
+            stored = define(digest, packed)
+            container[key] = msgpack.ExtType(
+                    _REFERENCE, _reference_layout.pack(stored, digest))
+
+    if isinstance(body, dict):
+        body = dict(body)
+        _replace(body, "scan_spec")
+        if isinstance(body.get("progress"), dict):
+            body["progress"] = dict(body["progress"])
+            _replace(body["progress"], "rule")
+    return msgpack.packb(body)
+
+
+def unpack(data: bytes, resolve: Callable[[bytes], Any]) -> Any:
+    """Unpacks a message body produced by pack, using the resolve function to
+    retrieve the (unpacked) content of each referenced definition given the
+    payload of its reference (see parse_reference). (That function should
+    raise an UnknownDefinitionError if it can't find a definition.)"""
+
+    def _ext_hook(code, payload):
+        if code == _REFERENCE:
+            return resolve(payload)
+        return msgpack.ExtType(code, payload)
+
+    return msgpack.unpackb(data, ext_hook=_ext_hook, strict_map_key=False)
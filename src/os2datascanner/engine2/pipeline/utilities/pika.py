@@ -1,16 +1,25 @@
+import gc
 import gzip
 import json
+import contextlib
 import logging
+import multiprocessing
 import pika
 import time
 import signal
 import threading
 import traceback
+from datetime import datetime, timezone
+from collections import OrderedDict, deque
+from concurrent.futures import (
+        Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError)
+from concurrent.futures.process import BrokenProcessPool
 from sortedcontainers import SortedList
 
 from ...utilities.backoff import ExponentialBackoffRetrier
 from ....utils.system_utilities import json_utf8_decode
 from os2datascanner.utils import pika_settings
+from . import codec
 
 
 logger = logging.getLogger(__name__)
@@ -253,10 +262,107 @@ class RejectMessage(BaseException):
 
 
 _coders = {
-    "gzip": (gzip.compress, gzip.decompress)
+    "gzip": (gzip.compress, gzip.decompress),
+    codec.CONTENT_ENCODING: (codec.compress, codec.decompress),
 }
 
 
+# The default properties of messages sent by a PikaPipelineThread, for each
+# supported wire format. (Consumers don't need to be told which wire format to
+# use: they'll accept messages in any of them.)
+_wire_formats = {
+    "json": dict(delivery_mode=2, content_encoding="gzip"),
+    "msgpack+zstd": dict(
+            delivery_mode=2,
+            content_type=codec.CONTENT_TYPE,
+            content_encoding=codec.CONTENT_ENCODING),
+}
+
+
+# Definitions referred to by messages in the binary wire format are stored in
+# a single stream that consumers read without removing anything from it. The
+# broker discards definitions once they're this old...
+_DEFINITION_RETENTION = "7D"
+# ... so producers should store the ones they're still using again every so
+# often (in seconds). (A message can then wait in a queue for the full
+# retention period after its producer stopped using its definitions.)
+_DEFINITION_REFRESH = 60 * 60
+_definition_stream_arguments = {
+    "x-queue-type": "stream",
+    "x-max-age": _DEFINITION_RETENTION,
+}
+# The maximum number of definitions that a producer will remember having
+# stored, and that a consumer will keep in memory
+_MAX_DEFINITIONS = 256
+# How long before a definition's recorded storage time a consumer starts
+# reading the stream, to allow for differences between the producer's clock
+# and the broker's (in seconds)
+_DEFINITION_CLOCK_SKEW = 60
+# The number of unacknowledged definitions that the broker will send to a
+# consumer reading the stream
+_DEFINITION_PREFETCH = 64
+# The longest time that a consumer will spend reading the stream looking for a
+# definition
+_DEFINITION_TIMEOUT = 30.0
+
+
+# The number of requests that PikaPipelineThread will collect while handling a
+# batch of messages before passing them on to the background thread
+_MAX_PENDING_REQUESTS = 1024
+
+
+# The longest time that the background thread will wait for something to happen
+# before checking its request queue anyway. (Enqueueing a request normally
+# wakes the background thread up immediately.)
+_MAX_POLL_INTERVAL = 1.0
+
+
+# The longest time that the background thread will wait for the broker to
+# confirm outstanding publications when it's asked to stop
+_MAX_SHUTDOWN_WAIT = 10.0
+
+
+def _no_op():
+    pass
+
+
+def _load_body(body):
+    """Returns the content of a message body, decoding it from JSON if
+    _decode_delivery didn't already decode it."""
+    return json_utf8_decode(body) if isinstance(body, bytes) else body
+
+
+# The PikaPipelineThread whose handle_message function should be called by the
+# processes of a worker pool. (Each of these processes has its own copy of the
+# object, inherited from the parent when the pool was forked.)
+_process_runner = None
+
+
+def _initialise_process(runner):
+    """(Pool process.) Prepares a newly-forked worker process to handle
+    messages on behalf of the given PikaPipelineThread."""
+    global _process_runner
+    _process_runner = runner
+
+    # The parent process's signal handlers refer to its background thread,
+    # which doesn't exist here; let the pool manage our lifetime
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    runner.initialise_process()
+
+
+def _handle_batch_in_process(seq, state, deliveries):
+    """(Pool process.) Catches up with the state that broadcast messages have
+    built up in the parent process, if it's changed since this process last
+    saw it, and then handles a batch of deliveries sent over by the parent
+    process."""
+    if seq > _process_runner._broadcast_seq:
+        _process_runner.restore_broadcast_state(state)
+        _process_runner._broadcast_seq = seq
+    return _process_runner._handle_batch(deliveries)
+
+
 class SynchronisationTimeoutError(RuntimeError):
     """When the PikaPipelineThread.synchronise method fails due to a timeout,
     the SynchronisationTimeoutError exception is raised."""
@@ -265,19 +371,114 @@ class SynchronisationTimeoutError(RuntimeError):
 class PikaPipelineThread(threading.Thread, PikaPipelineRunner):
     """Runs a Pika session in a background thread."""
 
-    def __init__(self, *args, exclusive=False, **kwargs):
+    def __init__(self, *args,
+                 exclusive=False, batch_size=1, batch_linger=0.0,
+                 processes=1, max_unconfirmed=0,
+                 wire_format=pika_settings.AMQP_WIRE_FORMAT, **kwargs):
         super().__init__()
         PikaPipelineRunner.__init__(self, *args, **kwargs)
 
         self._incoming = SortedList(key=lambda e: -(e[1].priority or 0))
-        self._outgoing = []
+        self._outgoing = deque()
         self._live = None
+        # Whether or not the background thread has been asked to wake up since
+        # it last emptied the request queue
+        self._wakeup_pending = False
+        # The delivery tags of the messages that the background thread has
+        # received but not yet acknowledged or rejected
+        self._unsettled = SortedList()
         self._condition = threading.Condition()
         self._exclusive = exclusive
-        self._default_basic_properties = dict(delivery_mode=2, content_encoding="gzip")
+        self._default_basic_properties = dict(_wire_formats[wire_format])
+
+        # The definitions (see the codec module) that this object has stored
+        # recently, mapped to the time at which they were stored, and those
+        # that it has retrieved
+        self._defined = OrderedDict()
+        self._definitions = OrderedDict()
+        # (Background thread.) The channel used to read the definition stream,
+        # whether or not the stream has been declared on the main channel, and
+        # the definitions being looked for in it, keyed by consumer tag
+        self._definition_channel = None
+        self._definition_stream_declared = False
+        self._fetches = {}
+        self._fetch_seq = 0
+
+        # In batch mode, run_consumer collects up to batch_size messages at a
+        # time (waiting at most batch_linger seconds for the batch to fill up)
+        # and acknowledges and publishes the results of the whole batch
+        # together
+        self._batch_size = max(1, batch_size)
+        self._batch_linger = batch_linger
+
+        # With more than one process, run_consumer forks a pool of worker
+        # processes and hands batches of messages over to them; the results
+        # flow back to this process to be published and acknowledged
+        self._processes = max(1, processes)
+        self._pool = None
+        self._pool_exception = None
+        self._pool_closing = False
+        # Broadcast messages (see is_broadcast) are handled by the parent
+        # process, which then sends a snapshot of the resulting state (see
+        # broadcast_state) along with every batch. In the parent process,
+        # _broadcast_seq counts the broadcast messages handled so far, and in
+        # a worker process, it's the count that its state was last restored
+        # from
+        self._broadcast_state = None
+        self._broadcast_seq = 0
+
+        # With publisher confirms enabled, the background thread holds on to
+        # the acknowledgement of each message until the broker has confirmed
+        # all of the messages published before it, and stops publishing while
+        # max_unconfirmed messages are waiting for confirmation. (All of this
+        # state belongs to the background thread.)
+        self._max_unconfirmed = max(0, max_unconfirmed)
+        self._publish_seq = 0
+        self._unconfirmed = SortedList()
+        self._nacked = SortedList()
+        self._held_acks = deque()
 
         self._shutdown_exception = None
 
+    def make_channel(self):
+        """As PikaPipelineRunner.make_channel, but also puts the channel into
+        confirm mode if publisher confirms are enabled."""
+        channel = super().make_channel()
+        self._definition_stream_declared = False
+        if self._max_unconfirmed:
+            # BlockingChannel.confirm_delivery would make every call to
+            # basic_publish wait for its confirmation; register our own
+            # callback with the underlying channel instead so that
+            # publications can be pipelined
+            self._publish_seq = 0
+            self._unconfirmed.clear()
+            self._nacked.clear()
+            self._held_acks.clear()
+            channel._impl.confirm_delivery(self._on_confirmation)
+        return channel
+
+    def _on_confirmation(self, frame):
+        """(Background thread, called by Pika.) Records that the broker has
+        confirmed (or refused) one or more published messages."""
+        method = frame.method
+        if method.multiple:
+            end = self._unconfirmed.bisect_right(method.delivery_tag)
+            settled = self._unconfirmed[:end]
+            del self._unconfirmed[:end]
+        elif method.delivery_tag in self._unconfirmed:
+            settled = [method.delivery_tag]
+            self._unconfirmed.remove(method.delivery_tag)
+        else:
+            settled = []
+        if isinstance(method, pika.spec.Basic.Nack):
+            logger.warning(
+                    f"broker refused {len(settled)} published messages,"
+                    " requeueing the messages that produced them")
+            self._nacked.update(settled)
+        # Make sure that process_data_events returns so that we can release
+        # the acknowledgements that were waiting for these confirmations
+        self.connection.call_later(0, _no_op)
+
     def _enqueue(self, label: str, *args, check_live=True):
         """Enqueues a request for the background thread, optionally checking
         whether or not it's already finished.
@@ -293,6 +494,35 @@ class PikaPipelineThread(threading.Thread, PikaPipelineRunner):
             trace(f"PikaPipelineThread - Thread TID: {self.native_id} "
                   "acquired conditional and enqueued outgoing message.")
             self._outgoing.append((label, *args))
+            self._request_wakeup()
+
+    def _enqueue_all(self, requests: list[tuple], *, check_live=True):
+        """As _enqueue, but enqueues several prepared requests at once."""
+        with self._condition:
+            if check_live and self.ident is not None and not self.is_alive():
+                raise RuntimeError(
+                        "attempted to enqueue a request on a completed"
+                        " PikaPipelineThread")
+            trace(f"PikaPipelineThread - Thread TID: {self.native_id} "
+                  f"acquired conditional and enqueued {len(requests)}"
+                  " outgoing messages.")
+            self._outgoing.extend(requests)
+            self._request_wakeup()
+
+    def _request_wakeup(self):
+        """Asks the background thread to stop waiting for network activity
+        and to process the request queue. (The caller must hold the condition
+        lock.)"""
+        if (self._live and not self._wakeup_pending
+                and self._connection is not None):
+            try:
+                # This is the only thread-safe BlockingConnection method; it
+                # interrupts the background thread's process_data_events call
+                self._connection.add_callback_threadsafe(_no_op)
+                self._wakeup_pending = True
+            except pika.exceptions.ConnectionWrongStateError:
+                # The background thread is about to stop anyway
+                pass
 
     def enqueue_ack(self, delivery_tag: int):
         """Requests that the background thread acknowledge receipt of the
@@ -320,19 +550,49 @@ class PikaPipelineThread(threading.Thread, PikaPipelineRunner):
                         **basic_properties):
         """Requests that the background thread send a message.
 
-        Note that the content_encoding property gets special treatment: if it's
-        set, the message will be encoded accordingly -- on the calling thread,
-        not the background one -- before it's enqueued."""
+        Note that the content_type and content_encoding properties get special
+        treatment: if they're set, the message will be encoded accordingly --
+        on the calling thread, not the background one -- before it's
+        enqueued."""
+        return self._enqueue_all(self._prepare_message(
+                routing_key, body, exchange, **basic_properties))
+
+    def _prepare_message(self,
+                         routing_key: str,
+                         body: bytes,
+                         exchange: str = "",
+                         **basic_properties) -> list[tuple]:
+        """Encodes a message and returns a list of requests suitable for
+        passing to _enqueue_all. (This is an implementation detail: clients
+        should use enqueue_message instead.)"""
         basic_properties = self._default_basic_properties | basic_properties
 
-        if not isinstance(body, bytes):
+        requests = []
+        if isinstance(body, bytes):
+            if basic_properties.get("content_type") == codec.CONTENT_TYPE:
+                # We've been given an already-serialised JSON message
+                basic_properties["content_type"] = None
+        elif basic_properties.get("content_type") == codec.CONTENT_TYPE:
+            now = int(time.time())
+
+            def _define(digest, packed):
+                stored = self._defined.get(digest)
+                if stored is None or now - stored >= _DEFINITION_REFRESH:
+                    requests.append(("def", digest, codec.compress(packed)))
+                    stored = self._defined[digest] = now
+                self._defined.move_to_end(digest)
+                while len(self._defined) > _MAX_DEFINITIONS:
+                    self._defined.popitem(last=False)
+                return stored
+            body = codec.pack(body, _define)
+        else:
             body = json.dumps(body).encode()
         if (encoding := basic_properties.get("content_encoding")):
             encoder, _ = _coders[encoding]
             body = encoder(body)
 
-        return self._enqueue(
-                "msg", routing_key, body, exchange, basic_properties)
+        requests.append(("msg", routing_key, body, exchange, basic_properties))
+        return requests
 
     def _enqueue_pause(self, duration: float = 5.0):
         """Requests that the background thread wait for the specified duration.
@@ -369,7 +629,10 @@ class PikaPipelineThread(threading.Thread, PikaPipelineRunner):
         message is available or until the given timeout elapses.
 
         Note that messages with a declared content encoding will be decoded
-        automatically before being returned."""
+        automatically before being returned, as will messages in the binary
+        wire format (see the codec module). (Messages that can't be decoded
+        will be rejected, and this method will return (None, None, None) in
+        their place.)"""
         method, properties, body = None, None, None
         with self._condition:
 
@@ -380,17 +643,96 @@ class PikaPipelineThread(threading.Thread, PikaPipelineRunner):
             rv = self._condition.wait_for(waiter, timeout)
             if rv and self._live:
                 method, properties, body = self._incoming.pop(0)
+
+        trace(f"PikaPipelineThread - Thread TID: {self.native_id}"
+              " done sleeping. Got a message.")
+        return (self._decode_delivery(method, properties, body)
+                or (None, None, None))
+
+    def await_messages(self,
+                       count: int, linger: float = 0.0,
+                       timeout: float = None) -> list[tuple]:
+        """As await_message, but returns a list of up to count messages. Once
+        the first message is available, this method will wait at most linger
+        seconds for the rest to arrive.
+
+        The returned list will be empty if no message arrived before the given
+        timeout elapsed or if the background thread isn't running."""
+        deliveries = []
+        with self._condition:
+
+            def waiter():
+                return not self._live or len(self._incoming) > 0
+
+            def filled():
+                return not self._live or len(self._incoming) >= count
+
+            rv = self._condition.wait_for(waiter, timeout)
+            if rv and linger and not filled():
+                self._condition.wait_for(filled, linger)
+            if self._live:
+                while self._incoming and len(deliveries) < count:
+                    deliveries.append(self._incoming.pop(0))
+
+        trace(f"PikaPipelineThread - Thread TID: {self.native_id}"
+              f" done sleeping. Got {len(deliveries)} messages.")
+        return [delivery for d in deliveries
+                if (delivery := self._decode_delivery(*d)) is not None]
+
+    def _decode_delivery(self, method, properties, body):
+        """Decodes the content of a message according to its content_encoding
+        and content_type properties. Messages that can't be decoded are
+        rejected, and None is returned in their place."""
         if body and properties and properties.content_encoding:
             _, decoder = _coders[properties.content_encoding]
             body = decoder(body)
             # We've decoded the content, so from this point on it should be
             # regarded as unencoded
             properties.content_encoding = None
-
-        trace(f"PikaPipelineThread - Thread TID: {self.native_id}"
-              " done sleeping. Got a message.")
+        if body and properties and properties.content_type == codec.CONTENT_TYPE:
+            try:
+                body = codec.unpack(body, self._resolve_definition)
+            except codec.UnknownDefinitionError as ex:
+                # The definition might just be slow to turn up (or be
+                # available to another consumer), so give the message back
+                logger.warning(
+                        "requeueing message that refers to a definition"
+                        f" that couldn't be retrieved: {ex.args[0]}")
+                self.enqueue_reject(method.delivery_tag, requeue=True)
+                return None
+            properties.content_type = None
         return method, properties, body
 
+    def _resolve_definition(self, ref: bytes):
+        """Returns the content of a definition, retrieving it from the broker
+        (by way of the background thread) if it isn't already known.
+
+        The same object is returned every time a definition is used (just as
+        implementations of prepare_batch may share identical fragments between
+        the messages in a batch), so it must not be modified."""
+        stored, digest = codec.parse_reference(ref)
+        if (content := self._definitions.get(digest)) is not None:
+            self._definitions.move_to_end(digest)
+            return content
+
+        future = Future()
+        self._enqueue("get", stored, digest, future)
+        try:
+            # (The background thread gives up after _DEFINITION_TIMEOUT
+            # seconds, but might take a little while to notice)
+            body = future.result(_DEFINITION_TIMEOUT + _MAX_POLL_INTERVAL)
+        except FutureTimeoutError:
+            body = None
+        if not body:
+            raise codec.UnknownDefinitionError(digest.hex())
+
+        content = codec.unpack(
+                codec.decompress(body), self._resolve_definition)
+        self._definitions[digest] = content
+        while len(self._definitions) > _MAX_DEFINITIONS:
+            self._definitions.popitem(last=False)
+        return content
+
     def handle_message(self, routing_key, body) -> HandleMessageType:
         """Handles an AMQP message by yielding zero or more (routing key,
         JSON-serialisable object) pairs to be sent as new messages.
@@ -405,11 +747,62 @@ class PikaPipelineThread(threading.Thread, PikaPipelineRunner):
 
         The default implementation of this method does nothing."""
 
+    def prepare_batch(self, batch: list[tuple]) -> list[tuple]:
+        """Given a list of (delivery tag, routing key, decoded body) 3-tuples
+        collected in batch mode, returns a list of the same tuples in the
+        order in which they should be handled. Subclasses can override this
+        method to group related messages together.
+
+        The default implementation of this method returns the batch
+        unchanged."""
+        return batch
+
+    def batch_context(self):
+        """Returns a context manager that will be active while a batch of
+        messages is being handled in batch mode.
+
+        The default implementation of this method returns a context manager
+        that does nothing."""
+        return contextlib.nullcontext()
+
+    def is_broadcast(self, routing_key) -> bool:
+        """Indicates whether or not a message with the given routing key is a
+        broadcast message that should affect every process in pool mode,
+        rather than just the one that happens to receive it. (The output of
+        broadcast messages is only published once, by the parent process.)
+
+        The default implementation of this method returns False."""
+        return False
+
+    def broadcast_state(self):
+        """Returns a picklable snapshot of all of the state that broadcast
+        messages have built up in this object. In pool mode, worker processes
+        are brought up to date by passing this snapshot to their
+        restore_broadcast_state function before they handle their next batch,
+        so they never need to see the broadcast messages themselves.
+
+        The default implementation of this method returns None."""
+        return None
+
+    def restore_broadcast_state(self, state):
+        """(Pool process.) Replaces the state built up by broadcast messages
+        with a snapshot produced by broadcast_state in the parent process.
+
+        The default implementation of this method does nothing."""
+
+    def initialise_process(self):
+        """(Pool process.) Called once in each newly-forked worker process
+        before it handles any messages. Subclasses can override this method to
+        replace any state that shouldn't be shared with the parent process.
+
+        The default implementation of this method does nothing."""
+
     def handle_message_raw(self, channel, method, properties, body):
         """(Background thread.) Collects a message and stores it for later
         retrieval by the main thread."""
         with self._condition:
             self._incoming.add((method, properties, body,))
+            self._unsettled.add(method.delivery_tag)
             trace(f"PikaPipelineThread - Thread TID: {self.native_id}"
                   " handled incoming message. Notifying other threads.")
             self._condition.notify()
@@ -423,44 +816,27 @@ class PikaPipelineThread(threading.Thread, PikaPipelineRunner):
         thread.)"""
         with self._condition:
             self._live = True
+            self._unsettled.clear()
             self._condition.notify()
         consumer_tags = self._basic_consume(exclusive=self._exclusive)
         try:
             running = True
             while running:
                 with self._condition:
-                    # Process all of the enqueued actions
-                    while self._outgoing:
-                        head = self._outgoing.pop(0)
-                        trace("PikaPipelineThread - Thread TID:"
-                              f" {self.native_id} got the conditional."
-                              " Processing outgoing message.")
-                        match head:
-                            case ("msg", routing_key, body, exchange, props):
-                                self.channel.basic_publish(
-                                        exchange=exchange,
-                                        routing_key=routing_key,
-                                        properties=pika.BasicProperties(**props),
-                                        body=body)
-                            case ("ack", delivery_tag):
-                                self.channel.basic_ack(delivery_tag)
-                            case ("rej", delivery_tag, requeue):
-                                self.channel.basic_reject(
-                                        delivery_tag, requeue=requeue)
-                            case ("fin",):
-                                running = False
-                                break
-                            case ("syn", ev):
-                                ev.set()
-                            case ("zzz", duration):
-                                time.sleep(duration)
-
-                # Dispatch any waiting timer (heartbeats) and channel (calls to
-                # our handle_message_raw method) callbacks...
-                self.connection.process_data_events(0)
-                # ... and then sleep for a moment to avoid overburdening the
-                # system
-                time.sleep(0.1)
+                    requests = self._outgoing
+                    self._outgoing = deque()
+                    self._wakeup_pending = False
+                trace("PikaPipelineThread - Thread TID:"
+                      f" {self.native_id} processing {len(requests)}"
+                      " outgoing requests.")
+                running = self._process_requests(requests)
+
+                if running:
+                    # Wait for network activity (including heartbeats and
+                    # calls to our handle_message_raw method) or for a call to
+                    # _request_wakeup
+                    self.connection.process_data_events(_MAX_POLL_INTERVAL)
+                    self._settle_fetches()
         except BaseException as ex:
             if isinstance(ex, (
                     pika.exceptions.ChannelClosed,
@@ -478,10 +854,219 @@ class PikaPipelineThread(threading.Thread, PikaPipelineRunner):
         finally:
             if self.has_channel:
                 self._basic_cancel(consumer_tags)
+            self._settle_fetches(abandon=True)
             with self._condition:
                 self._live = False
                 self._condition.notify()
 
+    def _process_requests(self, requests: deque) -> bool:  # noqa: CCR001, E501 too high cognitive complexity
+        """(Background thread.) Carries out a sequence of requests, returning
+        False if one of them was a request to stop.
+
+        Acknowledgements are collected and sent together, as late as possible:
+        a run of consecutive delivery tags is acknowledged with a single
+        frame."""
+        acks = set()
+        try:
+            while requests:
+                match requests.popleft():
+                    case ("msg", routing_key, body, exchange, props):
+                        self._publish(acks, exchange, routing_key, body, props)
+                    case ("def", digest, body):
+                        self._store_definition(acks, digest, body)
+                    case ("get", stored, digest, future):
+                        self._fetch_definition(stored, digest, future)
+                    case ("ack", delivery_tag):
+                        if self._max_unconfirmed:
+                            self._held_acks.append(
+                                    (self._publish_seq, delivery_tag))
+                            self._release_acks(acks)
+                        else:
+                            acks.add(delivery_tag)
+                    case ("rej", delivery_tag, requeue):
+                        self._unsettled.discard(delivery_tag)
+                        self.channel.basic_reject(
+                                delivery_tag, requeue=requeue)
+                    case ("fin",):
+                        # Give the broker a chance to confirm what we've
+                        # already published; anything else will be
+                        # redelivered
+                        self._await_confirmations(
+                                acks, 0, timeout=_MAX_SHUTDOWN_WAIT)
+                        return False
+                    case ("syn", ev):
+                        self._await_confirmations(acks, 0)
+                        self._send_acks(acks)
+                        ev.set()
+                    case ("zzz", duration):
+                        self._send_acks(acks)
+                        time.sleep(duration)
+            self._release_acks(acks)
+            return True
+        finally:
+            self._send_acks(acks)
+
+    def _publish(self, acks: set, exchange, routing_key, body, props):
+        """(Background thread.) Publishes a message, keeping track of it if
+        publisher confirms are enabled."""
+        if self._max_unconfirmed:
+            self._await_confirmations(acks, self._max_unconfirmed - 1)
+        self.channel.basic_publish(
+                exchange=exchange,
+                routing_key=routing_key,
+                properties=pika.BasicProperties(**props),
+                body=body)
+        if self._max_unconfirmed:
+            self._publish_seq += 1
+            self._unconfirmed.add(self._publish_seq)
+
+    @property
+    def definition_channel(self):
+        """(Background thread.) Returns the channel used to read the definition
+        stream, creating one if necessary."""
+        if not self._definition_channel:
+            channel = self.connection.channel()
+            channel.basic_qos(prefetch_count=_DEFINITION_PREFETCH)
+            channel.queue_declare(
+                    codec.DEFINITION_STREAM, durable=True,
+                    arguments=_definition_stream_arguments)
+            self._definition_channel = channel
+        return self._definition_channel
+
+    def clear(self):
+        # The definition channel belongs to the connection that's going away
+        self._definition_channel = None
+        super().clear()
+
+    def _store_definition(self, acks: set, digest: bytes, body: bytes):
+        """(Background thread.) Appends a definition to the definition
+        stream."""
+        if not self._definition_stream_declared:
+            self.channel.queue_declare(
+                    codec.DEFINITION_STREAM, durable=True,
+                    arguments=_definition_stream_arguments)
+            self._definition_stream_declared = True
+        self._publish(
+                acks, "", codec.DEFINITION_STREAM, body,
+                _wire_formats["msgpack+zstd"]
+                | {"headers": {"digest": digest.hex()}})
+
+    def _fetch_definition(self, stored: int, digest: bytes, future: Future):
+        """(Background thread.) Starts reading the definition stream from just
+        before the given definition was stored, looking for it. (Reading a
+        stream doesn't consume anything, so any number of consumers can look
+        for the same definition at once.)
+
+        The future will be given the definition's body when it's found, or
+        None if it hasn't been found after _DEFINITION_TIMEOUT seconds."""
+        self._fetch_seq += 1
+        consumer_tag = f"os2ds-definition-{self._fetch_seq}"
+        self._fetches[consumer_tag] = (
+                digest, future, time.monotonic() + _DEFINITION_TIMEOUT)
+        try:
+            self.definition_channel.basic_consume(
+                    codec.DEFINITION_STREAM, self._on_definition,
+                    consumer_tag=consumer_tag,
+                    arguments={
+                        "x-stream-offset": datetime.fromtimestamp(
+                                stored - _DEFINITION_CLOCK_SKEW,
+                                timezone.utc),
+                    })
+        except BaseException as ex:
+            del self._fetches[consumer_tag]
+            future.set_exception(ex)
+            raise
+
+    def _on_definition(self, channel, method, properties, body):
+        """(Background thread.) Checks whether a definition read from the
+        definition stream is the one that its consumer is looking for."""
+        channel.basic_ack(method.delivery_tag)
+        match self._fetches.get(method.consumer_tag):
+            case (digest, future, _) if not future.done():
+                headers = properties.headers or {}
+                if headers.get("digest") == digest.hex():
+                    future.set_result(body)
+
+    def _settle_fetches(self, *, abandon: bool = False):
+        """(Background thread.) Stops reading the definition stream for every
+        definition that has been found, or that has been looked for for too
+        long (or for all of them, if abandon is True)."""
+        now = time.monotonic()
+        for consumer_tag, (_, future, deadline) in list(self._fetches.items()):
+            if not (abandon or future.done() or now >= deadline):
+                continue
+            del self._fetches[consumer_tag]
+            if not future.done():
+                future.set_result(None)
+            if self._definition_channel:
+                try:
+                    self._definition_channel.basic_cancel(consumer_tag)
+                except pika.exceptions.AMQPError:
+                    if not abandon:
+                        raise
+
+    def _release_acks(self, acks: set):
+        """(Background thread.) Moves the delivery tags of held messages whose
+        output has been confirmed into the given set of acknowledgements, or
+        rejects them if some of their output was refused by the broker."""
+        while self._held_acks:
+            last_seq, delivery_tag = self._held_acks[0]
+            if self._unconfirmed and self._unconfirmed[0] <= last_seq:
+                break
+            self._held_acks.popleft()
+
+            end = self._nacked.bisect_right(last_seq)
+            if end:
+                # Something published before this acknowledgement was lost:
+                # requeue the message so that its output will be reproduced
+                # (the broker doesn't tell us which message the lost
+                # publication belonged to, so this may requeue too much)
+                del self._nacked[:end]
+                self._unsettled.discard(delivery_tag)
+                self.channel.basic_reject(delivery_tag, requeue=True)
+            else:
+                acks.add(delivery_tag)
+
+    def _await_confirmations(
+            self, acks: set, limit: int, timeout: float = None):
+        """(Background thread.) Processes network events until no more than
+        limit published messages are waiting for confirmation by the broker
+        (or until the timeout, if there is one, elapses), releasing the
+        acknowledgements of messages whose output has been confirmed."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while self._max_unconfirmed:
+            self._release_acks(acks)
+            if len(self._unconfirmed) <= limit and (
+                    limit or not self._held_acks):
+                break
+            elif deadline is not None and time.monotonic() >= deadline:
+                break
+            # Don't make the broker wait for acknowledgements that we could
+            # already have sent
+            self._send_acks(acks)
+            self.connection.process_data_events(_MAX_POLL_INTERVAL)
+
+    def _send_acks(self, acks: set):
+        """(Background thread.) Acknowledges, and then forgets, the given
+        delivery tags."""
+        if not acks:
+            return
+        # Find the longest run of acknowledged tags at the start of the list of
+        # unsettled messages: these can all be acknowledged at once
+        last = None
+        for tag in self._unsettled:
+            if tag not in acks:
+                break
+            last = tag
+        if last is not None:
+            self.channel.basic_ack(last, multiple=True)
+            del self._unsettled[:self._unsettled.bisect_right(last)]
+        for tag in sorted(acks):
+            if last is None or tag > last:
+                self._unsettled.discard(tag)
+                self.channel.basic_ack(tag)
+        acks.clear()
+
     def run_consumer(self):  # noqa: CCR001, E501 too high cognitive complexity
         """Receives messages from the registered input queues, dispatches them
         to the handle_message function, and generates new output messages. All
@@ -507,31 +1092,37 @@ class PikaPipelineThread(threading.Thread, PikaPipelineRunner):
 
         old_handler = signal.signal(signal.SIGTERM, _handler)
 
+        if self._processes > 1:
+            # Fork the pool before starting the background thread, and move
+            # everything that's been loaded so far out of the garbage
+            # collector's view so that the pool processes can keep sharing it
+            gc.freeze()
+            self._start_pool()
+
         self.start()
         try:
             while running and self.is_alive():
+                if self._batch_size > 1 or self._pool:
+                    self._consume_batch()
+                    continue
+
                 method, properties, body = self.await_message(timeout=30.0)
                 if method == properties == body is None:
                     continue
                 try:
                     key = method.routing_key
-                    dbd = json_utf8_decode(body)
+                    dbd = _load_body(body)
 
                     for msg in self.handle_message(key, dbd):
-                        match msg:
-                            case (routing_key, message, exchange, headers):
-                                self.enqueue_message(routing_key,
-                                                     message,
-                                                     exchange=exchange,
-                                                     **headers)
-                            case (routing_key, message):
-                                self.enqueue_message(routing_key, message)
+                        self._enqueue_all(self._prepare_output(msg))
 
                     self.enqueue_ack(method.delivery_tag)
                     self.after_message(key, dbd)
                 except RejectMessage as ex:
                     self.enqueue_reject(method.delivery_tag, requeue=ex.requeue)
         finally:
+            if self._pool:
+                self._stop_pool()
             self.enqueue_stop()
             self.join()
             signal.signal(signal.SIGTERM, old_handler)
@@ -547,3 +1138,146 @@ class PikaPipelineThread(threading.Thread, PikaPipelineRunner):
         if self._shutdown_exception:
             raise Exception("Worker thread died unexpectedly") from (
                     self._shutdown_exception)
+        if self._pool_exception:
+            raise Exception("Worker process failed unexpectedly") from (
+                    self._pool_exception)
+
+    def _start_pool(self):
+        """(Main thread.) Forks the pool of worker processes."""
+        self._pool_exception = None
+        self._pool_closing = False
+        self._pool = ProcessPoolExecutor(
+                self._processes,
+                mp_context=multiprocessing.get_context("fork"),
+                initializer=_initialise_process, initargs=(self,))
+        # The executor forks all of its processes when the first task is
+        # submitted; make sure that happens now, and not after the background
+        # thread has started
+        self._pool.submit(_no_op).result()
+
+    def _stop_pool(self):
+        """(Main thread.) Kills the pool of worker processes without waiting
+        for them to finish their batches. (Anything still in flight will be
+        redelivered by the server.)"""
+        self._pool_closing = True
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        # (The pool's processes are the only multiprocessing children of the
+        # parent process)
+        for process in multiprocessing.active_children():
+            process.terminate()
+        self._pool = None
+
+    def _prepare_output(self, msg: HandleMessageType) -> list[tuple]:
+        match msg:
+            case (routing_key, message, exchange, headers):
+                return self._prepare_message(
+                        routing_key, message, exchange=exchange, **headers)
+            case (routing_key, message):
+                return self._prepare_message(routing_key, message)
+
+    def _consume_batch(self):
+        """(Main thread.) Collects a batch of messages and either handles them
+        here or sends them to the worker pool."""
+        deliveries = self.await_messages(
+                self._batch_size, self._batch_linger, timeout=30.0)
+        if not deliveries:
+            return
+
+        deliveries = [(method.delivery_tag, method.routing_key, body)
+                      for method, _, body in deliveries]
+        if self._pool:
+            broadcasts = [d for d in deliveries if self.is_broadcast(d[1])]
+            if broadcasts:
+                self._complete_batch(self._handle_batch(
+                        broadcasts, flush=self._enqueue_all))
+                self._broadcast_seq += len(broadcasts)
+                self._broadcast_state = self.broadcast_state()
+                deliveries = [
+                        d for d in deliveries if not self.is_broadcast(d[1])]
+            if deliveries:
+                try:
+                    future = self._pool.submit(
+                            _handle_batch_in_process,
+                            self._broadcast_seq, self._broadcast_state,
+                            deliveries)
+                except BrokenProcessPool as ex:
+                    self._fail_batch(ex)
+                else:
+                    future.add_done_callback(self._finish_batch)
+        else:
+            self._complete_batch(
+                    self._handle_batch(deliveries, flush=self._enqueue_all))
+
+    def _handle_batch(self, deliveries, flush=None):
+        """Dispatches each of a batch of (delivery tag, routing key, raw body)
+        3-tuples to the handle_message function. Returns a list of requests
+        for the background thread -- the resulting output messages,
+        acknowledgements and rejections -- and a list of the (routing key,
+        body) pairs of the messages that were handled successfully.
+
+        If the flush function is specified, it will be called to dispose of
+        the requests collected so far whenever there are too many of them."""
+        batch = self.prepare_batch(
+                [(tag, key, _load_body(body))
+                 for tag, key, body in deliveries])
+
+        requests = []
+        handled = []
+        with self.batch_context():
+            for tag, key, dbd in batch:
+                outputs = []
+                try:
+                    for msg in self.handle_message(key, dbd):
+                        outputs.extend(self._prepare_output(msg))
+                except RejectMessage as ex:
+                    requests.append(("rej", tag, ex.requeue))
+                    continue
+                requests.extend(outputs)
+                requests.append(("ack", tag))
+                handled.append((key, dbd))
+
+                if flush and len(requests) >= _MAX_PENDING_REQUESTS:
+                    # Don't hold on to an unbounded number of output messages
+                    # while the rest of the batch is handled
+                    flush(requests)
+                    requests = []
+        return requests, handled
+
+    def _finish_batch(self, future):
+        """(Pool thread.) Completes a batch handed over to the worker pool, or
+        fails it if the worker process raised an exception or died. (The pool
+        fails every outstanding batch when one of its processes dies, so their
+        deliveries never go unsettled.)"""
+        try:
+            result = future.result()
+        except BaseException as ex:
+            self._fail_batch(ex)
+        else:
+            self._complete_batch(result)
+
+    def _complete_batch(self, result):
+        """Enqueues the requests produced by _handle_batch and calls the
+        after_message function for all of the messages that were handled. (In
+        pool mode, this method is called on one of the pool's threads.)"""
+        requests, handled = result
+        try:
+            self._enqueue_all(requests)
+        except RuntimeError:
+            # The background thread has already stopped, so these messages
+            # will be redelivered anyway
+            logger.warning(
+                    f"discarding the results of {len(handled)} messages")
+            return
+        for key, dbd in handled:
+            self.after_message(key, dbd)
+
+    def _fail_batch(self, ex):
+        """(Pool thread.) Stops the consumer when a worker process fails to
+        handle a batch of messages, as an exception on the main thread would
+        have done. (The broker will redeliver the batch's messages once the
+        connection is closed.)"""
+        if self._pool_closing:
+            # We killed the worker processes ourselves
+            return
+        self._pool_exception = ex
+        self.enqueue_stop()
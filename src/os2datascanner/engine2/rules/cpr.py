@@ -1,16 +1,18 @@
-from typing import Iterator, List, Match, Optional, Tuple, Dict
+from typing import Iterator, Iterable, List, Match, Optional, Tuple, Dict
 import re
 from functools import partial
 from itertools import chain
 from enum import Enum, unique
 import structlog
-from math import ceil
+from math import ceil, isnan
+import numpy as np
 
 from .rule import Rule, Sensitivity
 from .regex import RegexRule
 from .logical import oxford_comma
 from .utilities.context import make_context, add_context_filter
-from .utilities.cpr_probability import modulus11_check, CprProbabilityCalculator
+from .utilities.cpr_probability import (
+        modulus11_check_many, CprProbabilityCalculator)
 
 logger = structlog.get_logger(__name__)
 
@@ -98,8 +100,7 @@ class CPRRule(RegexRule):
         else:
             return "CPR number"
 
-    def _bin_check(self, numbers, cprs):  # noqa: CCR001, C901 too high cognitive complexity
-        num_elems = len(numbers)
+    def _bin_check(self, numbers, cprs):
         num_cprs = len(cprs)
         if num_cprs == 0:
             return []
@@ -108,32 +109,30 @@ class CPRRule(RegexRule):
         num_bins = 40
         bin_size = ceil(file_size / num_bins)
 
+        # Every match falls into one of the bins 1 to num_bins (bin 0 is a
+        # sentinel that's never accepted)
+        num_bins_of = np.fromiter(
+                (m.start(0) for m in numbers), np.int64, len(numbers)
+                ) // bin_size + 1
+        cpr_bins_of = np.fromiter(
+                (m.start(0) for m in cprs), np.int64, num_cprs
+                ) // bin_size + 1
+        nums_in_bins = np.bincount(
+                num_bins_of, minlength=num_bins + 1).tolist()
+        cprs_in_bins = np.bincount(
+                cpr_bins_of, minlength=num_bins + 1).tolist()
+
         bin_accepted = [False] * (num_bins + 1)
-        bin_storage = [[] for _ in range(num_bins + 1)]
 
         cut_off = 0.15
 
-        i_nums = 0
-        i_cprs = 0
         for i_bin in range(1, num_bins+1):
-            def elements_in_bin(i, max_elems, elems, end_point):
-                elems_in_bin = []
-                while i < max_elems and elems[i].start(0) < (end_point):
-                    elems_in_bin.append(elems[i])
-                    i += 1
-                return elems_in_bin
-
-            # Iterates through all elements in current bin
-            nums_in_bin = len(elements_in_bin(i_nums, num_elems, numbers, bin_size * i_bin))
-            i_nums += nums_in_bin
-
-            # Iterates through all cprs in current bin
-            cprs_in_bin = elements_in_bin(i_cprs, num_cprs, cprs, bin_size * i_bin)
-            i_cprs += len(cprs_in_bin)
-            bin_storage[i_bin].extend(cprs_in_bin)
+            nums_in_bin = nums_in_bins[i_bin]
 
             # Check if a bin has matches and is above the cut-off limit.
-            bin_accepted[i_bin] = nums_in_bin == 0 or (len(cprs_in_bin) / nums_in_bin >= cut_off)
+            bin_accepted[i_bin] = (
+                    nums_in_bin == 0
+                    or cprs_in_bins[i_bin] / nums_in_bin >= cut_off)
 
             # A bin who's neighbors weren't accepted, isn't accepted
             bin_accepted[i_bin-1] = (bin_accepted[i_bin-1] and
@@ -142,43 +141,53 @@ class CPRRule(RegexRule):
         # Check last bins neighbor
         bin_accepted[num_bins] = bin_accepted[num_bins] and bin_accepted[num_bins-1]
 
-        filtered_cprs = chain.from_iterable(
-            bin_storage[i] for i in range(1, num_bins+1) if bin_accepted[i])
-        return list(filtered_cprs)
-
-    def match(self, content: str) -> Optional[Iterator[dict]]:  # noqa: CCR001,E501,C901 too high cognitive complexity
-        if content is None:
-            return
+        accepted = np.array(bin_accepted)[cpr_bins_of]
+        return [m for m, a in zip(cprs, accepted.tolist()) if a]
+
+    def _check_candidates(self, cprs: List[str]) -> List[float]:
+        """Performs the exception, modulus-11 and probability checks on all of
+        the given candidate CPR numbers at once. Returns, for each candidate,
+        either the probability that it's a real CPR number or NaN if it was
+        rejected."""
+        probabilities = np.ones(len(cprs))
+        if self._exceptions:
+            probabilities[[c in self._exceptions for c in cprs]] = np.nan
+        if self._modulus_11:
+            probabilities[~modulus11_check_many(cprs)] = np.nan
+        if self._ignore_irrelevant:
+            probabilities *= calculator.cpr_check_many(
+                    cprs, do_mod11_check=False)
+        return probabilities.tolist()
 
+    def match_found(  # noqa: CCR001,C901 too high cognitive complexity
+            self, content: str,
+            found: Iterable[Match[str]]) -> Optional[Iterator[dict]]:
         if self._examine_context and self._blacklist:
             if (m := self._blacklist_pattern.search(content.lower())):
                 logger.debug("Blacklist matched content", matches=m.group(0))
                 return
 
-        def _is_cpr(candidate: Match[str]):  # noqa: CCR001 Cognitive complexity is too high
-            cpr = candidate.group(1).replace(" ", "") + candidate.group(2)
-
-            if cpr in self._exceptions:
-                return False
-
-            if self._modulus_11:
-                mod11, reason = modulus11_check(cpr)
-                if not mod11:
-                    logger.debug(f"{cpr} failed modulus11 check due to {reason}")
-                    return False
-
-            probability = 1.0
-            if self._ignore_irrelevant:
-                probability = calculator.cpr_check(cpr, do_mod11_check=False)
-                if isinstance(probability, str):
-                    logger.debug(f"{cpr} is not valid cpr due to {probability}")
-                    return False
+        numbers = list(found)
+        candidates = [m.group(1).replace(" ", "") + m.group(2) for m in numbers]
+        probabilities = self._check_candidates(candidates)
+        logger.debug(
+                "checked CPR number candidates",
+                candidates=len(candidates),
+                rejected=sum(isnan(p) for p in probabilities))
+
+        # Only the candidates that survived the checks above need to have
+        # their context examined
+        cpr_numbers = []
+        results = {}
+        for m, cpr, probability in zip(numbers, candidates, probabilities):
+            if isnan(probability):
+                continue
 
             cpr = cpr[0:4] + "XXXXXX"
-            low, high = candidate.span()
+            low, high = m.span()
             # only examine context if there is any
             if self._examine_context and len(content) > (high - low):
-                p, ctype = self.examine_context(candidate)
+                p, ctype = self.examine_context(m)
                 # determine if probability stems from context or calculator
                 probability = p if p is not None else probability
                 ctype = ctype if ctype != [] else Context.PROBABILITY_CALC
@@ -186,35 +195,14 @@ class CPRRule(RegexRule):
                              f"due to {ctype}")
 
             if probability:
-                return True
-            else:
-                return False
-
-        numbers = [m for m in self._compiled_expression.finditer(content)]
-
-        cpr_numbers = [m for m in numbers if _is_cpr(m)]
+                cpr_numbers.append(m)
+                results[low] = (cpr, probability)
 
         if self._examine_context:
             cpr_numbers = self._bin_check(numbers, cpr_numbers)
 
         for m in cpr_numbers:
-            cpr = m.group(1).replace(" ", "") + m.group(2)
-
-            probability = 1.0
-            if self._ignore_irrelevant:
-                probability = calculator.cpr_check(cpr, do_mod11_check=False)
-
-            cpr = cpr[0:4] + "XXXXXX"
-            low, high = m.span()
-            # only examine context if there is any
-            if self._examine_context and len(content) > (high - low):
-                p, ctype = self.examine_context(m)
-                # determine if probability stems from context or calculator
-                probability = p if p is not None else probability
-                ctype = ctype if ctype != [] else Context.PROBABILITY_CALC
-                logger.debug(f"{cpr} with probability {probability} from context "
-                             f"due to {ctype}")
-
+            cpr, probability = results[m.start()]
             yield {
                 "match": cpr,
 
@@ -42,18 +42,31 @@ class Loader:
         except FileNotFoundError:
             raise DatasetNotFoundError(category, None)
 
-    def load_dataset(self, category, dataset):
+    def iter_dataset(self, category, dataset):
+        """Yields the entries of a dataset one at a time. Unlike load_dataset,
+        this doesn't keep the entries in memory afterwards (although entries
+        that have already been loaded will be reused)."""
+        if (entries := self.get_dataset(category, dataset)) is not None:
+            yield from entries
+            return
         try:
             dataset_file = _HERE.joinpath(category, dataset + ".jsonl")
-            entries = []
-            with dataset_file.open("rt") as f:
-                for line in f:
-                    if not line.startswith("#"):
-                        entries.append(json.loads(line))
-            self._datasets.setdefault(category, {})[dataset] = entries
-            return entries
+            f = dataset_file.open("rt")
         except FileNotFoundError:
             raise DatasetNotFoundError(category, dataset)
+        with f:
+            for line in f:
+                if not line.startswith("#"):
+                    yield json.loads(line)
+
+    def load_dataset(self, category, dataset):
+        if (entries := self.get_dataset(category, dataset)) is not None:
+            # Datasets are never modified after they've been loaded, so
+            # there's no need to read the file again
+            return entries
+        entries = list(self.iter_dataset(category, dataset))
+        self._datasets.setdefault(category, {})[dataset] = entries
+        return entries
 
 
 common = Loader()
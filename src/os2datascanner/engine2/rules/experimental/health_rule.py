@@ -1,5 +1,6 @@
 import structlog
 from typing import Iterator, Optional
+from functools import lru_cache
 
 from ...conversions.types import OutputType
 from ..rule import Rule, SimpleRule, Sensitivity
@@ -9,6 +10,15 @@ from os2ds_rules.wordlist_rule import WordListRule
 logger = structlog.get_logger(__name__)
 
 
+@lru_cache(maxsize=4)
+def _make_wordlist_rule(dataset: str) -> WordListRule:
+    """Builds a WordListRule for the given wordlist dataset. (Building the
+    underlying automaton is expensive, so this is done only once for each
+    dataset, and the result is shared by the whole process.)"""
+    words = common_loader.load_dataset("wordlists", dataset)
+    return WordListRule([str.lower(word) for word in words])
+
+
 class TurboHealthRule(SimpleRule):
     """
     This rule searches for health-terms based on a revised version
@@ -23,8 +33,7 @@ class TurboHealthRule(SimpleRule):
 
     def __init__(self, **super_kwargs):
         super().__init__(**super_kwargs)
-        dataset = common_loader.load_dataset("wordlists", "da_20211018_laegehaandbog_stikord")
-        self._rule = WordListRule([str.lower(word) for word in dataset])
+        self._rule = _make_wordlist_rule("da_20211018_laegehaandbog_stikord")
 
     def match(self, content: str) -> Optional[Iterator[dict]]:
         if not content:
@@ -1,5 +1,9 @@
+from typing import Optional
+from datetime import datetime
+
 from ..conversions.types import OutputType
 from .rule import Rule, SimpleRule, Sensitivity
+from .logical import AndRule
 
 
 class LastModifiedRule(SimpleRule):
@@ -13,6 +17,10 @@ class LastModifiedRule(SimpleRule):
         OutputType.LastModified.encode_json_object(after)
         self._after = after
 
+    @property
+    def after(self) -> datetime:
+        return self._after
+
     @property
     def presentation_raw(self):
         return "last modified after {0}".format(
@@ -40,3 +48,16 @@ class LastModifiedRule(SimpleRule):
                 after=OutputType.LastModified.decode_json_object(obj["after"]),
                 sensitivity=Sensitivity.make_from_dict(obj),
                 name=obj["name"] if "name" in obj else None)
+
+
+def get_modified_after(rule: Rule) -> Optional[datetime]:
+    """Returns the time after which an object must have been modified for the
+    given Rule to match it, or None if the Rule can match objects regardless
+    of when they were modified."""
+    if isinstance(rule, LastModifiedRule):
+        return rule.after
+    elif isinstance(rule, AndRule):
+        cutoffs = [c for c in map(get_modified_after, rule.components) if c]
+        return max(cutoffs, default=None)
+    else:
+        return None
@@ -2,8 +2,8 @@ import regex
 
 from ..conversions.types import OutputType
 from .rule import Rule, SimpleRule, Sensitivity
-from .datasets.loader import common as common_loader
 from .utilities.context import make_context
+from .utilities.name_index import get_name_index
 
 _whitespace = (
         r"[^\S\n\r]+"  # One or more of every whitespace character (apart from
@@ -74,10 +74,6 @@ class NameRule(SimpleRule):
             **super_kwargs):
         super().__init__(**super_kwargs)
 
-        # Convert list of str to upper case and to sets for efficient lookup
-        self.last_names = None
-        self.first_names = None
-
         self._expansive = expansive
         self._whitelist = frozenset(n.upper() for n in (whitelist or []))
         self._blacklist = frozenset(n.upper() for n in (blacklist or []))
@@ -86,26 +82,8 @@ class NameRule(SimpleRule):
     def presentation_raw(self):
         return "personal name"
 
-    def _load_datasets(self):
-        if self.first_names is None:
-            # Convert list of str to upper case and to sets for efficient
-            # lookup
-            m = set(map(str.upper,
-                    common_loader.load_dataset(
-                            "names", "da_20140101_dst_fornavne-mænd")))
-            k = set(map(str.upper,
-                    common_loader.load_dataset(
-                            "names", "da_20140101_dst_fornavne-kvinder")))
-            e = set(map(str.upper,
-                    common_loader.load_dataset(
-                            "names", "da_20140101_dst_efternavne")))
-            f = m.union(k)
-
-            self.last_names = e
-            self.first_names = f
-
     def match(self, text):  # noqa: CCR001, too high cognitive complexity
-        self._load_datasets()
+        first_names, last_names = get_name_index()
         unmatched_text = text
 
         def is_name_component(
@@ -126,19 +104,19 @@ class NameRule(SimpleRule):
             last_name = last_name or ""
 
             # Match each name against the list of first and last names
-            first_match = is_name_component(first_name, self.first_names)
-            last_match = is_name_component(last_name, self.last_names)
+            first_match = is_name_component(first_name, first_names)
+            last_match = is_name_component(last_name, last_names)
             middle_match = any(
-                is_name_component(n, self.first_names, self.last_names)
+                is_name_component(n, first_names, last_names)
                 for n in middle_names
             )
             # But what if the name is Word Firstname Lastname?
             while middle_match and not first_match:
                 old_name = first_name
                 first_name = middle_names.pop(0)
-                first_match = is_name_component(first_name, self.first_names)
+                first_match = is_name_component(first_name, first_names)
                 middle_match = any(
-                    is_name_component(n, self.first_names, self.last_names)
+                    is_name_component(n, first_names, last_names)
                     for n in middle_names
                 )
                 matched_text = matched_text.lstrip(old_name)
@@ -147,9 +125,9 @@ class NameRule(SimpleRule):
             while middle_match and not last_match:
                 old_name = last_name
                 last_name = middle_names.pop()
-                last_match = is_name_component(last_name, self.last_names)
+                last_match = is_name_component(last_name, last_names)
                 middle_match = any(
-                    is_name_component(n, self.first_names, self.last_names)
+                    is_name_component(n, first_names, last_names)
                     for n in middle_names
                 )
                 matched_text = matched_text.rstrip(old_name)
@@ -201,7 +179,7 @@ class NameRule(SimpleRule):
             for m in it:
                 matched = m.group(0)
                 if is_name_component(
-                        matched.upper(), self.first_names, self.last_names):
+                        matched.upper(), first_names, last_names):
                     yield {
                         "match": matched,
                         "probability": 0.1,
@@ -1,4 +1,5 @@
-from typing import Iterator, Optional
+import re
+from typing import Iterator, Iterable, Optional
 import structlog
 from itertools import pairwise
 
@@ -52,11 +53,10 @@ class PassportRule(RegexRule):
     def presentation_raw(self) -> str:
         return "Passport MRZ"
 
-    def match(self, content: str) -> Optional[Iterator[dict]]:  # noqa: CCR001,E501 too high cognitive complexity
-        if content is None:
-            return
-
-        for match in self._compiled_expression.finditer(content):
+    def match_found(  # noqa: CCR001 too high cognitive complexity
+            self, content: str,
+            found: Iterable[re.Match]) -> Optional[Iterator[dict]]:
+        for match in found:
             country_issued, *passport_data, cd_all = match.groups()
             passport_number = passport_data[0]
 
@@ -1,5 +1,5 @@
 import re
-from typing import Iterator, Optional
+from typing import Iterator, Iterable, Optional
 
 from ..conversions.types import OutputType
 from .rule import Rule, SimpleRule, Sensitivity
@@ -20,12 +20,21 @@ class RegexRule(SimpleRule):
     def presentation_raw(self) -> str:
         return 'regular expression matching "{0}"'.format(self._expression)
 
+    @property
+    def scan_expression(self) -> re.Pattern:
+        return self._compiled_expression
+
     def match(self, content: str) -> Optional[Iterator[dict]]:
         if content is None:
             return
 
-        for match in self._compiled_expression.finditer(content):
-            low, high = match.span()
+        yield from self.match_found(
+                content, self._compiled_expression.finditer(content))
+
+    def match_found(
+            self, content: str,
+            found: Iterable[re.Match]) -> Optional[Iterator[dict]]:
+        for match in found:
             yield {
                 "match": match.string[match.start(): match.end()],
                 **make_context(match, content),
@@ -1,12 +1,19 @@
 from abc import abstractmethod
 from enum import Enum
+import re
 import json
-from typing import Union, Optional, Tuple, Iterator, Callable, Any
+import threading
+from collections import OrderedDict
+from typing import (
+        Union, Optional, Tuple, Iterator, Iterable, Callable, Any)
 from itertools import islice
+from prometheus_client import Counter
 
+from .. import settings as engine2_settings
 from ..utilities.json import JSONSerialisable
 from ..utilities.equality import TypePropertyEquality
 from ..conversions.types import OutputType
+from .utilities.plan import MatchingPlan
 
 
 class Sensitivity(Enum):
@@ -48,6 +55,17 @@ sensitivity_labels = {
 }
 
 
+rule_cache_hits = Counter(
+        "os2datascanner_rule_cache_hits",
+        "Rules retrieved from the deserialisation cache")
+rule_cache_misses = Counter(
+        "os2datascanner_rule_cache_misses",
+        "Rules not found in the deserialisation cache")
+
+_rule_cache: OrderedDict[str, "Rule"] = OrderedDict()
+_rule_cache_lock = threading.Lock()
+
+
 class Rule(TypePropertyEquality, JSONSerialisable):
     """A Rule represents a test to be applied to a representation of an
     object.
@@ -116,12 +134,17 @@ class Rule(TypePropertyEquality, JSONSerialisable):
         the obj_limit keyword argument to improve performance.)
 
         Note that this method can optimise the reduction of this Rule; the
-        result of a SimpleRule might be cached and reused, for example."""
+        result of a SimpleRule might be cached and reused, for example. (If
+        several of this Rule's components search text for regular
+        expressions, then they'll share a single pass over that text; see the
+        MatchingPlan class.)"""
         if isinstance(get_representation, dict):
             get_representation = get_representation.__getitem__
 
         here = self
         matches = {}
+        plan = MatchingPlan.for_rule(self)
+        found = None
         while not isinstance(here, bool):
             head, pve, nve = here.split()
             try:
@@ -131,8 +154,16 @@ class Rule(TypePropertyEquality, JSONSerialisable):
                 # evaluating rules and return what we have to the caller
                 break
             if head not in matches:
-                matches[head] = list(
-                        islice(head.match(required_form), obj_limit))
+                if (plan and required_form is not None
+                        and plan.covers(head)):
+                    if found is None:
+                        found = plan.scan(required_form)
+                    results = head.match_found(
+                            required_form,
+                            found[head.scan_expression.pattern])
+                else:
+                    results = head.match(required_form)
+                matches[head] = list(islice(results, obj_limit))
             here = pve if matches[head] else nve
         return (here, list(matches.items()))
 
@@ -148,6 +179,37 @@ class Rule(TypePropertyEquality, JSONSerialisable):
             "name": self._name
         }
 
+    @classmethod
+    def from_json_object(cls, obj):
+        """Converts a JSON representation of a Rule, as returned by the
+        to_json_object method, back into a Rule.
+
+        Rules are immutable, so identical JSON representations will (within
+        the limits of the rules.cache_size setting) be converted into the same
+        shared Rule object."""
+        max_size = engine2_settings.rules["cache_size"]
+        try:
+            key = json.dumps(obj, sort_keys=True) if max_size > 0 else None
+        except (TypeError, ValueError):
+            key = None
+        if key is None:
+            return super().from_json_object(obj)
+
+        with _rule_cache_lock:
+            if (rule := _rule_cache.get(key)) is not None:
+                _rule_cache.move_to_end(key)
+        if rule is not None:
+            rule_cache_hits.inc()
+            return rule
+
+        rule_cache_misses.inc()
+        rule = super().from_json_object(obj)
+        with _rule_cache_lock:
+            _rule_cache[key] = rule
+            while len(_rule_cache) > max_size:
+                _rule_cache.popitem(last=False)
+        return rule
+
     def __str__(self):
         return self.presentation
 
@@ -177,3 +239,24 @@ class SimpleRule(Rule):
         each of which represents one match of this SimpleRule against the
         provided content. Matched content should appear under the dictionary's
         "match" key."""
+
+    @property
+    def scan_expression(self) -> Optional[re.Pattern]:
+        """If the match method of this SimpleRule begins by searching its
+        content for a regular expression, returns that compiled expression;
+        otherwise, returns None.
+
+        SimpleRules that return an expression here should also override the
+        match_found method, which is given the results of that search instead
+        of having to perform it again."""
+        return None
+
+    def match_found(
+            self, content, found: Iterable[re.Match]) -> Iterator[dict]:
+        """As match, but takes the (non-overlapping, ordered) matches of this
+        SimpleRule's scan expression against the provided content instead of
+        computing them.
+
+        The default implementation of this method ignores those matches and
+        calls match."""
+        return self.match(content)
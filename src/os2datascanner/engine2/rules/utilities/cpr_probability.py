@@ -1,5 +1,7 @@
-from typing import Union, Tuple
+from typing import Union, Tuple, Sequence, NamedTuple, Optional
 from datetime import date
+from functools import lru_cache
+import numpy as np
 
 
 # Updated list of dates with CPR numbers violating the Modulo-11 check. (Last
@@ -102,6 +104,74 @@ def modulus11_check_raw(cpr: str) -> bool:
     return sum([int(c) * v for c, v in zip(cpr, _mod_11_table)]) % 11 == 0
 
 
+# The functions below perform the same checks as their scalar counterparts, but
+# operate on a whole sequence of candidate CPR numbers at once. Each candidate
+# is represented as a row of ten digits in an integer array
+
+
+def _to_digits(cprs: Sequence[str]) -> np.ndarray:
+    """Converts a sequence of strings of ten ASCII digits into an (n, 10)
+    array of integers."""
+    if not cprs:
+        return np.zeros((0, 10), dtype=np.int64)
+    raw = np.frombuffer("".join(cprs).encode("ascii"), dtype=np.uint8)
+    return (raw.reshape(-1, 10) - ord("0")).astype(np.int64)
+
+
+def _is_simple(cpr: str) -> bool:
+    return len(cpr) == 10 and cpr.isascii() and cpr.isdigit()
+
+
+_days_in_month = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+_exception_date_keys = np.array(
+        [d.year * 10000 + d.month * 100 + d.day for d in CPR_EXCEPTION_DATES])
+
+
+def _birth_dates(digits: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """As get_birth_date, but returns an array of birth dates (in the form of
+    YYYYMMDD integers) and an array indicating which of those birth dates are
+    actually valid."""
+    day = digits[:, 0] * 10 + digits[:, 1]
+    month = digits[:, 2] * 10 + digits[:, 3]
+    year = digits[:, 4] * 10 + digits[:, 5]
+    year_check = digits[:, 6]
+
+    year += np.select(
+            [year_check <= 3, year_check == 4, year_check <= 8],
+            [1900,
+             np.where(year > 36, 1900, 2000),
+             np.where(year > 57, 1800, 2000)],
+            np.where(year > 37, 1900, 2000))
+
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    month_ok = (month >= 1) & (month <= 12)
+    last_day = (_days_in_month[np.clip(month, 1, 12) - 1]
+                + ((month == 2) & leap))
+    valid = month_ok & (day >= 1) & (day <= last_day)
+    return year * 10000 + month * 100 + day, valid
+
+
+def _modulus11_raw(digits: np.ndarray) -> np.ndarray:
+    return digits @ np.array(_mod_11_table) % 11 == 0
+
+
+def modulus11_check_many(cprs: Sequence[str]) -> np.ndarray:
+    """As modulus11_check, but checks many CPR numbers at once, returning an
+    array of booleans."""
+    simple = np.fromiter((_is_simple(c) for c in cprs), bool, len(cprs))
+    result = np.zeros(len(cprs), dtype=bool)
+
+    digits = _to_digits([c for c, ok in zip(cprs, simple) if ok])
+    birth_dates, valid = _birth_dates(digits)
+    result[simple] = valid & (
+            np.isin(birth_dates, _exception_date_keys)
+            | _modulus11_raw(digits))
+
+    for idx in np.flatnonzero(~simple):
+        result[idx] = modulus11_check(cprs[idx])[0]
+    return result
+
+
 class CprProbabilityCalculator(object):
     """Calculate the probability that a matched str of numbers is actually a CPR
 
@@ -115,11 +185,11 @@ class CprProbabilityCalculator(object):
       is to be a used number.
     * Currently, if a cpr-number matches a magic date, the returned values is
       always 0.5
-    """
 
-    def __init__(self):
-        # Cache of dates where the possible CPRs has already been calculated.
-        self.cached_cprs = {}
+    The information needed to check the CPR numbers of a given birth date is
+    computed once and cached for the whole process, so all instances of this
+    class share it.
+    """
 
     @staticmethod
     def _form_validator(cpr: str) -> str:
@@ -138,9 +208,7 @@ class CprProbabilityCalculator(object):
         if not cpr.isdigit():
             return "CPR can only contain digits"
 
-        try:
-            get_birth_date(cpr)
-        except ValueError:
+        if _birth_date(cpr[:7]) is None:
             return "Illegal date"
         return ""
 
@@ -170,25 +238,79 @@ class CprProbabilityCalculator(object):
         :param birh_date: The birh date to check.
         :return: A list of all legal CPRs for that date.
         """
-        cache_key = str(birth_date)
-        if cache_key in self.cached_cprs:
-            return self.cached_cprs[cache_key]
-        legal_7 = self._legal_7s(birth_date.year)
-
-        legal_cprs = []
-        for index_7 in legal_7:
-            for i in range(0, 1000):
-                cpr_candidate = (
-                    birth_date.strftime("%d%m%y")
-                    + str(index_7)
-                    + str(i).zfill(3)
-                )
-                valid = modulus11_check_raw(cpr_candidate)
-                if valid:
-                    legal_cprs.append(cpr_candidate)
-
-        self.cached_cprs[cache_key] = legal_cprs
-        return legal_cprs
+        residues = _date_table(birth_date).residues
+        prefix = birth_date.strftime("%d%m%y")
+        return [f"{prefix}{index_7}{i:03d}"
+                for index_7 in self._legal_7s(birth_date.year)
+                for i in range(0, 1000)
+                if _sequence_residues[i] == residues[index_7]]
+
+    @staticmethod
+    def _legal_indices(
+            digits: np.ndarray, birth_dates: np.ndarray,
+            valid: np.ndarray) -> np.ndarray:
+        """Returns, for each CPR number with a valid birth date that passes
+        the modulus-11 check and has a legal seventh digit, its position in
+        the list that _calc_all_cprs would produce for its birth date, and -1
+        for every other CPR number.
+
+        (This uses the same cached _date_table as cpr_check, looking it up
+        once for each distinct birth date.)"""
+        keys, inverse = np.unique(
+                np.where(valid, birth_dates, 0), return_inverse=True)
+        residues = np.full((len(keys), 10), -1)
+        offsets = np.full((len(keys), 10), -1)
+        for i, key in enumerate(keys.tolist()):
+            if key:
+                table = _date_table(
+                        date(key // 10000, key // 100 % 100, key % 100))
+                residues[i] = table.residues
+                offsets[i] = [-1 if o is None else o for o in table.offsets]
+
+        index_7 = digits[:, 6]
+        sequence = digits[:, 7:] @ np.array([100, 10, 1])
+        offset = offsets[inverse, index_7]
+        legal = (offset >= 0) & (
+                residues[inverse, index_7]
+                == np.take(_sequence_residues, sequence))
+        return np.where(
+                legal, offset + np.take(_sequence_ranks, sequence), -1)
+
+    def cpr_check_many(
+            self, cprs: Sequence[str], do_mod11_check=True) -> np.ndarray:
+        """As cpr_check, but checks many CPR numbers at once, returning an
+        array of probabilities. (Where cpr_check would have returned an error
+        string, this array contains NaN.)"""
+        simple = np.fromiter((_is_simple(c) for c in cprs), bool, len(cprs))
+        result = np.full(len(cprs), np.nan)
+
+        digits = _to_digits([c for c, ok in zip(cprs, simple) if ok])
+        birth_dates, valid = _birth_dates(digits)
+        exceptional = np.isin(birth_dates, _exception_date_keys)
+        today = date.today()
+        current = valid & (
+                birth_dates <= today.year * 10000 + today.month * 100 + today.day)
+
+        # A CPR number that doesn't pass the modulus-11 check can't appear in
+        # the list of legal numbers either, so do_mod11_check doesn't affect
+        # which numbers will be rejected
+        indices = self._legal_indices(digits, birth_dates, valid)
+        legal = indices >= 0
+
+        probabilities = np.select(
+                [indices <= 100, indices <= 200, indices <= 250,
+                 indices <= 350],
+                [1.0, 0.8, 0.6, 0.25], 0.1)
+        probabilities[~legal] = np.nan
+        probabilities[exceptional] = 0.5
+        probabilities[~current] = np.nan
+        result[simple] = probabilities
+
+        for idx in np.flatnonzero(~simple):
+            probability = self.cpr_check(cprs[idx], do_mod11_check)
+            if not isinstance(probability, str):
+                result[idx] = probability
+        return result
 
     def cpr_check(self, cpr: str, do_mod11_check=True) -> Union[str, float]:
         """Estimate a probality that the number is actually a CPR.
@@ -219,24 +341,25 @@ class CprProbabilityCalculator(object):
         if error:
             return error
 
-        birth_date = get_birth_date(cpr)
-        if birth_date > date.today():
+        table = _date_table(_birth_date(cpr[:7]))
+        if table.birth_date > date.today():
             return "CPR newer than today"
 
         # we cannot say anything about the probability, when the date is an
         # exception-date
-        if birth_date in CPR_EXCEPTION_DATES:
+        if table.exceptional:
             return 0.5
 
-        if (do_mod11_check and not modulus11_check_raw(cpr) and
-                birth_date not in CPR_EXCEPTION_DATES):
+        index_7 = int(cpr[6])
+        sequence = int(cpr[7:])
+        valid = _sequence_residues[sequence] == table.residues[index_7]
+        if do_mod11_check and not valid:
             return "Modulus 11 does not match"
 
-        legal_cprs = self._calc_all_cprs(birth_date)
-        try:
-            index_number = legal_cprs.index(cpr)
-        except ValueError:
+        offset = table.offsets[index_7]
+        if offset is None or not valid:
             return "CPR is not a legal value"
+        index_number = offset + _sequence_ranks[sequence]
 
         if index_number <= 100:
             return 1.0
@@ -250,6 +373,72 @@ class CprProbabilityCalculator(object):
             return 0.1
 
 
+# The weighted sum of digits 8 to 10 of a CPR number (that is, of its sequence
+# number) determines whether the number passes the modulus-11 check.
+# _sequence_residues[s] is the weighted sum of sequence number s, modulo 11, and
+# _sequence_counts[r, s] is the number of sequence numbers below s whose
+# weighted sum is r, modulo 11
+_sequence_residues = tuple(
+        (3 * (s // 100) + 2 * (s // 10 % 10) + s % 10) % 11
+        for s in range(1000))
+_sequence_counts = np.concatenate(
+        (np.zeros((11, 1), dtype=np.int64),
+         np.cumsum(
+                np.arange(11)[:, None] == np.array(
+                        _sequence_residues)[None, :],
+                axis=1)),
+        axis=1)
+# The position of each sequence number among those with the same weighted sum
+_sequence_ranks = tuple(
+        _sequence_counts[r, s].item()
+        for s, r in enumerate(_sequence_residues))
+
+
+class _DateTable(NamedTuple):
+    birth_date: date
+    exceptional: bool
+    # For each possible seventh digit, the weighted sum (modulo 11) that the
+    # sequence number of a CPR number must have to pass the modulus-11 check
+    residues: Tuple[int, ...]
+    # For each possible seventh digit, the position of the first CPR number
+    # with that digit in the list of legal CPR numbers for this date (or None,
+    # if the digit isn't legal for this date)
+    offsets: Tuple[Optional[int], ...]
+
+
+@lru_cache(maxsize=65536)
+def _birth_date(prefix: str) -> Optional[date]:
+    """As get_birth_date, but takes only the first seven digits of a CPR
+    number, and returns None instead of raising an exception."""
+    try:
+        return get_birth_date(prefix)
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=32768)
+def _date_table(birth_date: date) -> _DateTable:
+    """Computes the information needed to check the CPR numbers of a given
+    birth date."""
+    prefix = birth_date.strftime("%d%m%y")
+    partial = sum(int(c) * v for c, v in zip(prefix, _mod_11_table))
+    residues = tuple(
+            -(partial + _mod_11_table[6] * index_7) % 11
+            for index_7 in range(10))
+
+    offsets = [None] * 10
+    offset = 0
+    for index_7 in CprProbabilityCalculator._legal_7s(birth_date.year):
+        offsets[index_7] = offset
+        offset += _sequence_counts[residues[index_7], 1000].item()
+
+    return _DateTable(
+            birth_date=birth_date,
+            exceptional=birth_date in CPR_EXCEPTION_DATES,
+            residues=residues,
+            offsets=tuple(offsets))
+
+
 if __name__ == "__main__":
     cpr_calc = CprProbabilityCalculator()
     print(cpr_calc.cpr_check("1111111118"))
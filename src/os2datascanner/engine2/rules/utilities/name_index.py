@@ -0,0 +1,92 @@
+import sys
+import logging
+from typing import BinaryIO, NamedTuple
+from functools import lru_cache
+
+from ... import settings as engine2_settings
+from ..datasets.loader import common as common_loader
+
+logger = logging.getLogger(__name__)
+
+
+FIRST_NAME_DATASETS = (
+        "da_20140101_dst_fornavne-mænd",
+        "da_20140101_dst_fornavne-kvinder",)
+LAST_NAME_DATASETS = (
+        "da_20140101_dst_efternavne",)
+
+
+_MAGIC = b"OS2DS-NAMES\x00\x01"
+
+
+class NameIndexError(ValueError):
+    pass
+
+
+class NameIndex(NamedTuple):
+    """A NameIndex is an immutable collection of the (upper-case) first and
+    last names that NameRule considers plausible."""
+    first_names: frozenset[str]
+    last_names: frozenset[str]
+
+    @classmethod
+    def from_datasets(cls) -> "NameIndex":
+        """Builds a NameIndex from the DST name datasets."""
+        def _load(datasets):
+            # Names that appear in more than one dataset are represented by
+            # the same string object
+            return frozenset(
+                    sys.intern(name.upper())
+                    for dataset in datasets
+                    for name in common_loader.iter_dataset("names", dataset))
+        return cls(_load(FIRST_NAME_DATASETS), _load(LAST_NAME_DATASETS))
+
+    def dump(self, fp: BinaryIO):
+        """Writes this NameIndex to a binary file in a form that can be read
+        back by NameIndex.load."""
+        fp.write(_MAGIC)
+        for names in self:
+            blob = "\n".join(sorted(names)).encode("utf-8")
+            fp.write(len(blob).to_bytes(8, "big"))
+            fp.write(blob)
+
+    @classmethod
+    def load(cls, fp: BinaryIO) -> "NameIndex":
+        """Reads a NameIndex previously written by NameIndex.dump. Raises a
+        NameIndexError if the file does not contain a NameIndex."""
+        if fp.read(len(_MAGIC)) != _MAGIC:
+            raise NameIndexError("not a name index")
+        sections = []
+        for _ in cls._fields:
+            length = int.from_bytes(fp.read(8), "big")
+            blob = fp.read(length)
+            if len(blob) != length:
+                raise NameIndexError("name index is truncated")
+            sections.append(frozenset(
+                    map(sys.intern, blob.decode("utf-8").split("\n")))
+                    if blob else frozenset())
+        return cls(*sections)
+
+
+@lru_cache(maxsize=1)
+def get_name_index() -> NameIndex:
+    """Returns the NameIndex shared by this process, building it the first
+    time it's needed.
+
+    If the rules.name.index setting points at a file written by
+    NameIndex.dump, the index will be read from that file instead of from the
+    source datasets."""
+    if (path := engine2_settings.rules["name"]["index"]):
+        try:
+            with open(path, "rb") as fp:
+                return NameIndex.load(fp)
+        except (OSError, NameIndexError):
+            logger.warning(
+                    "couldn't read precompiled name index, falling back to"
+                    " the source datasets", exc_info=True)
+    return NameIndex.from_datasets()
+
+
+if __name__ == "__main__":
+    with open(sys.argv[1], "wb") as fp:
+        NameIndex.from_datasets().dump(fp)
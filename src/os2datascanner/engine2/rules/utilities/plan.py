@@ -0,0 +1,227 @@
+import re
+from typing import Optional, Sequence
+from functools import lru_cache
+
+from ...conversions.types import OutputType
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    # Python versions before 3.11 only expose the parser as a top-level module
+    import sre_parse
+
+
+# Expressions that refer back to their own groups by number can't be embedded
+# in a larger expression without changing their meaning
+_numbered_reference = re.compile(r"\\[1-9]|\(\?P=|\(\?\(")
+
+
+def _is_combinable(expression: re.Pattern) -> bool:
+    if not isinstance(expression.pattern, str):
+        return False
+    elif expression.flags & ~re.UNICODE:
+        # Global flags (specified either at compilation time or inline at the
+        # start of the expression) can't be applied to just one branch of an
+        # alternation
+        return False
+    elif _numbered_reference.search(expression.pattern):
+        return False
+    try:
+        re.compile(f"(?=(?P<_plan>{expression.pattern}))")
+    except re.error:
+        return False
+    return True
+
+
+_category_fragments = {
+    sre_parse.CATEGORY_DIGIT: r"\d",
+    sre_parse.CATEGORY_NOT_DIGIT: r"\D",
+    sre_parse.CATEGORY_SPACE: r"\s",
+    sre_parse.CATEGORY_NOT_SPACE: r"\S",
+    sre_parse.CATEGORY_WORD: r"\w",
+    sre_parse.CATEGORY_NOT_WORD: r"\W",
+}
+
+
+def _class_fragments(items) -> Optional[set[str]]:
+    fragments = set()
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            fragments.add(re.escape(chr(av)))
+        elif op is sre_parse.RANGE:
+            fragments.add(f"{re.escape(chr(av[0]))}-{re.escape(chr(av[1]))}")
+        elif op is sre_parse.CATEGORY and av in _category_fragments:
+            fragments.add(_category_fragments[av])
+        else:
+            return None
+    return fragments
+
+
+def _first_fragments(items) -> tuple[Optional[set[str]], bool]:  # noqa: CCR001,C901,E501 too high cognitive complexity
+    """Computes the character class fragments that describe the characters a
+    parsed regular expression can start with. Returns a (fragments, nullable)
+    pair; fragments will be None if the expression could start with anything
+    (or if it's too complicated to analyse), and nullable is True if the
+    expression might not consume any characters at all."""
+    fragments = set()
+    for op, av in items:
+        if op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            # Zero-width assertions don't consume anything; ignoring them
+            # can only make our answer less precise, never wrong
+            continue
+        elif op is sre_parse.LITERAL:
+            fragments.add(re.escape(chr(av)))
+            return fragments, False
+        elif op is sre_parse.IN:
+            if (sub := _class_fragments(av)) is None:
+                return None, False
+            return fragments | sub, False
+
+        if op is sre_parse.SUBPATTERN:
+            _, add_flags, _, sub_items = av
+            if add_flags:
+                return None, False
+            sub, nullable = _first_fragments(sub_items)
+        elif op is sre_parse.BRANCH:
+            sub, nullable = set(), False
+            for branch in av[1]:
+                b_sub, b_nullable = _first_fragments(branch)
+                if b_sub is None:
+                    return None, False
+                sub |= b_sub
+                nullable = nullable or b_nullable
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            low, _, sub_items = av
+            sub, nullable = _first_fragments(sub_items)
+            nullable = nullable or low == 0
+        else:
+            return None, False
+
+        if sub is None:
+            return None, False
+        fragments |= sub
+        if not nullable:
+            return fragments, False
+    return fragments, True
+
+
+def _first_characters(expression: re.Pattern) -> Optional[str]:
+    """Returns the body of a character class that matches every character that
+    the given expression could start with, or None if that can't be
+    determined."""
+    try:
+        fragments, nullable = _first_fragments(
+                sre_parse.parse(expression.pattern, expression.flags))
+    except Exception:
+        return None
+    if fragments is None or nullable:
+        return None
+    return "".join(sorted(fragments))
+
+
+def _walk_heads(rule):
+    """Yields every SimpleRule that might be evaluated while reducing the given
+    Rule, no matter which continuations are taken."""
+    seen = set()
+    pending = [rule]
+    while pending:
+        here = pending.pop()
+        if isinstance(here, bool) or here in seen:
+            continue
+        seen.add(here)
+        head, pve, nve = here.split()
+        yield head
+        pending.extend((pve, nve))
+
+
+class MatchingPlan:
+    """A MatchingPlan combines the regular expressions of several text-matching
+    SimpleRules into a single expression, letting all of them share one pass
+    over the text instead of each making their own.
+
+    The combined expression consists of one zero-width lookahead branch per
+    distinct component expression, so it finds every position in the text at
+    which at least one of the components matches. Each component is then
+    matched again, anchored at that position, to get exactly the match objects
+    that its own finditer() call would have produced.
+
+    (A lookahead-only expression gives the regular expression engine nothing
+    to search for, so, where possible, the combined expression is also
+    prefixed with a class of all the characters that a match could start
+    with.)"""
+
+    def __init__(self, expressions: Sequence[re.Pattern]):
+        self._expressions = tuple(expressions)
+        branches = "|".join(
+                f"(?=(?P<_plan{idx}>{e.pattern}))"
+                for idx, e in enumerate(self._expressions))
+
+        firsts = [_first_characters(e) for e in self._expressions]
+        if all(f is not None for f in firsts):
+            self._scanner = re.compile(f"(?=[{''.join(firsts)}])(?:{branches})")
+        else:
+            self._scanner = re.compile(branches)
+
+    def covers(self, rule) -> bool:
+        """Indicates whether or not the given SimpleRule can be given match
+        objects from this MatchingPlan."""
+        expression = rule.scan_expression
+        return (rule.operates_on == OutputType.Text
+                and expression is not None
+                and expression in self._expressions)
+
+    def scan(self, content: str) -> dict[str, list[re.Match]]:
+        """Scans the given text, returning a dictionary mapping each component
+        expression's pattern to the list of non-overlapping matches that it
+        would have found on its own."""
+        found = {e.pattern: [] for e in self._expressions}
+        resume = [0] * len(self._expressions)
+
+        for hit in self._scanner.finditer(content):
+            pos = hit.start()
+            # Branches are tried in order, so none of the expressions before
+            # the one that matched can match here
+            first = int(hit.lastgroup[len("_plan"):])
+            for idx in range(first, len(self._expressions)):
+                if resume[idx] > pos:
+                    # This position is part of the last match of this
+                    # expression, so finditer() would have skipped it
+                    continue
+                expression = self._expressions[idx]
+                if (m := expression.match(content, pos)):
+                    found[expression.pattern].append(m)
+                    resume[idx] = max(m.end(), pos + 1)
+        return found
+
+    @staticmethod
+    def for_rule(rule) -> Optional["MatchingPlan"]:
+        """Returns a (possibly cached) MatchingPlan for all of the combinable
+        text-matching components of the given Rule, or None if fewer than two
+        such components are present."""
+        try:
+            return _make_plan(rule)
+        except TypeError:
+            # This Rule (or one of its components) isn't hashable, so we can't
+            # keep track of it
+            return None
+
+
+@lru_cache(maxsize=128)
+def _make_plan(rule) -> Optional[MatchingPlan]:
+    expressions = {}
+    for head in _walk_heads(rule):
+        if head.operates_on != OutputType.Text:
+            continue
+        expression = head.scan_expression
+        if expression is not None and _is_combinable(expression):
+            expressions.setdefault(expression.pattern, expression)
+
+    if len(expressions) < 2:
+        return None
+    try:
+        return MatchingPlan(expressions.values())
+    except re.error:
+        # The components can't be combined into one expression (because two
+        # of them define groups with the same name, for example), so each of
+        # them will have to make its own pass
+        return None
@@ -1,6 +1,7 @@
 import re
 
 from typing import Iterator, Optional
+from functools import lru_cache
 
 from ..conversions.types import OutputType
 from .rule import Rule, SimpleRule, Sensitivity
@@ -27,6 +28,13 @@ def load_words(dataset):
     yield from _flatten(loaded)
 
 
+@lru_cache(maxsize=16)
+def load_wordlist(dataset) -> frozenset[str]:
+    """Returns the words of a dataset as a frozenset. (The set is built only
+    once for each dataset and is then shared by the whole process.)"""
+    return frozenset(load_words(dataset))
+
+
 class OrderedWordlistRule(SimpleRule):
     """
     A OrderedWordlistRule finds matches for a single list of words.
@@ -43,7 +51,7 @@ class OrderedWordlistRule(SimpleRule):
     def __init__(self, dataset: str, **super_kwargs):
         super().__init__(**super_kwargs)
         self._dataset = dataset
-        self._wordlists = frozenset(load_words(dataset))
+        self._wordlists = load_wordlist(dataset)
         self._compiled_expr = re.compile(r"\w+", re.IGNORECASE | re.DOTALL)
 
     @property
@@ -55,9 +63,16 @@ class OrderedWordlistRule(SimpleRule):
         if content is None:
             return
 
+        # Find out which words are present at all before building any match
+        # objects; most texts don't contain any of them, and this check can
+        # be done without a Python-level loop over every word in the text
+        present = self._wordlists.intersection(
+                map(str.lower, self._compiled_expr.findall(content)))
+        if not present:
+            return
+
         for m in self._compiled_expr.finditer(content):
-            lowered = str(m.group()).lower()
-            if lowered in self._wordlists:
+            if m.group().lower() in present:
                 begin, end = m.span()
                 context_begin = max(begin - 50, 0)
                 context_end = min(end + 50, len(content))
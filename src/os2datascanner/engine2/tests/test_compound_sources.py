@@ -1,11 +1,14 @@
 import os.path
 import unittest
+from unittest import mock
 
 from os2datascanner.engine2.model.core import Source, SourceManager
 from os2datascanner.engine2.model.derived import libreoffice
+from os2datascanner.engine2.model.derived import pdf as pdf_model
 from os2datascanner.engine2.model.file import FilesystemHandle
 from os2datascanner.engine2.rules.cpr import CPRRule
 from os2datascanner.engine2.conversions import convert
+from os2datascanner.engine2.conversions.types import OutputType
 
 
 here_path = os.path.dirname(__file__)
@@ -77,6 +80,30 @@ class Engine2CompoundSourceTest(unittest.TestCase):
                                 test_data_path,
                                 "pdf/embedded-cpr.pdf.gz")))
 
+    def test_pdf_page_ranges(self):
+        """Extracting several pages of a PDF at once should produce exactly
+        the same objects as extracting the pages one at a time."""
+        pdf = Source.from_handle(FilesystemHandle.make_handle(
+                os.path.join(
+                        test_data_path,
+                        "pdf/Tilsynsrapport (2013) - Kærkommen.PDF")))
+
+        def _extract(pages_per_pass):
+            with mock.patch.object(pdf_model, "PAGES_PER_PASS", pages_per_pass), \
+                    SourceManager() as sm:
+                objects = {}
+                for page in pdf.handles(sm):
+                    for obj in Source.from_handle(page, sm).handles(sm):
+                        with obj.follow(sm).make_stream() as fp:
+                            objects[obj] = fp.read()
+                return objects
+
+        page_by_page = _extract(1)
+        self.assertTrue(page_by_page)
+        for pages_per_pass in (2, 1000,):
+            with self.subTest(pages_per_pass=pages_per_pass):
+                self.assertEqual(_extract(pages_per_pass), page_by_page)
+
     def test_doc(self):
         self.run_rule_on_handle(
                 FilesystemHandle.make_handle(
@@ -152,6 +179,28 @@ class Engine2CompoundSourceTest(unittest.TestCase):
                                 test_data_path,
                                 "libreoffice/two-sheets.ods")))
 
+    def test_spreadsheet_rows(self):
+        """Spreadsheets should be read a row at a time, and reading a sheet
+        shouldn't stop the rest of the spreadsheet from being read."""
+        for label, path in (
+                ("OpenDocument", "libreoffice/two-sheets.ods"),
+                ("OLE", "msoffice/test.xls"),
+                ("Office Open XML", "msoffice/test.xlsx")):
+            with self.subTest(label):
+                spreadsheet = Source.from_handle(
+                        FilesystemHandle.make_handle(
+                                os.path.join(test_data_path, path)))
+                with SourceManager() as sm:
+                    *_, last = spreadsheet.handles(sm)
+                    resource = last.follow(sm)
+                    self.assertEqual(
+                            convert(resource, OutputType.Text),
+                            "131016-9996\n")
+                    self.assertTrue(resource.check())
+                    self.assertEqual(
+                            len(list(spreadsheet.handles(sm))),
+                            len(sm.open(spreadsheet).sheet_names))
+
     def test_libreoffice_spreadsheet_support(self):
         """LibreOffice can still handle spreadsheet references, even though we
         now prefer SpreadsheetSource."""
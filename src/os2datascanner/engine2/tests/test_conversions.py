@@ -1,10 +1,18 @@
 import os.path
+import sqlite3
 import unittest
+import threading
+from unittest import mock
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from prometheus_client import REGISTRY
 
 from os2datascanner.engine2.model.core import SourceManager
 from os2datascanner.engine2.model.file import FilesystemHandle
 from os2datascanner.engine2.conversions.types import OutputType
 from os2datascanner.engine2.conversions.registry import convert
+from os2datascanner.engine2.conversions.utilities.cache import (
+        CacheIndex, ContentCache)
 
 
 here_path = os.path.dirname(__file__)
@@ -14,6 +22,9 @@ image_handle = FilesystemHandle.make_handle(
 html_handle = FilesystemHandle.make_handle(
     os.path.join(here_path, "data/html/simple.html")
 )
+zip_handle = FilesystemHandle.make_handle(
+    os.path.join(here_path, "data/engine2/zip-here/test-vector.zip")
+)
 empty_handle = FilesystemHandle.make_handle(
     os.path.join(here_path, "data/empty_file")
 )
@@ -71,3 +82,190 @@ class Engine2ConversionTest(unittest.TestCase):
             None,
             "empty HTML document did not produce empty conversion",
         )
+
+
+class ContentCacheTest(unittest.TestCase):
+    def test_content_cache_hit(self):
+        cache = ContentCache(1024)
+        with SourceManager() as sm:
+            hits = REGISTRY.get_sample_value(
+                    "os2datascanner_content_cache_hits_total")
+            first = cache.convert(html_handle.follow(sm), OutputType.Text)
+            second = cache.convert(html_handle.follow(sm), OutputType.Text)
+
+        self.assertEqual(
+                first, second,
+                "cached representation differs from the original")
+        self.assertEqual(
+                REGISTRY.get_sample_value(
+                        "os2datascanner_content_cache_hits_total"),
+                hits + 1,
+                "second conversion did not hit the cache")
+
+    def test_content_cache_reads_once(self):
+        """Converting a Resource through the content cache should only read
+        its content once, and not at all if there's no conversion for it."""
+        cache = ContentCache(1024)
+        with SourceManager() as sm:
+            for handle, output_type, reads in (
+                    (zip_handle, OutputType.Text, 0),
+                    (html_handle, OutputType.Text, 1),):
+                resource = handle.follow(sm)
+                mime_type = resource.compute_type()
+                with self.subTest(handle), \
+                        mock.patch.object(
+                                resource, "compute_type",
+                                return_value=mime_type), \
+                        mock.patch.object(
+                                type(resource), "make_path",
+                                side_effect=type(resource).make_path,
+                                autospec=True) as make_path:
+                    try:
+                        cache.convert(resource, output_type)
+                    except KeyError:
+                        pass
+                    self.assertEqual(make_path.call_count, reads)
+
+    def test_content_cache_eviction(self):
+        cache = ContentCache(10)
+        cache.put("a", "1234")
+        cache.put("b", "5678")
+        cache.get("a")
+        cache.put("c", "90ab")
+
+        self.assertEqual(cache.get("a"), "1234")
+        self.assertIsNone(
+                cache.get("b"),
+                "least recently used representation was not evicted")
+        self.assertEqual(cache.size, 8)
+
+        cache.put("d", "too long to be cached")
+        self.assertIsNone(cache.get("d"))
+
+    def test_content_cache_skips_big_objects(self):
+        """Objects bigger than the cache's object size limit should be
+        converted without being read to compute a key."""
+        cache = ContentCache(1024, max_object_size=16)
+        with SourceManager() as sm:
+            resource = html_handle.follow(sm)
+            mime_type = resource.compute_type()
+            with mock.patch.object(
+                    resource, "compute_type", return_value=mime_type), \
+                    mock.patch.object(
+                            type(resource), "make_path",
+                            side_effect=type(resource).make_path,
+                            autospec=True) as make_path:
+                representation = cache.convert(resource, OutputType.Text)
+            # (Only the conversion itself should have read the content)
+            self.assertEqual(make_path.call_count, 1)
+            self.assertEqual(
+                    representation, convert(resource, OutputType.Text))
+        self.assertEqual(cache.size, 0)
+
+    def test_content_cache_threads(self):
+        """A ContentCache used by several threads at once should stay within
+        its bounds and keep an accurate account of its size."""
+        cache = ContentCache(100)
+
+        def _use(n):
+            for i in range(2000):
+                cache.put((n, i % 50), "x" * (i % 7))
+                cache.get((n, (i + 1) % 50))
+        threads = [threading.Thread(target=_use, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertLessEqual(cache.size, 100)
+        self.assertEqual(
+                cache.size, sum(len(v) for v in cache._entries.values()))
+
+
+class CacheIndexTest(unittest.TestCase):
+    def setUp(self):
+        self._td = TemporaryDirectory()
+        self.root = Path(self._td.name)
+
+    def tearDown(self):
+        self._td.cleanup()
+
+    def make_entries(self, index, *names):
+        paths = []
+        for name in names:
+            path = self.root / name / "text"
+            path.parent.mkdir()
+            path.write_bytes(b"x" * 10)
+            index.record(path, 10, 1000.0)
+            paths.append(path)
+        return paths
+
+    def test_lookup(self):
+        index = CacheIndex(self.root)
+        path, = self.make_entries(index, "a")
+
+        self.assertEqual(index.lookup(path), 1000.0)
+        self.assertIsNone(index.lookup(self.root / "b" / "text"))
+        self.assertEqual(index.total_size, 10)
+
+        index.forget(path)
+        self.assertIsNone(index.lookup(path))
+
+    def test_lookup_locked(self):
+        """Cache files should still be found while another process is writing
+        to the index, and should be treated as missing if the index can't be
+        read at all."""
+        index = CacheIndex(self.root)
+        path, = self.make_entries(index, "a")
+
+        other = sqlite3.connect(
+                self.root / CacheIndex.FILENAME, isolation_level=None)
+        self.addCleanup(other.close)
+        other.execute("BEGIN IMMEDIATE")
+        other.execute("DELETE FROM entries")
+        self.assertEqual(index.lookup(path), 1000.0)
+        other.execute("ROLLBACK")
+
+        index._db = mock.Mock()
+        index._db.execute.side_effect = sqlite3.OperationalError(
+                "database is locked")
+        self.assertIsNone(index.lookup(path))
+
+    def test_existing_files_adopted(self):
+        """Cache files written before the index existed should be added to it
+        when it's first created, so that they can be used and pruned."""
+        old = self.root / "a" / "text"
+        old.parent.mkdir()
+        old.write_bytes(b"x" * 10)
+        os.utime(old, (900.0, 900.0))
+
+        index = CacheIndex(self.root, budget=15)
+        self.assertEqual(index.lookup(old), 900.0)
+        self.assertEqual(index.total_size, 10)
+
+        new, = self.make_entries(index, "b")
+        self.assertEqual(index.prune(), 10)
+        self.assertFalse(old.exists())
+        self.assertTrue(new.exists())
+
+        # Files that turn up later are the index's business, not ours
+        (self.root / "c").mkdir()
+        (self.root / "c" / "text").write_bytes(b"x")
+        self.assertIsNone(
+                CacheIndex(self.root).lookup(self.root / "c" / "text"))
+
+    def test_lfu_pruning(self):
+        index = CacheIndex(self.root, budget=25, policy="lfu")
+        a, b, c = self.make_entries(index, "a", "b", "c")
+        index.lookup(b)
+        index.touch(a)
+        index.touch(c)
+
+        self.assertEqual(index.prune(), 10)
+        self.assertFalse(
+                b.exists(),
+                "least frequently used representation was not deleted")
+        self.assertFalse(b.parent.exists())
+        self.assertTrue(a.exists() and c.exists())
+        self.assertEqual(index.total_size, 20)
+        self.assertEqual(index.prune(), 0)
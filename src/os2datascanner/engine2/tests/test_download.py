@@ -0,0 +1,78 @@
+import io
+import unittest
+from unittest import mock
+
+import requests
+
+from os2datascanner.engine2.model.utilities import download
+
+
+CONTENT = bytes(range(256)) * 64
+
+
+class FakeServer:
+    """Serves CONTENT a chunk at a time, breaking the connection after
+    break_after bytes have been sent (the first time only)."""
+    def __init__(self, break_after=None, ranges=True):
+        self.break_after = break_after
+        self.ranges = ranges
+        self.requests = []
+
+    def __call__(self, headers):
+        self.requests.append(headers)
+        start = 0
+        response = mock.Mock(status_code=200, headers={})
+        if "Range" in headers and self.ranges:
+            start = int(headers["Range"].removeprefix("bytes=").rstrip("-"))
+            response.status_code = 206
+            response.headers["Content-Range"] = (
+                    f"bytes {start}-{len(CONTENT) - 1}/{len(CONTENT)}")
+
+        break_after, self.break_after = self.break_after, None
+
+        def iter_content(chunk_size):
+            for pos in range(start, len(CONTENT), chunk_size):
+                if break_after is not None and pos >= break_after:
+                    raise requests.exceptions.ChunkedEncodingError()
+                yield CONTENT[pos:pos + chunk_size]
+        response.iter_content = iter_content
+        return response
+
+
+@mock.patch.object(download, "CHUNK_SIZE", 1000)
+class DownloadTests(unittest.TestCase):
+    def test_resume(self):
+        """An interrupted download should be resumed from where it stopped."""
+        server = FakeServer(break_after=5000)
+        fp = io.BytesIO()
+        self.assertEqual(download.download_into(server, fp), len(CONTENT))
+        self.assertEqual(fp.getvalue(), CONTENT)
+        self.assertEqual(
+                [r.get("Range") for r in server.requests],
+                [None, "bytes=5000-"])
+
+    def test_restart(self):
+        """An interrupted download from a server that doesn't support range
+        requests should be started over."""
+        server = FakeServer(break_after=5000, ranges=False)
+        fp = io.BytesIO()
+        download.download_into(server, fp)
+        self.assertEqual(fp.getvalue(), CONTENT)
+        self.assertEqual(len(server.requests), 2)
+
+    @mock.patch.object(download, "RESUME_TRIES", 0)
+    def test_give_up(self):
+        """Interrupted downloads should only be resumed a limited number of
+        times."""
+        with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+            download.download_into(FakeServer(break_after=5000), io.BytesIO())
+
+    def test_spooled(self):
+        """Downloads should only be kept in memory if they're small."""
+        for threshold, rolled in ((len(CONTENT), False), (1024, True),):
+            with self.subTest(threshold=threshold), \
+                    mock.patch.object(
+                            download, "MEMORY_THRESHOLD", threshold), \
+                    download.spooled_download(FakeServer()) as fp:
+                self.assertEqual(fp._rolled, rolled)
+                self.assertEqual(fp.read(), CONTENT)
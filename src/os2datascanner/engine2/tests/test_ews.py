@@ -0,0 +1,99 @@
+import unittest
+from unittest import mock
+
+from exchangelib.errors import ErrorItemNotFound, ErrorServerBusy
+
+from os2datascanner.engine2.model import ews
+from os2datascanner.engine2.model.core import SourceManager
+
+
+class FakeAccount:
+    """A stand-in for an exchangelib Account whose messages are called
+    m0, m1, m2, and so on, up to m9. (The server is too busy to return the
+    messages in the busy dictionary the given number of times.)"""
+    def __init__(self):
+        self.fetched = []
+        self.busy = {}
+
+    def fetch(self, ids, only_fields=None, chunk_size=None):
+        ids = [i for i, _ in ids]
+        self.fetched.append((ids, only_fields))
+        for i in ids:
+            if self.busy.get(i):
+                self.busy[i] -= 1
+                yield ErrorServerBusy(i)
+            elif i.startswith("m") and int(i[1:]) < 10:
+                message = mock.Mock(size=len(i))
+                if only_fields and "mime_content" in only_fields:
+                    message.mime_content = i.encode()
+                yield message
+            else:
+                yield ErrorItemNotFound(i)
+
+
+@mock.patch.object(ews, "FETCH_SIZE", 3)
+class EWSMailboxTests(unittest.TestCase):
+    def setUp(self):
+        self.account = FakeAccount()
+
+        def _generate_state(source, sm):
+            yield ews.EWSMailbox(self.account)
+        patcher = mock.patch.object(
+                ews.EWSAccountSource, "_generate_state", _generate_state)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.source = ews.EWSAccountSource(
+                "example.com", None, "admin", "password", "user")
+
+    def handle(self, mail_id):
+        return ews.EWSMailHandle(
+                self.source, f"inbox.{mail_id}", mail_id, "Inbox", None)
+
+    def test_shared_message(self):
+        """Checking and reading a message should only retrieve it once, even
+        through several Resources."""
+        with SourceManager() as sm:
+            self.assertTrue(self.handle("m1").follow(sm).check())
+            resource = self.handle("m1").follow(sm)
+            self.assertEqual(resource.get_size(), 2)
+            with resource.make_stream() as fp:
+                self.assertEqual(fp.read(), b"m1")
+            self.assertFalse(self.handle("m99").follow(sm).check())
+        self.assertEqual(
+                self.account.fetched, [
+                    (["m1"], ews._SUMMARY_FIELDS),
+                    (["m1"], ("mime_content",)),
+                    (["m99"], ews._SUMMARY_FIELDS),
+                ])
+
+    def test_prefetch(self):
+        """Messages that exploration has announced should be retrieved along
+        with the message that's needed."""
+        with SourceManager() as sm:
+            sm.open(self.source).expect(["m0", "m1", "m2", "m3", "m4"])
+            for i in range(5):
+                self.assertTrue(self.handle(f"m{i}").follow(sm).check())
+        self.assertEqual(
+                [ids for ids, _ in self.account.fetched],
+                [["m0", "m1", "m2"], ["m3", "m4"]])
+
+    @mock.patch.object(ews, "FETCH_TRIES", 2)
+    def test_item_errors(self):
+        """Messages that the server couldn't return shouldn't be cached, and
+        should be retried."""
+        self.account.busy = {"m1": 1, "m2": 5}
+        with SourceManager() as sm, \
+                mock.patch("os2datascanner.engine2.utilities.backoff.sleep"):
+            sm.open(self.source).expect(["m1", "m2"])
+            self.assertTrue(self.handle("m0").follow(sm).check())
+            self.assertEqual(
+                    [ids for ids, _ in self.account.fetched],
+                    [["m0", "m1", "m2"], ["m1", "m2"]])
+
+            # m1 was retrieved on the second try, but m2 wasn't
+            self.assertTrue(self.handle("m1").follow(sm).check())
+            self.assertEqual(len(self.account.fetched), 2)
+            with self.assertRaises(ErrorServerBusy):
+                self.handle("m2").follow(sm).check()
+            self.assertEqual(len(self.account.fetched), 4)
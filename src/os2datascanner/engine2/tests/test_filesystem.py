@@ -0,0 +1,104 @@
+import os
+import unittest
+from unittest import mock
+from pathlib import Path
+from datetime import datetime, timezone
+from tempfile import TemporaryDirectory
+
+from os2datascanner.engine2.model import file
+from os2datascanner.engine2.model.core import ScanContext, SourceManager
+from os2datascanner.engine2.model.file import FilesystemSource
+
+
+def _time(run):
+    return datetime(2024, 1, 1, run, tzinfo=timezone.utc) if run is not None else None
+
+
+class FilesystemExplorationTests(unittest.TestCase):
+    def setUp(self):
+        tmpdir = TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.root = tmpdir.name
+        for path in ("a.txt", "x/b.txt", "x/y/c.txt", "z/d.txt",):
+            self.write(path, path)
+        os.symlink(
+                os.path.join(self.root, "z"), os.path.join(self.root, "x/lz"))
+
+        self.source = FilesystemSource(self.root)
+
+    def write(self, path, content):
+        full_path = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "wt") as fp:
+            fp.write(content)
+
+    def explore(self, run=None, after=None, scanner="1"):
+        """Explores the folder as part of the given run of a scan that's only
+        interested in files modified after the start of the given earlier
+        run."""
+        context = ScanContext(
+                tag=str(run), time=_time(run), scanner=scanner,
+                modified_after=_time(after)) if run else None
+        with SourceManager(scan_context=context) as sm:
+            return {h.relative_path: h for h in self.source.handles(sm)}
+
+    def test_exploration(self):
+        """Exploring a folder should find the same files as a recursive glob
+        did, and should attach their size and modification time to them."""
+        root = Path(self.root)
+        expected = [
+                str(f.relative_to(root))
+                for d in root.glob("**") for f in d.iterdir() if f.is_file()]
+
+        with SourceManager() as sm:
+            handles = list(self.source.handles(sm))
+            self.assertEqual([h.relative_path for h in handles], expected)
+            for h in handles:
+                resource = h.follow(sm)
+                self.assertEqual(h.hint("size"), len(h.relative_path))
+                # (Hints only have a resolution of one second)
+                self.assertEqual(
+                        resource.get_last_modified(),
+                        resource.unpack_stat()[
+                                file.OutputType.LastModified].replace(
+                                        microsecond=0))
+
+    def test_snapshot(self):
+        """Files that haven't changed since the last complete exploration
+        should be skipped."""
+        with TemporaryDirectory() as snapshots, \
+                mock.patch.object(file, "SNAPSHOT_DIR", snapshots):
+            self.assertEqual(len(self.explore(1, after=0)), 4)
+            self.assertEqual(self.explore(2, after=1), {})
+
+            self.write("x/b.txt", "changed")
+            self.write("new.txt", "new")
+
+            # An interrupted exploration shouldn't replace the snapshot
+            with SourceManager(scan_context=ScanContext(
+                    tag="3", time=_time(3), scanner="1",
+                    modified_after=_time(2))) as sm:
+                it = self.source.handles(sm)
+                next(it)
+                it.close()
+            self.assertEqual(
+                    sorted(self.explore(4, after=2)),
+                    ["new.txt", "x/b.txt"])
+            self.assertEqual(self.explore(5, after=4), {})
+
+    def test_snapshot_scope(self):
+        """Snapshots should only be used by later scans by the same scanner
+        that are only interested in files changed since the snapshot was
+        taken."""
+        with TemporaryDirectory() as snapshots, \
+                mock.patch.object(file, "SNAPSHOT_DIR", snapshots):
+            self.assertEqual(len(self.explore(1, after=0)), 4)
+
+            # Scans with no last-modified check, or by another scanner
+            self.assertEqual(len(self.explore()), 4)
+            self.assertEqual(len(self.explore(2)), 4)
+            self.assertEqual(len(self.explore(2, after=1, scanner="2")), 4)
+
+            # A scan that starts over after the snapshot's scan didn't finish
+            self.assertEqual(len(self.explore(3, after=0)), 4)
+            self.assertEqual(self.explore(4, after=3), {})
@@ -16,7 +16,8 @@ from os2datascanner.utils.system_utilities import time_now
 from os2datascanner.engine2.model.core import Handle, SourceManager
 from os2datascanner.engine2.model.http import (WebSource, WebHandle)
 from os2datascanner.engine2.model.utilities.crawler import (
-        parse_html, make_outlinks)
+        parse_html, make_outlinks, Crawler, BloomFilter, HostThrottle,
+        by_depth)
 from os2datascanner.engine2.model.utilities.sitemap import (
     process_sitemap_url, _get_url_data)
 from os2datascanner.engine2.conversions.types import Link, OutputType
@@ -482,6 +483,19 @@ class Engine2HTTPExplorationTest(Engine2HTTPSetup, unittest.TestCase):
             "embedded site without sitemap should have 3 handles",
         )
 
+    @mock.patch("os2datascanner.engine2.model.http.CONCURRENCY", 4)
+    def test_exploration_concurrent(self):
+        "scrape links with several requests in flight at once"
+
+        with SourceManager() as sm:
+            presentation_urls = [
+                    h.presentation_url for h in site["source"].handles(sm)]
+        self.assertCountEqual(
+            presentation_urls,
+            site["handles"],
+            "concurrent exploration should find the same 3 handles",
+        )
+
     def test_exploration_sitemap(self):
         "Use sitemap and no scraping"
 
@@ -1031,3 +1045,61 @@ class Engine2HTTPConversionTests(Engine2HTTPSetup, unittest.TestCase):
             links_from_handle["http-links"],
             "Conversion from html to links did not produce the expected links"
         )
+
+
+class _TreeCrawler(Crawler):
+    """Crawls a binary tree of integers, where the children of n are 2n and
+    2n + 1."""
+    def visit_one(self, n, ttl, hints):
+        self.add(2 * n, ttl - 1)
+        self.add(2 * n + 1, ttl - 1)
+        yield n
+
+
+class Engine2CrawlerTests(unittest.TestCase):
+    def test_frontier_order(self):
+        """Crawlers should visit each object once, in the order in which they
+        were found or by priority."""
+        fifo = _TreeCrawler(ttl=4)
+        fifo.add(1)
+        fifo.add(3, ttl=2)
+        self.assertEqual(
+                list(fifo.visit()),
+                [1, 3, 2, 6, 7, 4, 5, 8, 9, 10, 11])
+
+        # (3 keeps the TTL it was first added with, so its children aren't
+        # visited)
+        shallowest = _TreeCrawler(ttl=3, priority=by_depth)
+        shallowest.add(3, ttl=1)
+        shallowest.add(1)
+        self.assertEqual(
+                list(shallowest.visit()),
+                [1, 2, 3, 4, 5])
+        self.assertEqual(len(shallowest.seen), 5)
+
+    def test_bloom_filter(self):
+        """Bloom filters should remember everything added to them, and should
+        rarely claim to remember anything else."""
+        bf = BloomFilter(1000, error_rate=0.01)
+        for i in range(1000):
+            bf.add(f"http://localhost/{i}")
+        self.assertTrue(all(f"http://localhost/{i}" in bf for i in range(1000)))
+        self.assertLess(
+                sum(f"http://example.com/{i}" in bf for i in range(1000)),
+                50)
+
+    def test_host_throttle(self):
+        """Requests to a host should be spaced out by its robots.txt file's
+        Crawl-delay, which should only be retrieved once."""
+        session = mock.Mock(headers={"User-Agent": "OS2datascanner/1.0"})
+        session.get.return_value = mock.Mock(
+                status_code=200, text="User-agent: *\nCrawl-delay: 1\n")
+        throttle = HostThrottle(session, connections=2, delay=0.5)
+
+        start = time.monotonic()
+        for _ in range(2):
+            with throttle.request("http://localhost:64346/index.html"):
+                pass
+        self.assertGreaterEqual(time.monotonic() - start, 1.0)
+        session.get.assert_called_once_with(
+                "http://localhost:64346/robots.txt", timeout=None)
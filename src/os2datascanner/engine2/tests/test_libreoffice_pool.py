@@ -0,0 +1,85 @@
+import os
+import sys
+import unittest
+import subprocess
+from tempfile import TemporaryDirectory
+
+from os2datascanner.engine2.model.derived.utilities.libreoffice_pool import (
+        LibreOfficePool, ConversionError, DaemonUnavailable)
+
+
+# A stand-in for libreoffice_daemon.py that "converts" files by copying them
+# (or, for files called "slow", by sleeping)
+fake_daemon = """
+import os, sys, time, shutil
+from xmlrpc.server import SimpleXMLRPCServer
+
+def convert(input_path, input_filter, output_spec, output_dir):
+    stem, _ = os.path.splitext(os.path.basename(input_path))
+    if stem == "slow":
+        time.sleep(10)
+    elif stem == "bad":
+        raise ValueError("couldn't load document")
+    shutil.copy(input_path, os.path.join(
+            output_dir, stem + "." + output_spec.split(":")[0]))
+    return True
+
+server = SimpleXMLRPCServer(("127.0.0.1", 0), logRequests=False)
+server.register_function(lambda: {"pid": os.getpid(), "rss": 0}, "ping")
+server.register_function(convert, "convert")
+print("READY", server.server_address[1], flush=True)
+server.serve_forever()
+"""
+
+
+class LibreOfficePoolTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.pool = LibreOfficePool(
+                [sys.executable, "-c", fake_daemon],
+                max_conversions=2, startup_timeout=10)
+        self.addCleanup(self.pool.close)
+
+    def _convert(self, name, **kwargs):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, "wt") as fp:
+            fp.write(name)
+        self.pool.convert(
+                path, "MS Word 97", "html", self.tmpdir.name, **kwargs)
+        return self.pool._daemons[0]._process
+
+    def test_daemon_reused(self):
+        """Daemons should be reused for several conversions, and then
+        restarted."""
+        first = self._convert("a.doc")
+        self.assertIs(self._convert("b.doc"), None)
+        third = self._convert("c.doc")
+        self.assertIsNot(first, third)
+        self.assertEqual(first.poll(), -15)
+        self.assertTrue(
+                os.path.exists(os.path.join(self.tmpdir.name, "c.html")))
+
+    def test_conversion_failure(self):
+        """Failed conversions should raise an exception without stopping the
+        daemon; conversions that take too long should stop it."""
+        with self.assertRaises(ConversionError):
+            self._convert("bad.doc")
+        process = self.pool._daemons[0]._process
+        self.assertIsNone(process.poll())
+
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self._convert("slow.doc", timeout=0.5)
+        self.assertIsNotNone(process.poll())
+
+    def test_unavailable(self):
+        """A daemon that can't be started should be reported as
+        unavailable."""
+        pool = LibreOfficePool(
+                [sys.executable, "-c", "pass"], startup_timeout=10)
+        with self.assertRaises(DaemonUnavailable):
+            pool.convert("a.doc", "MS Word 97", "html", self.tmpdir.name)
+        # (... and there's no point in trying again straight away)
+        pool._command = None
+        with self.assertRaises(DaemonUnavailable):
+            pool.convert("a.doc", "MS Word 97", "html", self.tmpdir.name)
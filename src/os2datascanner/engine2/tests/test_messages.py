@@ -92,3 +92,31 @@ class MessageTest(unittest.TestCase):
                             name="Vejstrand Kommune",
                             uuid=None),
                     "could not parse simple organisation scan tag")
+
+    def test_shared_decoding(self):
+        calls = []
+
+        def decoder(obj):
+            calls.append(obj)
+            return dict(obj)
+
+        shared = {"type": "regex", "expression": "[Tt]est"}
+        equal = {"type": "regex", "expression": "[Tt]est"}
+
+        with messages.shared_decoding():
+            first = messages._decode_shared(decoder, shared)
+            second = messages._decode_shared(decoder, shared)
+            third = messages._decode_shared(decoder, equal)
+
+        self.assertIs(
+                first, second,
+                "shared object was decoded more than once")
+        self.assertIsNot(
+                first, third,
+                "merely equal object was treated as shared")
+        self.assertEqual(len(calls), 2)
+
+        messages._decode_shared(decoder, shared)
+        self.assertEqual(
+                len(calls), 3,
+                "decoding cache outlived its context")
@@ -0,0 +1,189 @@
+import unittest
+from unittest import mock
+from datetime import datetime, timezone
+from tempfile import TemporaryDirectory
+
+from os2datascanner.engine2.model.core import ScanContext, SourceManager
+from os2datascanner.engine2.model.msgraph import files, mail
+from os2datascanner.engine2.model.msgraph.utilities import MSGraphSource
+
+
+GRAPH = "https://graph.microsoft.com/v1.0"
+DRIVE_DELTA = (
+        f"{GRAPH}/drives/drive1/root/delta?$select=id,name,file,folder,root,"
+        "deleted,parentReference,webUrl")
+MAIL_DELTA = (
+        f"{GRAPH}/users/user@example.com/mailFolders/inbox/messages/delta"
+        "?$select=id,subject,webLink,parentFolderId")
+
+
+def _item(iid, name, parent, kind="file", **kwargs):
+    return {
+        "id": iid, "name": name, kind: {},
+        "parentReference": {"id": parent}} | kwargs
+
+
+def _message(mid):
+    return {
+        "id": mid, "subject": mid, "webLink": None, "parentFolderId": "inbox"}
+
+
+def _time(run):
+    return datetime(2024, 1, 1, run, tzinfo=timezone.utc)
+
+
+class FakeGraphCaller:
+    """A stand-in for MSGraphSource.GraphCaller that returns canned
+    responses."""
+    def __init__(self, responses):
+        self.responses = responses
+
+    def _response(self, url):
+        return mock.Mock(json=mock.Mock(return_value=self.responses[url]))
+
+    def get(self, tail):
+        return self._response(f"{GRAPH}/{tail}")
+
+    def follow_next_link(self, url):
+        return self._response(url)
+
+
+class MSGraphDeltaTests(unittest.TestCase):
+    def setUp(self):
+        tmpdir = TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        for module in (files, mail,):
+            patcher = mock.patch.object(module, "DELTA_DIR", tmpdir.name)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.responses = {}
+        self.runs = 0
+
+        def _generate_state(source, sm):
+            yield FakeGraphCaller(self.responses)
+        patcher = mock.patch.object(
+                MSGraphSource, "_generate_state", _generate_state)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def explore(self, source, run=None, after=None):
+        """Explores a source as part of an incremental scan that's only
+        interested in items modified since the given earlier run. (Each run
+        is assumed to have finished unless told otherwise.)"""
+        if run is None:
+            self.runs += 1
+            run, after = self.runs, self.runs - 1
+        context = ScanContext(
+                tag=str(run), time=_time(run), scanner="1",
+                modified_after=_time(after))
+        with SourceManager(scan_context=context) as sm:
+            return [h.relative_path for h in source.handles(sm)]
+
+    def test_drive_delta(self):
+        """Exploring a drive again should only produce the files that have
+        changed, moved or been deleted since the last exploration."""
+        source = files.MSGraphDriveSource(files.MSGraphDriveHandle(
+                files.MSGraphFilesSource("client", "tenant", "secret"),
+                "drive1", "Documents", None))
+
+        self.responses[DRIVE_DELTA] = {
+            "value": [
+                _item("file1", "x.txt", "folder1"),
+                {"id": "root", "name": "root", "root": {}, "folder": {}},
+                _item("folder1", "A", "root", "folder"),
+            ],
+            "@odata.nextLink": "page2",
+        }
+        self.responses["page2"] = {
+            "value": [_item("file2", "y.txt", "root")],
+            "@odata.deltaLink": "delta1",
+        }
+        self.assertEqual(self.explore(source), ["y.txt", "A/x.txt"])
+
+        self.responses["delta1"] = {
+            "value": [
+                _item("folder1", "B", "root", "folder"),
+                {"id": "file2", "deleted": {"state": "deleted"}},
+                _item("file3", "z.txt", "folder1"),
+            ],
+            "@odata.deltaLink": "delta2",
+        }
+        self.assertEqual(
+                self.explore(source),
+                ["A/x.txt", "B/x.txt", "y.txt", "B/z.txt"])
+
+        self.responses["delta2"] = {
+            "value": [],
+            "@odata.deltaLink": "delta3",
+        }
+        self.assertEqual(self.explore(source), [])
+
+    def test_mailbox_delta(self):
+        """Exploring a mailbox again should only produce the messages that
+        have been created or removed since the last exploration."""
+        source = mail.MSGraphMailAccountSource(mail.MSGraphMailAccountHandle(
+                mail.MSGraphMailSource("client", "tenant", "secret"),
+                "user@example.com"))
+
+        self.responses[
+                f"{GRAPH}/users/user@example.com/mailFolders?$select=id,"
+                "parentFolderId,displayName,childFolderCount&$top=100"] = {
+            "value": [{
+                "id": "inbox", "parentFolderId": "root",
+                "displayName": "Inbox", "childFolderCount": 0,
+            }],
+        }
+        self.responses[MAIL_DELTA] = {
+            "value": [_message("m1"), _message("m2")],
+            "@odata.deltaLink": "delta1",
+        }
+        self.assertEqual(self.explore(source), ["m1", "m2"])
+
+        self.responses["delta1"] = {
+            "value": [
+                {"id": "m1", "@removed": {"reason": "deleted"}},
+                _message("m3"),
+            ],
+            "@odata.deltaLink": "delta2",
+        }
+        self.assertEqual(self.explore(source), ["m1", "m3"])
+
+    def test_unfinished_delta(self):
+        """Delta links recorded by a scan that might not have finished, or by
+        another scanner, shouldn't be used."""
+        source = mail.MSGraphMailAccountSource(mail.MSGraphMailAccountHandle(
+                mail.MSGraphMailSource("client", "tenant", "secret"),
+                "user@example.com"))
+
+        self.responses[
+                f"{GRAPH}/users/user@example.com/mailFolders?$select=id,"
+                "parentFolderId,displayName,childFolderCount&$top=100"] = {
+            "value": [{
+                "id": "inbox", "parentFolderId": "root",
+                "displayName": "Inbox", "childFolderCount": 0,
+            }],
+        }
+        self.responses[MAIL_DELTA] = {
+            "value": [_message("m1"), _message("m2")],
+            "@odata.deltaLink": "delta1",
+        }
+        self.responses["delta1"] = {
+            "value": [_message("m3")],
+            "@odata.deltaLink": "delta2",
+        }
+        self.assertEqual(self.explore(source, 1, after=0), ["m1", "m2"])
+        # The first scan didn't finish, so the second one starts over
+        self.assertEqual(self.explore(source, 2, after=0), ["m1", "m2"])
+        self.assertEqual(self.explore(source, 3, after=2), ["m3"])
+
+        # Scans without a last-modified check don't use delta queries at all
+        self.responses[
+                f"{GRAPH}/users/user@example.com/messages?$select=id,subject,"
+                "webLink,parentFolderId&$top=100"] = {
+            "value": [_message("m1"), _message("m2"), _message("m3")],
+        }
+        with SourceManager() as sm:
+            self.assertEqual(
+                    [h.relative_path for h in source.handles(sm)],
+                    ["m1", "m2", "m3"])
@@ -0,0 +1,89 @@
+import unittest
+from unittest import mock
+
+from os2datascanner.engine2.model.core import SourceManager
+from os2datascanner.engine2.model.msgraph import files
+from os2datascanner.engine2.model.msgraph.utilities import MSGraphSource
+
+
+def _children(drive, iid):
+    if iid == "root":
+        return f"drives/{drive}/root/children"
+    return f"drives/{drive}/items/{iid}/children"
+
+
+def _file(name):
+    return {"id": name, "name": name, "file": {}}
+
+
+def _folder(name):
+    return {"id": name, "name": name, "folder": {}}
+
+
+# Each folder's children, split into pages
+pages = {
+    _children("drive1", "root"): [
+        [_file("a.txt"), _folder("A")],
+        [_folder("B"), _file("b.txt")],
+    ],
+    _children("drive1", "A"): [
+        [_file("c.txt")],
+        [_file("d.txt")],
+        [_folder("C")],
+    ],
+    _children("drive1", "B"): [[]],
+    _children("drive1", "C"): [[_file("e.txt")]],
+}
+
+
+class FakeGraphCaller:
+    """A stand-in for MSGraphSource.GraphCaller that serves the folder
+    listings above, a page at a time."""
+    def __init__(self):
+        self.requested = []
+
+    def _page(self, tail, number):
+        self.requested.append((tail, number))
+        page = {"value": pages[tail][number]}
+        if number + 1 < len(pages[tail]):
+            page["@odata.nextLink"] = f"{tail}#{number + 1}"
+        return mock.Mock(json=mock.Mock(return_value=page))
+
+    def get(self, tail):
+        return self._page(tail, 0)
+
+    def follow_next_link(self, url):
+        tail, number = url.split("#")
+        return self._page(tail, int(number))
+
+
+class MSGraphDriveWalkTests(unittest.TestCase):
+    def setUp(self):
+        self.caller = FakeGraphCaller()
+
+        def _generate_state(source, sm):
+            yield self.caller
+        patcher = mock.patch.object(
+                MSGraphSource, "_generate_state", _generate_state)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.source = files.MSGraphDriveSource(files.MSGraphDriveHandle(
+                files.MSGraphFilesSource("client", "tenant", "secret"),
+                "drive1", "Documents", None))
+
+    def test_walk(self):
+        """Exploring a drive should follow every page of every folder's
+        listing, whether or not folders are listed in parallel."""
+        for walkers in (1, 4,):
+            self.caller.requested.clear()
+            with self.subTest(walkers=walkers), \
+                    mock.patch.object(files, "WALKERS", walkers), \
+                    SourceManager() as sm:
+                self.assertEqual(
+                        sorted(h.relative_path
+                               for h in self.source.handles(sm)),
+                        ["A/C/e.txt", "A/c.txt", "A/d.txt", "a.txt", "b.txt"])
+                self.assertEqual(
+                        len(self.caller.requested),
+                        sum(len(p) for p in pages.values()))
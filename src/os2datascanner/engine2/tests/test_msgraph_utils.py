@@ -2,8 +2,10 @@
 Unit tests for utilities for use with MS Graph.
 """
 
+import json
 import requests
 import unittest
+from unittest import mock
 
 from os2datascanner.engine2.model.msgraph import utilities as msgu
 from os2datascanner.engine2.model.msgraph.graphiti import (builder,
@@ -38,6 +40,65 @@ class TestGraphUtilities(unittest.TestCase):
                 "didn't get the expected status code")
 
 
+def _response(status, body, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers = requests.structures.CaseInsensitiveDict(headers or {})
+    response._content = json.dumps(body).encode()
+    return response
+
+
+class TestGraphBatching(unittest.TestCase):
+    def setUp(self):
+        self.session = mock.Mock()
+        self.caller = msgu.MSGraphSource.GraphCaller(
+                lambda: "token", self.session)
+
+    def test_batch_get(self):
+        """Batched requests should be returned in order, and only throttled
+        requests should be retried."""
+        self.session.post.side_effect = [
+            _response(200, {"responses": [
+                {"id": "2", "status": 404, "body": {"error": {}}},
+                {"id": "0", "status": 200, "body": {"value": 0}},
+                {"id": "1", "status": 429, "headers": {"Retry-After": "0"}},
+            ]}),
+            _response(200, {"responses": [
+                {"id": "1", "status": 200, "body": {"value": 1}},
+            ]}),
+        ]
+
+        responses = self.caller.batch_get(["a", "b c", "d"])
+        self.assertEqual(
+                [r.status_code for r in responses],
+                [200, 200, 404])
+        self.assertEqual(responses[1].json(), {"value": 1})
+
+        first, second = self.session.post.call_args_list
+        self.assertEqual(
+                [r["url"] for r in first.kwargs["json"]["requests"]],
+                ["/a", "/b%20c", "/d"])
+        self.assertEqual(
+                [r["id"] for r in second.kwargs["json"]["requests"]],
+                ["1"])
+
+    def test_shared_throttle(self):
+        """Once the server has asked one request to back off, every request
+        made through the same GraphCaller should wait."""
+        self.session.get.return_value = _response(200, {})
+        self.caller._throttle.observe(
+                _response(429, {}, {"Retry-After": "30"}))
+        self.session.post.return_value = _response(200, {"responses": [
+            {"id": str(i), "status": 200, "body": {}} for i in range(2)]})
+        with mock.patch.object(msgu, "sleep") as sleep:
+            self.caller.get("a")
+            self.caller.follow_next_link("b")
+            self.caller.batch_get(["c", "d"])
+        self.assertEqual(sleep.call_count, 3)
+        for call in sleep.call_args_list:
+            self.assertAlmostEqual(call.args[0], 30, delta=5)
+
+
 class TestMSGraphURLBuilder(unittest.TestCase):
     """
     Unit tests for the MSGraphURLBuilder utility class.
@@ -0,0 +1,482 @@
+import os
+import json
+import time
+import signal
+import unittest
+import threading
+from unittest import mock
+from collections import deque
+from concurrent.futures.process import BrokenProcessPool
+
+import pika
+
+from os2datascanner.engine2.pipeline.utilities import codec, pika as ppika
+from os2datascanner.engine2.model.core import SourceManager
+from os2datascanner.engine2.pipeline import processor, run_stage
+from os2datascanner.engine2.pipeline.utilities.pika import (
+        PikaPipelineThread, RejectMessage, _load_body)
+
+
+class PikaPipelineThreadTests(unittest.TestCase):
+    def setUp(self):
+        self.runner = PikaPipelineThread(read=["in"], write=["out"])
+        self.runner._channel = mock.Mock()
+        for tag in range(1, 7):
+            self.runner.handle_message_raw(
+                    self.runner._channel,
+                    mock.Mock(delivery_tag=tag),
+                    mock.Mock(priority=0),
+                    b"{}")
+
+    def test_acks_coalesced(self):
+        """Consecutive acknowledgements should be sent as a single frame."""
+        running = self.runner._process_requests(deque([
+            ("ack", 2),
+            ("ack", 1),
+            ("msg", "out", b"{}", "", {}),
+            ("rej", 4, False),
+            ("ack", 3),
+            ("ack", 6),
+        ]))
+        self.assertTrue(running)
+
+        channel = self.runner._channel
+        channel.basic_reject.assert_called_once_with(4, requeue=False)
+        self.assertEqual(
+                channel.basic_ack.call_args_list,
+                [mock.call(3, multiple=True), mock.call(6)])
+        self.assertEqual(
+                list(self.runner._unsettled),
+                [5])
+
+    def test_acks_before_synchronisation(self):
+        """Acknowledgements requested before a synchronisation point should
+        have been sent when it's reached."""
+        ev = mock.Mock()
+        ev.set.side_effect = (
+                lambda: self.runner._channel.basic_ack.assert_called_once_with(
+                        1, multiple=True))
+
+        running = self.runner._process_requests(deque([
+            ("ack", 1),
+            ("syn", ev),
+            ("ack", 2),
+            ("fin",),
+            ("ack", 3),
+        ]))
+        self.assertFalse(running)
+
+        ev.set.assert_called_once()
+        self.assertEqual(
+                self.runner._channel.basic_ack.call_args_list,
+                [mock.call(1, multiple=True), mock.call(2, multiple=True)])
+
+    def test_acks_held_until_confirmed(self):
+        """With publisher confirms enabled, a message should only be
+        acknowledged once everything published before it has been confirmed,
+        and should be requeued if any of that was refused."""
+        self.runner._max_unconfirmed = 10
+        self.runner._connection = mock.Mock()
+        channel = self.runner._channel
+
+        self.runner._process_requests(deque([
+            ("msg", "out", b"{}", "", {}),
+            ("msg", "out", b"{}", "", {}),
+            ("ack", 1),
+            ("msg", "out", b"{}", "", {}),
+            ("ack", 2),
+            ("ack", 3),
+        ]))
+        channel.basic_ack.assert_not_called()
+        self.assertEqual(list(self.runner._unconfirmed), [1, 2, 3])
+
+        self.runner._on_confirmation(mock.Mock(
+                method=pika.spec.Basic.Ack(delivery_tag=2, multiple=True)))
+        self.runner._process_requests(deque())
+        channel.basic_ack.assert_called_once_with(1, multiple=True)
+
+        self.runner._on_confirmation(mock.Mock(
+                method=pika.spec.Basic.Nack(delivery_tag=3)))
+        self.runner._process_requests(deque())
+        channel.basic_reject.assert_called_once_with(2, requeue=True)
+        channel.basic_ack.assert_called_with(3, multiple=True)
+        self.assertEqual(list(self.runner._unsettled), [4, 5, 6])
+
+
+class BroadcastingThread(PikaPipelineThread):
+    """A PikaPipelineThread that records the messages it handles, treating
+    those with an empty routing key as broadcast messages that add to its
+    state. Its process dies if it's asked to handle a message that says so."""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.seen = []
+        self.handled = []
+
+    def is_broadcast(self, routing_key):
+        return routing_key == ""
+
+    def handle_message(self, routing_key, body):
+        if routing_key == "":
+            self.seen.append(body["n"])
+        else:
+            if body.get("die"):
+                os.kill(os.getpid(), signal.SIGKILL)
+            self.handled.append((body["n"], list(self.seen)))
+        yield from []
+
+    def broadcast_state(self):
+        return list(self.seen)
+
+    def restore_broadcast_state(self, state):
+        self.seen = list(state)
+
+
+def _deliveries(*messages):
+    return [(mock.Mock(delivery_tag=n, routing_key=key),
+             mock.Mock(), json.dumps(body).encode())
+            for n, (key, body) in enumerate(messages, start=1)]
+
+
+class BroadcastTests(unittest.TestCase):
+    def setUp(self):
+        self.parent = BroadcastingThread(processes=2)
+        self.parent._pool = mock.Mock()
+        self.parent._enqueue_all = mock.Mock()
+
+    def _consume(self, *messages):
+        self.parent.await_messages = mock.Mock(return_value=_deliveries(
+                *((key, {"n": n}) for key, n in messages)))
+        self.parent._consume_batch()
+        return self.parent._pool.submit.call_args.args[1:]
+
+    def test_broadcasts_replayed(self):
+        """Broadcast messages should be handled by the parent process, and
+        every worker process should be brought up to date with all of them
+        before its next batch."""
+        first = self._consume(("", 1), ("in", 2), ("", 3))
+        second = self._consume(("in", 4), ("", 5))
+        third = self._consume(*(("", n) for n in range(6, 106)), ("in", 106))
+        self.assertEqual(self.parent.seen, [1, 3, 5, *range(6, 106)])
+        self.assertEqual(self.parent.handled, [])
+
+        for batches, expected in (
+                ((first, second,), [(2, [1, 3]), (4, [1, 3, 5])]),
+                ((second,), [(4, [1, 3, 5])]),
+                ((third,), [(106, self.parent.seen)]),):
+            with self.subTest(batches=len(batches)):
+                worker = BroadcastingThread()
+                with mock.patch.object(ppika, "_process_runner", worker):
+                    for batch in batches:
+                        ppika._handle_batch_in_process(*batch)
+                self.assertEqual(worker.handled, expected)
+
+
+class PoolTests(unittest.TestCase):
+    def setUp(self):
+        self.parent = BroadcastingThread(processes=2)
+        self.parent._enqueue_all = mock.Mock()
+        self.parent.enqueue_stop = mock.Mock()
+        self.parent._start_pool()
+        self.addCleanup(self.parent._stop_pool)
+
+    def _consume(self, *bodies):
+        self.parent.await_messages = mock.Mock(return_value=_deliveries(
+                *(("in", body) for body in bodies)))
+        self.parent._consume_batch()
+
+    def _wait_for(self, condition):
+        deadline = time.monotonic() + 10
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_worker_death(self):
+        """The death of a worker process should stop the consumer rather than
+        leaving its batch unsettled forever."""
+        self._consume({"n": 1})
+        self._wait_for(lambda: self.parent._enqueue_all.called)
+        self.parent._enqueue_all.assert_called_once_with([("ack", 1)])
+
+        self._consume({"n": 1, "die": True})
+        self._wait_for(lambda: self.parent._pool_exception is not None)
+        self.assertIsInstance(
+                self.parent._pool_exception, BrokenProcessPool)
+        self.parent.enqueue_stop.assert_called()
+        self.parent._enqueue_all.assert_called_once()
+
+
+class BatchingThread(PikaPipelineThread):
+    """A PikaPipelineThread that produces two messages for each message it
+    handles, rejecting those that ask to be rejected."""
+    def __init__(self, **kwargs):
+        super().__init__(batch_size=10, **kwargs)
+        self._enqueue_all = mock.Mock()
+        self.after = []
+
+    def handle_message(self, routing_key, body):
+        yield ("out", {"n": body["n"], "part": 1})
+        if body.get("reject"):
+            raise RejectMessage(requeue=False)
+        yield ("out", {"n": body["n"], "part": 2})
+
+    def after_message(self, routing_key, body):
+        self.after.append(body["n"])
+
+
+class BatchTests(unittest.TestCase):
+    def setUp(self):
+        self.runner = BatchingThread()
+
+    def _receive(self, *tags):
+        for tag in tags:
+            self.runner.handle_message_raw(
+                    None,
+                    mock.Mock(delivery_tag=tag, routing_key="in"),
+                    pika.BasicProperties(priority=0),
+                    b'{"n": %d}' % tag)
+
+    def test_batch_size_and_linger(self):
+        """A batch should hold at most the requested number of messages, and
+        should only wait for more to arrive for the linger period."""
+        self.runner._live = True
+        self._receive(1, 2, 3, 4, 5)
+        self.assertEqual(
+                [m.delivery_tag
+                 for m, _, _ in self.runner.await_messages(3, 10.0)],
+                [1, 2, 3])
+
+        start = time.monotonic()
+        self.assertEqual(
+                [m.delivery_tag
+                 for m, _, _ in self.runner.await_messages(3, 0.2)],
+                [4, 5])
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+        timer = threading.Timer(0.1, self._receive, args=(6, 7))
+        timer.start()
+        start = time.monotonic()
+        self.assertEqual(
+                [m.delivery_tag
+                 for m, _, _ in self.runner.await_messages(2, 10.0, 10.0)],
+                [6, 7])
+        self.assertLess(time.monotonic() - start, 5.0)
+        timer.join()
+
+    def _consume(self, *bodies):
+        self.runner.await_messages = mock.Mock(return_value=_deliveries(
+                *(("in", body) for body in bodies)))
+        self.runner._consume_batch()
+        return [request
+                for call in self.runner._enqueue_all.call_args_list
+                for request in call.args[0]]
+
+    def _output(self, n, part):
+        _, _, body, _, _ = self.runner._prepare_message(
+                "out", {"n": n, "part": part})[-1]
+        return body
+
+    def test_mixed_batch(self):
+        """The output of every message in a batch should be published before
+        its acknowledgement, and a rejected message's partial output should
+        be discarded."""
+        requests = self._consume({"n": 1}, {"n": 2, "reject": True}, {"n": 3})
+        self.assertEqual(
+                [r[:3] if r[0] == "msg" else r for r in requests],
+                [("msg", "out", self._output(1, 1)),
+                 ("msg", "out", self._output(1, 2)),
+                 ("ack", 1),
+                 ("rej", 2, False),
+                 ("msg", "out", self._output(3, 1)),
+                 ("msg", "out", self._output(3, 2)),
+                 ("ack", 3)])
+        self.assertEqual(self.runner.after, [1, 3])
+
+    @mock.patch.object(ppika, "_MAX_PENDING_REQUESTS", 4)
+    def test_pending_requests_flushed(self):
+        """A batch's requests should be passed on to the background thread
+        whenever too many of them have been collected."""
+        self._consume({"n": 1}, {"n": 2}, {"n": 3})
+        self.assertEqual(
+                [[r[0] for r in call.args[0]]
+                 for call in self.runner._enqueue_all.call_args_list],
+                [["msg", "msg", "ack", "msg", "msg", "ack"],
+                 ["msg", "msg", "ack"]])
+        self.assertEqual(self.runner.after, [1, 2, 3])
+
+
+class GroupingTests(unittest.TestCase):
+    def setUp(self):
+        self.runner = run_stage.GenericRunner(
+                SourceManager(), stage="processor", module=processor,
+                queue_suffix=None, limit=None, read=["in"], write=["out"])
+
+    def _body(self, scanner, rule):
+        return {
+            "scan_spec": {
+                "scan_tag": {"scanner": {"pk": scanner}},
+                "source": {"type": "file", "path": "/tmp"},
+                "rule": {"type": "regex", "expression": "x"},
+            },
+            "progress": {"rule": {"type": "regex", "expression": rule}},
+        }
+
+    def test_grouping(self):
+        """Messages with equal scan specifications and rules should be
+        grouped together, in their original order, and should share a single
+        copy of those fragments."""
+        batch = [
+            (1, "in", self._body(1, "a")),
+            (2, "in", self._body(2, "a")),
+            (3, "", {"abort": None}),
+            (4, "in", self._body(1, "a")),
+            (5, "in", self._body(1, "b")),
+            (6, "in", self._body(2, "a")),
+        ]
+        grouped = self.runner.prepare_batch(batch)
+        self.assertEqual([t for t, _, _ in grouped], [1, 4, 2, 6, 3, 5])
+
+        bodies = {t: body for t, _, body in grouped}
+        self.assertIs(bodies[1]["scan_spec"], bodies[4]["scan_spec"])
+        self.assertIs(bodies[1]["scan_spec"], bodies[5]["scan_spec"])
+        self.assertIsNot(bodies[1]["scan_spec"], bodies[2]["scan_spec"])
+        self.assertIs(
+                bodies[2]["progress"]["rule"], bodies[6]["progress"]["rule"])
+        self.assertIsNot(
+                bodies[4]["progress"]["rule"], bodies[5]["progress"]["rule"])
+
+
+class WireFormatTests(unittest.TestCase):
+    body = {
+        "scan_spec": {
+            "scan_tag": {"scanner": {"pk": 1, "name": "Test"}},
+            "rule": {"type": "regex", "expression": "x" * 1024},
+        },
+        "handle": {"type": "file", "path": "/tmp/example"},
+        "progress": {"rule": {"type": "dummy"}, "matches": []},
+    }
+
+    def setUp(self):
+        self.producer = PikaPipelineThread(wire_format="msgpack+zstd")
+        self.consumer = PikaPipelineThread()
+
+    def _deliver(self, request, tag=1):
+        _, routing_key, body, _, props = request
+        return self.consumer._decode_delivery(
+                mock.Mock(delivery_tag=tag, routing_key=routing_key),
+                pika.BasicProperties(**props), body)
+
+    def test_binary_round_trip(self):
+        """Messages in the binary wire format should be decoded to the
+        original message, with definitions only being stored once."""
+        (_, digest, definition), msg = self.producer._prepare_message(
+                "out", self.body)
+        self.assertEqual(
+                [r[0] for r in self.producer._prepare_message(
+                        "out", self.body)],
+                ["msg"])
+        self.assertNotIn(b"xxxx", codec.decompress(msg[2]))
+
+        self.consumer._definitions[digest] = codec.unpack(
+                codec.decompress(definition), None)
+        _, _, decoded = self._deliver(msg)
+        self.assertEqual(decoded, self.body)
+
+    def test_json_still_accepted(self):
+        """Messages in the old wire format should still be accepted."""
+        msg, = self.consumer._prepare_message("out", self.body)
+        _, _, decoded = self._deliver(msg)
+        self.assertEqual(_load_body(decoded), self.body)
+
+    @mock.patch.object(ppika, "_DEFINITION_TIMEOUT", 0.01)
+    @mock.patch.object(ppika, "_MAX_POLL_INTERVAL", 0.0)
+    def test_missing_definition(self):
+        """Messages referring to definitions that can't be retrieved should be
+        requeued rather than dropped."""
+        *_, msg = self.producer._prepare_message("out", self.body)
+        self.assertIsNone(self._deliver(msg, tag=5))
+        self.assertEqual(
+                self.consumer._outgoing[-1],
+                ("rej", 5, True))
+
+    def test_concurrent_resolution(self):
+        """Several consumers should be able to retrieve the same definition
+        from the definition stream at once."""
+        stream = FakeStream()
+        self.producer._channel = mock.Mock()
+        self.producer._channel.basic_publish.side_effect = stream.publish
+        *definitions, msg = self.producer._prepare_message("out", self.body)
+        self.producer._process_requests(deque(definitions))
+
+        consumers = [PikaPipelineThread() for _ in range(2)]
+        results = [None] * len(consumers)
+
+        def _decode(i):
+            _, routing_key, body, _, props = msg
+            results[i] = consumers[i]._decode_delivery(
+                    mock.Mock(delivery_tag=1, routing_key=routing_key),
+                    pika.BasicProperties(**props), body)
+
+        threads = [threading.Thread(target=_decode, args=(i,))
+                   for i in range(len(consumers))]
+        for thread in threads:
+            thread.start()
+
+        # Play the part of each consumer's background thread: start looking
+        # for the definitions once both consumers are waiting for them...
+        for consumer in consumers:
+            consumer._definition_channel = stream.channel()
+            deadline = time.monotonic() + 5
+            while not consumer._outgoing and time.monotonic() < deadline:
+                time.sleep(0.01)
+            with consumer._condition:
+                requests, consumer._outgoing = consumer._outgoing, deque()
+            consumer._process_requests(requests)
+        # ... and then let the broker deliver them
+        stream.deliver()
+        for consumer in consumers:
+            consumer._settle_fetches()
+
+        for thread in threads:
+            thread.join(5)
+        for (_, _, decoded), consumer in zip(results, consumers):
+            self.assertEqual(decoded, self.body)
+            self.assertEqual(consumer._fetches, {})
+        self.assertEqual(stream.consumers, {})
+        self.assertEqual(len(stream.entries), len(definitions))
+
+
+class FakeStream:
+    """A minimal imitation of a RabbitMQ stream: everything published to it is
+    kept, and every consumer receives everything published after its starting
+    offset."""
+    def __init__(self):
+        self.entries = []
+        self.consumers = {}
+
+    def publish(self, *, exchange, routing_key, properties, body):
+        self.entries.append((time.time(), properties, body))
+
+    def channel(self):
+        stream = self
+        channel = mock.Mock()
+
+        def basic_consume(queue, callback, *, consumer_tag, arguments):
+            offset = arguments["x-stream-offset"].timestamp()
+            stream.consumers[channel, consumer_tag] = (callback, offset)
+
+        def basic_cancel(consumer_tag):
+            del stream.consumers[channel, consumer_tag]
+
+        channel.basic_consume.side_effect = basic_consume
+        channel.basic_cancel.side_effect = basic_cancel
+        return channel
+
+    def deliver(self):
+        for (channel, tag), (callback, offset) in list(
+                self.consumers.items()):
+            for n, (stamp, properties, body) in enumerate(self.entries):
+                if stamp >= offset:
+                    callback(
+                            channel,
+                            mock.Mock(delivery_tag=n, consumer_tag=tag),
+                            properties, body)
@@ -1,7 +1,9 @@
+import math
 import random
 import unittest
+from datetime import date
 from os2datascanner.engine2.rules.utilities.cpr_probability import (
-        CprProbabilityCalculator)
+        CprProbabilityCalculator, modulus11_check, modulus11_check_many)
 
 
 def _cpr(time_from=None):
@@ -121,6 +123,46 @@ class TestCprTest(unittest.TestCase):
         check = self.cpr_calc.cpr_check(cpr, do_mod11_check=False)
         self.assertEqual(check, 0.5, "probability for an exception date should be 0.5")
 
+    def test_sequence_positions(self):
+        """Test that the probability of a legal CPR number depends on its
+        position in the list of legal CPR numbers for its birth date"""
+        legal_cprs = self.cpr_calc._calc_all_cprs(date(1975, 6, 12))
+        self.assertEqual(len(legal_cprs), len(set(legal_cprs)))
+        for index_number, cpr in enumerate(legal_cprs):
+            expected = (1.0 if index_number <= 100
+                        else 0.8 if index_number <= 200
+                        else 0.6 if index_number <= 250
+                        else 0.25 if index_number <= 350
+                        else 0.1)
+            self.assertEqual(
+                    self.cpr_calc.cpr_check(cpr), expected, cpr)
+
+    def test_batch_checks(self):
+        """Test that checking many CPR numbers at once gives the same results
+        as checking them one at a time"""
+        rng = random.Random(1906)
+        cprs = [_cpr() for _i in range(0, 200)]
+        cprs += [str(rng.randrange(0, 9999999999)).zfill(10)
+                 for _i in range(0, 200)]
+        cprs += ["0101643012", "2902000000", "2902010000", "111111111",
+                 "１１１１１１１１１８"]
+
+        for do_mod11_check in (True, False):
+            with self.subTest(do_mod11_check=do_mod11_check):
+                checks = self.cpr_calc.cpr_check_many(
+                        cprs, do_mod11_check=do_mod11_check)
+                for cpr, check in zip(cprs, checks):
+                    expected = self.cpr_calc.cpr_check(
+                            cpr, do_mod11_check=do_mod11_check)
+                    if isinstance(expected, str):
+                        self.assertTrue(math.isnan(check), cpr)
+                    else:
+                        self.assertEqual(check, expected, cpr)
+
+        self.assertEqual(
+                modulus11_check_many(cprs).tolist(),
+                [modulus11_check(cpr)[0] for cpr in cprs])
+
 # NOTE: This test fails too often, that we would not know if it is failing for real.
 # Furthermore it messes up the pipeline very often and decreases productivity.
 #
@@ -1,4 +1,5 @@
 import unittest
+from io import BytesIO
 from datetime import datetime, timezone
 
 from os2datascanner.engine2.rules.address import AddressRule
@@ -6,7 +7,8 @@ from os2datascanner.engine2.rules.cpr import CPRRule
 from os2datascanner.engine2.rules.dimensions import DimensionsRule
 from os2datascanner.engine2.rules.dummy import (
         NeverMatchesRule, AlwaysMatchesRule)
-from os2datascanner.engine2.rules.last_modified import LastModifiedRule
+from os2datascanner.engine2.rules.last_modified import (
+        LastModifiedRule, get_modified_after)
 from os2datascanner.engine2.rules.logical import (
     OrRule,
     AndRule,
@@ -18,9 +20,12 @@ from os2datascanner.engine2.rules.meta import HasConversionRule
 from os2datascanner.engine2.rules.name import NameRule
 from os2datascanner.engine2.rules.regex import RegexRule
 from os2datascanner.engine2.rules.wordlists import OrderedWordlistRule
-from os2datascanner.engine2.rules.rule import Sensitivity
+from os2datascanner.engine2.rules.rule import (
+        Rule, Sensitivity, rule_cache_hits)
 from os2datascanner.engine2.rules.dict_lookup import EmailHeaderRule
 from os2datascanner.engine2.rules.passport import PassportRule
+from os2datascanner.engine2.rules.utilities.name_index import (
+        NameIndex, NameIndexError)
 
 from os2datascanner.engine2.conversions.types import OutputType
 
@@ -315,6 +320,27 @@ P<USATRAVELER<<HAPPY<<<<<<<<<<<<<<<<<<<<<<<<-1500000035USA5609165M0811150<<<<<<<
                 back_again = rule.from_json_object(json)
                 self.assertEqual(rule, back_again)
 
+    def test_json_interning(self):
+        """Deserialising the same JSON representation of a Rule twice should
+        return the same object."""
+        rule = OrRule(
+                CPRRule(whitelist=["interning"]),
+                RegexRule("interning+"))
+        json = rule.to_json_object()
+        hits = rule_cache_hits._value.get()
+
+        first = Rule.from_json_object(json)
+        second = Rule.from_json_object(
+                {k: json[k] for k in reversed(json.keys())})
+        self.assertEqual(first, rule)
+        self.assertIs(
+                first,
+                second,
+                "equivalent JSON representations produced different Rules")
+        self.assertEqual(
+                rule_cache_hits._value.get(),
+                hits + 1)
+
     def test_oxford_comma(self):
         self.assertEqual(oxford_comma(["Monday"], "and"), "Monday")
         self.assertEqual(
@@ -325,6 +351,20 @@ P<USATRAVELER<<HAPPY<<<<<<<<<<<<<<<<<<<<<<<<-1500000035USA5609165M0811150<<<<<<<
             "Monday, Tuesday, and Wednesday",
         )
 
+    def test_modified_after(self):
+        """Only LastModifiedRules that every match depends on should restrict
+        the objects a rule can match."""
+        after = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        cpr = CPRRule()
+        for rule, expected in (
+                (cpr, None),
+                (LastModifiedRule(after), after),
+                (AndRule(LastModifiedRule(after), cpr), after),
+                (OrRule(LastModifiedRule(after), cpr), None),
+                (AndRule(cpr, OrRule(LastModifiedRule(after), cpr)), None),):
+            with self.subTest(rule=rule):
+                self.assertEqual(get_modified_after(rule), expected)
+
     def test_rule_names(self):
         A = RegexRule("A", name="Fragment A")
         B = RegexRule("B", name="Fragment B")
@@ -394,6 +434,22 @@ P<USATRAVELER<<HAPPY<<<<<<<<<<<<<<<<<<<<<<<<-1500000035USA5609165M0811150<<<<<<<
                     [[match["match"], match['probability']] for match in matches],
                     expected)
 
+    def test_name_index_round_trip(self):
+        index = NameIndex.from_datasets()
+        self.assertIn("ANDERS", index.first_names)
+        self.assertIn("NIELSEN", index.last_names)
+
+        with BytesIO() as fp:
+            index.dump(fp)
+            fp.seek(0)
+            self.assertEqual(
+                    NameIndex.load(fp),
+                    index,
+                    "name index changed after round trip")
+
+        with self.assertRaises(NameIndexError):
+            NameIndex.load(BytesIO(b"JENSEN\nHANSEN"))
+
     def test_address_rule_matches(self):
         candidates = [
             (
@@ -638,6 +694,19 @@ speciellæger.""",
                         tuple(wrl.match(in_value)),
                         expected)
 
+    def test_wordlists_shared(self):
+        """Instances of OrderedWordlistRule for the same dataset should share
+        a single set of words."""
+        wrl1 = OrderedWordlistRule("en_20211018_unit_test_words")
+        wrl2 = Rule.from_json_object(wrl1.to_json_object())
+        self.assertIs(
+                wrl1._wordlists,
+                wrl2._wordlists,
+                "wordlist was loaded twice")
+        self.assertEqual(
+                tuple(wrl2.match("Nothing to see here")),
+                ())
+
     def test_all_of_them(self):
         rule = AndRule(
                 HasConversionRule(OutputType.Text),
@@ -677,3 +746,42 @@ speciellæger.""",
                     len(matches[0][1]),
                     match_count,
                     "unexpected match count")
+
+    def test_matching_plan(self):
+        """Text rules that share a single pass over their input should produce
+        exactly the same matches as they would on their own."""
+        components = (
+                CPRRule(),
+                RegexRule(r"\d{3}"),
+                RegexRule(r"\b\w+sen\b"),
+                RegexRule(r"(?:ab)+"),)
+        rule = AllRule(*components)
+        content = (
+                "Jens Jensen, 111111-1118, abababa 123456 Hansen"
+                " 2205995008: forbryder, 0123-4567 Bo Mortensen")
+
+        conclusion, matches = rule.try_match(
+                {OutputType.Text.value: content})
+        self.assertTrue(
+                conclusion,
+                "unexpected match failure")
+        for component, component_matches in matches:
+            with self.subTest(component):
+                self.assertEqual(
+                        component_matches,
+                        list(component.match(content)),
+                        "shared pass produced different matches")
+
+    def test_matching_plan_group_names(self):
+        """Text rules whose expressions can't be combined into a single pass
+        should still be evaluated individually."""
+        rule = OrRule(
+                RegexRule(r"(?P<x>\d+)a"),
+                RegexRule(r"(?P<x>\d+)b"))
+        conclusion, matches = rule.try_match({OutputType.Text.value: "12b"})
+        self.assertTrue(
+                conclusion,
+                "unexpected match failure")
+        self.assertEqual(
+                [m["match"] for m in matches[-1][1]],
+                ["12b"])
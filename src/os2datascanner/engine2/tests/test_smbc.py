@@ -0,0 +1,151 @@
+import os
+import json
+import unittest
+from unittest import mock
+from datetime import datetime
+from tempfile import TemporaryDirectory
+
+import smbc
+
+from os2datascanner.engine2.model import smbc as smbc_model
+from os2datascanner.engine2.model.core import ScanContext, SourceManager
+from os2datascanner.engine2.model.smbc import SMBCSource
+from os2datascanner.engine2.pipeline import explorer, messages
+from os2datascanner.engine2.rules.cpr import CPRRule
+
+
+# A share with a few levels of directories, whose entries are deliberately not
+# listed in order
+share = {
+    "b": {
+        "3.txt": None,
+        "1.txt": None,
+        "sub": {"x.txt": None, "deeper": {"y.txt": None}},
+    },
+    "a.txt": None,
+    "c": {},
+    "d": {"2.txt": None, "4.txt": None},
+}
+
+
+class FakeContext:
+    """A stand-in for a libsmbclient context that serves the share above."""
+    opened = []
+
+    def __init__(self, auth_fn=None):
+        pass
+
+    def opendir(self, url):
+        node = share
+        for part in url.removeprefix("smb://server/share").split("/")[1:]:
+            node = node[part]
+        type(self).opened.append(url)
+        return mock.Mock(
+                getdents=lambda: [_dent(k, v) for k, v in node.items()])
+
+
+def _dent(name, value):
+    dent = mock.Mock(smbc_type=smbc.FILE if value is None else smbc.DIR)
+    dent.name = name
+    return dent
+
+
+def _context(tag):
+    return ScanContext(tag=tag, time=datetime(2024, 1, 1))
+
+
+expected = [
+    "a.txt",
+    "b/1.txt",
+    "b/3.txt",
+    "b/sub/deeper/y.txt",
+    "b/sub/x.txt",
+    "d/2.txt",
+    "d/4.txt",
+]
+
+
+@mock.patch.object(smbc, "Context", FakeContext)
+class SMBCWalkerTests(unittest.TestCase):
+    def setUp(self):
+        FakeContext.opened = []
+        self.source = SMBCSource("//server/share")
+
+    def walk(self, tag="scan1"):
+        with SourceManager(scan_context=_context(tag)) as sm:
+            return [h.relative_path for h in self.source.handles(sm)]
+
+    @mock.patch.object(smbc_model, "QUEUE_SIZE", 2)
+    @mock.patch.object(smbc_model, "WALKERS", 4)
+    def test_parallel_walk(self):
+        """Walking a share in parallel should produce every file in a stable
+        order, listing every directory exactly once."""
+        self.assertEqual(self.walk(), expected)
+        self.assertEqual(
+                sorted(FakeContext.opened),
+                sorted(set(FakeContext.opened)))
+        self.assertEqual(len(FakeContext.opened), 6)
+
+    @mock.patch.object(smbc_model, "CHECKPOINT_INTERVAL", 2)
+    def test_checkpoint_resume(self):
+        """An interrupted walk should resume after the last checkpoint, and a
+        completed one should remove its checkpoint."""
+        with TemporaryDirectory() as tmpdir, \
+                mock.patch.object(smbc_model, "CHECKPOINT_DIR", tmpdir):
+            def _interrupt():
+                with SourceManager(scan_context=_context("scan1")) as sm:
+                    it = self.source.handles(sm)
+                    for _ in range(5):
+                        next(it)
+                    it.close()
+                self.assertEqual(len(os.listdir(tmpdir)), 1)
+
+            _interrupt()
+            # The fourth file was the last one to be recorded
+            self.assertEqual(self.walk(), expected[4:])
+            self.assertEqual(os.listdir(tmpdir), [])
+            self.assertEqual(self.walk(), expected)
+
+            # Another scan of the same share shouldn't resume the interrupted
+            # one, or remove its checkpoint
+            _interrupt()
+            self.assertEqual(self.walk("scan2"), expected)
+            self.assertEqual(len(os.listdir(tmpdir)), 1)
+
+    @mock.patch.object(smbc_model, "CHECKPOINT_INTERVAL", 2)
+    def test_checkpoint_resume_total(self):
+        """The explorer's status message for a resumed walk should count the
+        objects produced before the interruption, too."""
+        scan_spec = messages.ScanSpecMessage(
+                scan_tag=messages.ScanTagFragment.make_dummy(),
+                source=self.source, rule=CPRRule(), configuration={},
+                filter_rule=None, progress=None)
+        context = _context(json.dumps(
+                scan_spec.scan_tag.to_json_object(), sort_keys=True))
+        with TemporaryDirectory() as tmpdir, \
+                mock.patch.object(smbc_model, "CHECKPOINT_DIR", tmpdir):
+            with SourceManager(scan_context=context) as sm:
+                it = self.source.handles(sm)
+                for _ in range(5):
+                    next(it)
+                it.close()
+
+            with SourceManager() as sm:
+                output = list(explorer.message_received_raw(
+                        scan_spec.to_json_object(), "os2ds_scan_specs", sm))
+        conversions = [b for q, b in output if q == "os2ds_conversions"]
+        (_, status), = [m for m in output if m[0] == "os2ds_status"]
+        self.assertEqual(len(conversions), len(expected[4:]))
+        self.assertEqual(status["total_objects"], len(expected))
+
+    @mock.patch.object(smbc_model, "CHECKPOINT_INTERVAL", 2)
+    def test_checkpoint_needs_scan(self):
+        """Walks that aren't part of a scan should never record checkpoints."""
+        with TemporaryDirectory() as tmpdir, \
+                mock.patch.object(smbc_model, "CHECKPOINT_DIR", tmpdir), \
+                SourceManager() as sm:
+            it = self.source.handles(sm)
+            for _ in range(5):
+                next(it)
+            it.close()
+            self.assertEqual(os.listdir(tmpdir), [])
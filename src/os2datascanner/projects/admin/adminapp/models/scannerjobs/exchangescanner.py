@@ -109,7 +109,7 @@ class ExchangeScanner(Scanner):
         for account in self.generate_sources():
             with SourceManager() as sm:
                 try:
-                    exchangelib_object = sm.open(account)
+                    exchangelib_object = sm.open(account).account
                     if exchangelib_object.msg_folder_root:
                         logger.info(
                             "OS2datascanner has access to mailbox {0}".format(
@@ -64,3 +64,4 @@ AMQP_PORT = _config['AMQP_PORT']
 AMQP_HEARTBEAT = _config['AMQP_HEARTBEAT']
 AMQP_VHOST = _config['AMQP_VHOST']
 AMQP_BACKOFF_PARAMS = _config.get('AMQP_BACKOFF_PARAMS', {})
+AMQP_WIRE_FORMAT = _config.get('AMQP_WIRE_FORMAT', "json")